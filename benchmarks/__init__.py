@@ -0,0 +1,4 @@
+"""
+Benchmarks for the deckr engine. Each module can be run on its own, i.e.
+python -m benchmarks.zone
+"""
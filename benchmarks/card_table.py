@@ -0,0 +1,59 @@
+"""
+Compare creating, shuffling, dealing and flipping a deck of PlayingCard
+objects against doing the same thing with a CardTable.
+"""
+
+from __future__ import print_function
+
+import random
+import timeit
+
+from deckr.contrib.playing_card import CardTable, create_deck
+
+HANDS = 4
+CARDS_PER_HAND = 13
+
+
+def play_with_objects(rng):
+    """
+    Create a deck of objects, shuffle it, deal it into hands and flip every
+    card face up.
+    """
+
+    deck = create_deck()
+    rng.shuffle(deck)
+    hands = [[] for _ in range(HANDS)]
+    for _ in range(CARDS_PER_HAND):
+        for hand in hands:
+            hand.append(deck.pop())
+    for hand in hands:
+        for card in hand:
+            card.set_game_attribute('face_up', True)
+
+
+def play_with_table(rng):
+    """
+    The same as play_with_objects, but with a CardTable.
+    """
+
+    table = CardTable.create_deck()
+    order = table.shuffled(rng)
+    table.deal(order, range(HANDS), CARDS_PER_HAND)
+    table.set_face_up()
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    number = 2000
+    for function in (play_with_objects, play_with_table):
+        rng = random.Random(0)
+        timer = timeit.Timer(lambda: function(rng))
+        result = min(timer.repeat(3, number)) / number * 1e6
+        print("%20s: %8.1f us per deck" % (function.__name__, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+from deckr.contrib.playing_card import create_deck
+from deckr.core.game import action, Game
+
+
+class CardGame(Game):
+
+    """
+    A game that shuffles a deck and deals it out over and over again.
+    """
+
+    game_zones = [{'name': 'deck'}]
+    player_zones = [{'name': 'hand'}]
+
+    def set_up(self):
+        cards = create_deck()
+        self.register(cards)
+        self.deck.extend(cards)
+
+    @action()
+    def deal_round(self, player):
+        for other in self.players:
+            other.hand.move_all_to(self.deck)
+        self.deck.shuffle()
+        self.deck.deal(5, [other.hand for other in self.players])
+        for card in player.hand:
+            card.set_game_attribute('face_up', True)
@@ -0,0 +1,111 @@
+"""
+Compare enumerating the legal actions of a game with a two card action,
+where the candidates for each card are pruned before they're combined,
+against checking every combination of cards.
+"""
+
+from __future__ import print_function
+
+import itertools
+import timeit
+
+from deckr.core.game import Game, action, get_actions, restriction
+from deckr.core.game_object import GameObject
+
+CARDS = 52
+HAND_SIZE = 5
+
+
+class Card(GameObject):
+
+    """
+    A card.
+    """
+
+    game_object_type = 'Card'
+
+
+@restriction('Must be in your hand')
+def in_hand(game, player, card, **kwargs):  # pylint: disable=unused-argument
+    """
+    Make sure a card is in the player's hand.
+    """
+
+    return card in player.hand
+
+
+@restriction('Must be a different card')
+def different(game, card, other, **kwargs):  # pylint: disable=unused-argument
+    """
+    Make sure two cards aren't the same card.
+    """
+
+    return card is not other
+
+
+class SwapGame(Game):
+
+    """
+    A game where a player can swap a card in their hand for any other card.
+    """
+
+    player_zones = [{'name': 'hand'}]
+
+    def set_up(self):
+        for _ in range(CARDS):
+            self.register(Card())
+
+    @action(params={'card': Card, 'other': Card},
+            restrictions=[in_hand, different])
+    def swap(self, player, card, other):
+        """
+        Swap a card.
+        """
+
+        pass
+
+
+def every_combination(game, player):
+    """
+    Enumerate the legal actions by checking every restriction against every
+    combination of candidates.
+    """
+
+    result = []
+    for name, entry in sorted(get_actions(type(game)).items()):
+        cards = [obj for _, obj in sorted(game.game_objects.items())
+                 if isinstance(obj, Card)]
+        for values in itertools.product(cards, repeat=len(entry.enumerated)):
+            arguments = dict(zip(entry.enumerated, values))
+            if entry.allows(game, player, arguments):
+                arguments['action'] = name
+                result.append(arguments)
+    return result
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    game = SwapGame()
+    player = game.add_player()
+    game.set_up()
+    cards = [obj for _, obj in sorted(game.game_objects.items())
+             if isinstance(obj, Card)]
+    for card in cards[:HAND_SIZE]:
+        player.hand.push(card)
+    assert every_combination(game, player) == game.legal_actions(player)
+
+    number = 100
+    for name, function in (
+            ('every combination', lambda: every_combination(game, player)),
+            ('pruned', lambda: (game.invalidate_legal_actions(),
+                                game.legal_actions(player)))):
+        timer = timeit.Timer(function)
+        result = min(timer.repeat(3, number)) / number * 1e6
+        print("%20s: %8.1f us per enumeration" % (name, result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Report how much memory each playing card takes up. Strings, numbers and
+classes are shared between cards so they aren't counted.
+"""
+
+from __future__ import print_function
+
+import gc
+import sys
+import types
+
+from deckr.contrib.playing_card import create_deck
+from deckr.core.game import Game
+
+SHARED_TYPES = (type, types.ModuleType, types.FunctionType, str, int, float,
+                bool, type(None))
+
+
+def deep_size(obj, seen, skip):
+    """
+    Get the size of obj and everything it references that hasn't been seen
+    yet (and isn't shared between objects).
+    """
+
+    if id(obj) in seen or id(obj) in skip or isinstance(obj, SHARED_TYPES):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    for referent in gc.get_referents(obj):
+        size += deep_size(referent, seen, skip)
+    return size
+
+
+def bytes_per_card(cards, skip=()):
+    """
+    Get the average size of a card.
+    """
+
+    seen = set()
+    skip = set(id(obj) for obj in skip)
+    return sum(deep_size(card, seen, skip) for card in cards) / len(cards)
+
+
+class CardGame(Game):
+
+    """
+    A game with nothing but a deck of cards.
+    """
+
+    def set_up(self):
+        pass
+
+
+def main():
+    """
+    Print the size of cards on their own and once registered with a game.
+    """
+
+    deck = create_deck()
+    print("Bytes per card (unregistered): %d" % bytes_per_card(deck))
+
+    game = CardGame()
+    game.register(deck)
+    for card in deck:
+        card.serialize()
+    print("Bytes per card (registered and serialized): %d" %
+          bytes_per_card(deck, skip=[game]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure how much persisting a game costs per action (with and without
+fsync), and how long it takes to start up with a lot of stored games (which
+only maps their snapshots) and to restore a game when it is first touched.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import tempfile
+import time
+
+from deckr.core.game_master import GameMaster
+from deckr.core.persistence import GameStore
+
+GAME = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                    'games/card_game')
+PLAYERS = 4
+ACTIONS = 2000
+GAMES = 1000
+
+
+def play(store):
+    """
+    Play a game, returning the time per action in microseconds.
+    """
+
+    game_master = GameMaster(store)
+    game = game_master.get_game(game_master.create(
+        game_master.register(GAME), seed=0))
+    players = [game.add_player() for _ in range(PLAYERS)]
+    game.start()
+    start = time.time()
+    for i in range(ACTIONS):
+        game.deal_round(player=players[i % PLAYERS])
+        game.flush_all_transitions()
+    if store is not None:
+        store.flush()
+    return (time.time() - start) / ACTIONS * 1e6
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    print("%32s: %8.1f us per action" % ("not persisted", play(None)))
+    for sync in (False, True):
+        for interval in (100, 1000):
+            directory = tempfile.mkdtemp()
+            try:
+                store = GameStore(directory, interval, sync)
+                result = play(store)
+                print("%32s: %8.1f us per action" %
+                      ("sync=%s, snapshot every %d" % (sync, interval),
+                       result))
+                store.close()
+
+                store = GameStore(directory, interval, sync)
+                game_master = GameMaster(store)
+                game_master.register(GAME)
+                game_master.recover()
+                start = time.time()
+                game_master.get_game(0)
+                print("%32s: %8.1f ms" % ("restore",
+                                          (time.time() - start) * 1e3))
+                store.close()
+            finally:
+                shutil.rmtree(directory)
+
+    directory = tempfile.mkdtemp()
+    try:
+        store = GameStore(directory, sync=False)
+        game_master = GameMaster(store)
+        game_type = game_master.register(GAME)
+        for _ in range(GAMES):
+            game = game_master.get_game(game_master.create(game_type))
+            game.add_player()
+            game.start()
+        store.close()
+
+        store = GameStore(directory)
+        game_master = GameMaster(store)
+        game_master.register(GAME)
+        start = time.time()
+        game_master.recover()
+        print("%32s: %8.1f ms" % ("start up with %d games" % GAMES,
+                                  (time.time() - start) * 1e3))
+        start = time.time()
+        for game_id in range(GAMES):
+            game_master.get_game(game_id)
+        print("%32s: %8.1f ms" % ("restore all %d games" % GAMES,
+                                  (time.time() - start) * 1e3))
+        store.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Measure how long it takes to register 500 game definitions: the way it used
+to be done (pure Python YAML loader, importing every game module through
+sys.path right away) against GameMaster.register (libyaml when available,
+cached configs and lazy imports).
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+from deckr.core.game_master import GameMaster
+
+DEFINITIONS = 500
+
+CONFIG = """---
+name: 'Generated Game %(index)d'
+game_file: '%(game_file)s'
+game_class: 'GeneratedGame'
+description: >
+  A generated game definition, with enough configuration to be a realistic
+  amount of YAML to parse.
+players:
+  min: 2
+  max: 4
+zones:
+  - {name: deck, stacked: true}
+  - {name: discard, stacked: true}
+  - {name: hand, per_player: true}
+"""
+
+MODULE = """
+from deckr.core.game import action, Game
+
+
+class GeneratedGame(Game):
+
+    game_zones = [{'name': 'deck'}, {'name': 'discard'}]
+    player_zones = [{'name': 'hand'}]
+
+    def set_up(self):
+        pass
+
+    @action()
+    def draw(self, player):
+        player.hand.push(self.deck.pop())
+"""
+
+
+def make_definitions(directory, prefix):
+    """
+    Write the game definitions.
+    """
+
+    paths = []
+    for index in range(DEFINITIONS):
+        path = os.path.join(directory, '%s_%d' % (prefix, index))
+        game_file = '%s_game_%d' % (prefix, index)
+        os.mkdir(path)
+        with open(os.path.join(path, 'config.yml'), 'w') as config_file:
+            config_file.write(CONFIG % {'index': index,
+                                        'game_file': game_file})
+        with open(os.path.join(path, game_file + '.py'), 'w') as module:
+            module.write(MODULE)
+        paths.append(path)
+    return paths
+
+
+def register_eagerly(paths):
+    """
+    Register the definitions the old way.
+    """
+
+    for path in paths:
+        with open(os.path.join(path, 'config.yml')) as config_file:
+            config = yaml.load(config_file, Loader=yaml.Loader)
+        sys.path.append(path)
+        module = __import__(config['game_file'])
+        sys.path.remove(path)
+        getattr(module, config['game_class'])
+
+
+def register(paths):
+    """
+    Register the definitions with a game master.
+    """
+
+    game_master = GameMaster()
+    for path in paths:
+        game_master.register(path)
+    return game_master
+
+
+def timed(function, *args):
+    """
+    Run function, returning how long it took in milliseconds.
+    """
+
+    start = time.time()
+    function(*args)
+    return (time.time() - start) * 1e3
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    directory = tempfile.mkdtemp()
+    try:
+        eager = make_definitions(directory, 'eager')
+        lazy = make_definitions(directory, 'lazy')
+        print("%32s: %8.1f ms" % ("eager (old)",
+                                  timed(register_eagerly, eager)))
+        print("%32s: %8.1f ms" % ("lazy, first time",
+                                  timed(register, lazy)))
+        print("%32s: %8.1f ms" % ("lazy, cached configs",
+                                  timed(register, lazy)))
+        game_master = register(lazy)
+        print("%32s: %8.1f ms" % (
+            "first create of every game",
+            timed(lambda: [game_master.create(game_type)
+                           for game_type in game_master.game_types])))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Compare the compiled serializers against building a dictionary of game
+attributes and cleaning it with clean_game_objects (which is what
+GameObject.serialize_public used to do). The serialization cache is bypassed
+so this measures the cost of rebuilding an object's serialization.
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from deckr.contrib.playing_card import CardTable, create_deck
+from deckr.core.game import Game
+from deckr.core.game_object import clean_game_objects, get_serializer
+
+
+class CardGame(Game):
+
+    """
+    A game with a single zone and a deck of cards.
+    """
+
+    game_zones = [{'name': 'deck'}]
+
+    def set_up(self):
+        pass
+
+
+def clean_serialize(obj):
+    """
+    Serialize an object by cleaning its game attributes.
+    """
+
+    result = dict(obj.game_attributes)
+    result['game_id'] = obj.game_id
+    result['type'] = obj.game_object_type
+    return clean_game_objects(result)
+
+
+def compiled_serialize(obj):
+    """
+    Serialize an object with its compiled serializer.
+    """
+
+    return get_serializer(type(obj))(obj)
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    game = CardGame()
+    game.add_player()
+    cards = create_deck()
+    table_cards = CardTable.create_deck().cards()
+    game.register(cards + table_cards)
+    cards[0].set_game_attribute('extra', [game.deck])
+    objects = list(game.game_objects.values())
+
+    for obj in objects:
+        assert clean_serialize(obj) == compiled_serialize(obj)
+
+    number = 500
+    for function in (clean_serialize, compiled_serialize):
+        timer = timeit.Timer(lambda: [function(obj) for obj in objects])
+        result = min(timer.repeat(3, number)) / number / len(objects) * 1e6
+        print("%20s: %6.2f us per object" % (function.__name__, result))
+
+
+if __name__ == '__main__':
+    main()
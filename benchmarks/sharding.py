@@ -0,0 +1,187 @@
+"""
+Compare how many actions per second a single process server gets through
+against a sharded server with a varying number of worker processes. Every
+game has its own client, and each client sends all of its actions at once.
+Scaling depends on the number of cores available.
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import time
+
+from twisted.internet import reactor, task
+from twisted.test import proto_helpers
+
+from deckr.networking.deckr_server import DeckrFactory
+from deckr.networking.sharding import ShardedDeckrFactory
+
+CONFIG = {'games': [os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                 'games/card_game')]}
+GAMES = 32
+ACTIONS = 50
+WORKERS = [1, 2, 4]
+
+
+class Client(object):
+
+    """
+    A client connected to a server through a string transport.
+    """
+
+    def __init__(self, factory):
+        self.protocol = factory.buildProtocol(('127.0.0.1', 0))
+        self.transport = proto_helpers.StringTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def send(self, message_type, **kwargs):
+        """
+        Send a command.
+        """
+
+        kwargs['message_type'] = message_type
+        self.protocol.lineReceived(json.dumps(kwargs))
+
+    def count(self, message_type):
+        """
+        Count how many messages of a type have been received.
+        """
+
+        return self.transport.value().count(
+            '"message_type": "%s"' % message_type)
+
+    def take(self, message_type):
+        """
+        Take the first message of a type out of everything received so far.
+        """
+
+        lines = self.transport.value().split('\r\n')
+        self.transport.clear()
+        for line in lines:
+            if line and '"message_type": "%s"' % message_type in line:
+                return json.loads(line)
+
+
+def wait_for(condition):
+    """
+    Get a deferred that fires once condition() is True.
+    """
+
+    def check():
+        if condition():
+            loop.stop()
+    loop = task.LoopingCall(check)
+    return loop.start(0.01)
+
+
+def set_up(clients, wait):
+    """
+    Create, join and start a game per client. wait is called with a
+    condition to wait for. Returns a generator (for inlineCallbacks).
+    """
+
+    for client in clients:
+        client.send('create', game_type_id=0)
+    yield wait(lambda: all(client.count('create_response')
+                           for client in clients))
+    for client in clients:
+        game_id = client.take('create_response')['game_id']
+        client.send('join', game_id=game_id, player_id=None,
+                    batch_updates=True)
+    yield wait(lambda: all(client.count('join_response')
+                           for client in clients))
+    for client in clients:
+        client.transport.clear()
+        client.send('start')
+    yield wait(lambda: all(client.count('updates') for client in clients))
+    for client in clients:
+        client.transport.clear()
+
+
+def play(clients, wait):
+    """
+    Send every client's actions. Returns a generator (for inlineCallbacks)
+    that finishes once every client has received all of its updates.
+    """
+
+    for _ in range(ACTIONS):
+        for client in clients:
+            client.send('action', action='deal_round')
+    yield wait(lambda: all(client.count('updates') == ACTIONS
+                           for client in clients))
+
+
+def run_single():
+    """
+    Run the benchmark against a single process server. Returns the elapsed
+    time.
+    """
+
+    factory = DeckrFactory(CONFIG)
+    clients = [Client(factory) for _ in range(GAMES)]
+    list(set_up(clients, lambda condition: None))
+    start = time.time()
+    list(play(clients, lambda condition: None))
+    return time.time() - start
+
+
+def run_sharded(workers):
+    """
+    Run the benchmark against a sharded server with the given number of
+    workers. Returns the elapsed time.
+    """
+
+    from twisted.internet import defer
+
+    factory = ShardedDeckrFactory(CONFIG)
+    factory.spawn_workers(workers)
+    clients = [Client(factory) for _ in range(GAMES)]
+    result = {}
+
+    @defer.inlineCallbacks
+    def run():
+        yield defer.inlineCallbacks(set_up)(clients, wait_for)
+        start = time.time()
+        yield defer.inlineCallbacks(play)(clients, wait_for)
+        result['elapsed'] = time.time() - start
+        for link in factory.links:
+            link.transport.closeStdin()
+        reactor.callLater(0.1, reactor.stop)
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+    return result['elapsed']
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    print("%d games, %d actions each, %d cores" % (GAMES, ACTIONS,
+                                                    _cores()))
+    elapsed = run_single()
+    print("%-12s %10.0f actions/s" % ("single", GAMES * ACTIONS / elapsed))
+    # The reactor can only be run once, so each sharded run gets a process.
+    for workers in WORKERS:
+        pid = os.fork()
+        if pid == 0:
+            elapsed = run_sharded(workers)
+            print("%-12s %10.0f actions/s" % ("%d workers" % workers,
+                                              GAMES * ACTIONS / elapsed))
+            os._exit(0)  # pylint: disable=protected-access
+        os.waitpid(pid, 0)
+
+
+def _cores():
+    """
+    Get the number of cores.
+    """
+
+    import multiprocessing
+    return multiprocessing.cpu_count()
+
+
+if __name__ == '__main__':
+    main()
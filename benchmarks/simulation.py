@@ -0,0 +1,46 @@
+"""
+Measure headless play of the benchmark card game with random players, with
+and without recording transitions, and spread over a process per core.
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import os
+
+from deckr.core.game_definition import GameDefinition
+from deckr.core.simulation import RandomPolicy, Simulation
+
+CARD_GAME = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                         'games/card_game')
+GAMES = 200
+PLAYERS = 4
+ACTIONS = 20
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    game_definition = GameDefinition()
+    game_definition.load(CARD_GAME)
+    for record in (True, False):
+        simulation = Simulation(game_definition,
+                                [RandomPolicy() for _ in range(PLAYERS)],
+                                max_actions=ACTIONS,
+                                record_transitions=record)
+        result = simulation.run(GAMES, seed=0)
+        print("%20s: %8.0f games/s %10.0f actions/s" % (
+            "recording" if record else "not recording",
+            result['games_per_second'], result['actions_per_second']))
+
+    processes = multiprocessing.cpu_count()
+    result = simulation.run_parallel(GAMES * processes, seed=0)
+    print("%20s: %8.0f games/s %10.0f actions/s" % (
+        "%d processes" % processes, result['games_per_second'],
+        result['actions_per_second']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Compare the size of messages and the time it takes to encode and decode them
+in each encoding. Uses the msgpack package for MessagePack if it's installed
+(and the pure python fallback otherwise). Also shows how much zlib
+compression saves, both for the first message on a connection and once the
+connection's compression stream has seen a message like it, and how much a
+symbol table saves.
+"""
+
+from __future__ import print_function
+
+import timeit
+
+from deckr.contrib.playing_card import create_deck
+from deckr.core.game import Game
+from deckr.networking import wire
+from deckr.networking.symbols import SymbolTable
+from deckr.networking.wire import (JsonEncoding, MsgpackEncoding,
+                                   ZlibCompression)
+
+
+class CardGame(Game):
+
+    """
+    A game with a deck and a hand per player.
+    """
+
+    game_zones = [{'name': 'deck'}]
+    player_zones = [{'name': 'hand'}]
+
+    def set_up(self):
+        pass
+
+
+def sample_messages():
+    """
+    Build a few typical messages.
+    """
+
+    game = CardGame()
+    player = game.add_player()
+    cards = create_deck()
+    game.register(cards)
+    game.deck.extend(cards)
+    update = {'message_type': 'update', 'update_type': 'set',
+              'game_object': cards[0].game_id, 'field': 'face_up',
+              'value': True}
+    updates = {'message_type': 'updates', 'sequence': 1000,
+               'updates': [{'update_type': 'add', 'zone': player.hand.game_id,
+                            'game_object': card.game_id} for card in cards]}
+    state = {'message_type': 'game_state_response', 'sequence': 1000,
+             'game_state': game.get_state(player)}
+    return [('update', update), ('updates (52)', updates),
+            ('game_state', state)]
+
+
+def compact_message(table, message):
+    """
+    Compact a message the way the server does for clients with a symbol
+    table.
+    """
+
+    if message['message_type'] == 'update':
+        update = dict(message)
+        del update['message_type']
+        result = table.compact(update)
+        result['message_type'] = 'update'
+        return result
+    return {key: table.compact(value) if isinstance(value, list) else value
+            for key, value in message.items()}
+
+
+def main():
+    """
+    Run the benchmark.
+    """
+
+    print("MessagePack implementation: %s" %
+          ('msgpack' if wire.msgpack is not None else 'pure python'))
+    print("%-14s %-8s %8s %12s %12s" % ("message", "encoding", "bytes",
+                                         "encode (us)", "decode (us)"))
+    for name, message in sample_messages():
+        for encoding in (JsonEncoding, MsgpackEncoding):
+            encoded = encoding.encode(message)
+            number = 200
+            encode = min(timeit.Timer(
+                lambda: encoding.encode(message)).repeat(3, number))
+            decode = min(timeit.Timer(
+                lambda: encoding.decode(encoded)).repeat(3, number))
+            print("%-14s %-8s %8d %12.1f %12.1f" % (
+                name, encoding.name, len(encoded), encode / number * 1e6,
+                decode / number * 1e6))
+
+    print()
+    print("%-14s %-8s %8s %8s %8s %14s" % ("message", "encoding", "bytes",
+                                           "zlib", "repeat", "compress (us)"))
+    for name, message in sample_messages():
+        for encoding in (JsonEncoding, MsgpackEncoding):
+            encoded = encoding.encode(message)
+            compression = ZlibCompression(threshold=0)
+            first = len(compression.compress(encoded)[1])
+            repeat = len(compression.compress(encoded)[1])
+            number = 200
+            compress = min(timeit.Timer(
+                lambda: compression.compress(encoded)).repeat(3, number))
+            print("%-14s %-8s %8d %8d %8d %14.1f" % (
+                name, encoding.name, len(encoded), first, repeat,
+                compress / number * 1e6))
+
+    print()
+    print("%-14s %-8s %8s %8s %12s" % ("message", "encoding", "bytes",
+                                       "symbols", "compact (us)"))
+    for name, message in sample_messages():
+        table = SymbolTable()
+        compact = compact_message(table, message)
+        number = 200
+        elapsed = min(timeit.Timer(
+            lambda: compact_message(table, message)).repeat(3, number))
+        for encoding in (JsonEncoding, MsgpackEncoding):
+            print("%-14s %-8s %8d %8d %12.1f" % (
+                name, encoding.name, len(encoding.encode(message)),
+                len(encoding.encode(compact)), elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare the indexed Zone against a plain list (which is what Zone used to be
+backed by) for containment checks and removal at different zone sizes.
+"""
+
+from __future__ import print_function
+
+import random
+import timeit
+
+from deckr.contrib.playing_card import PlayingCard, SUITS
+from deckr.core.zone import Zone
+
+SIZES = [5, 10, 25, 50, 100, 250, 1000, 5000]
+
+
+class ListZone(object):
+
+    """
+    The old list backed zone (without transitions).
+    """
+
+    def __init__(self):
+        self._zone = []
+
+    def push(self, obj):
+        """
+        Push onto the list.
+        """
+
+        self._zone.append(obj)
+
+    def remove(self, obj):
+        """
+        Remove with a linear scan.
+        """
+
+        try:
+            self._zone.remove(obj)
+        except ValueError:
+            return
+
+    def __contains__(self, obj):
+        return obj in self._zone
+
+
+def make_cards(size):
+    """
+    Create size playing cards.
+    """
+
+    return [PlayingCard(i % 13 + 1, SUITS[i % 4]) for i in range(size)]
+
+
+def run_operations(zone_class, cards, order):
+    """
+    Fill a zone, check that every card is in it and then remove them all in a
+    random order.
+    """
+
+    zone = zone_class()
+    for card in cards:
+        zone.push(card)
+    for card in order:
+        assert card in zone
+    for card in order:
+        zone.remove(card)
+
+
+def main():
+    """
+    Run the benchmark and print a table of results.
+    """
+
+    rng = random.Random(0)
+    print("%8s %12s %12s %8s" % ("size", "list (us)", "zone (us)", "ratio"))
+    crossover = None
+    for size in SIZES:
+        cards = make_cards(size)
+        order = list(cards)
+        rng.shuffle(order)
+        number = max(1, 20000 // size)
+        results = []
+        for zone_class in (ListZone, Zone):
+            timer = timeit.Timer(
+                lambda: run_operations(zone_class, cards, order))
+            results.append(min(timer.repeat(3, number)) / number * 1e6)
+        ratio = results[0] / results[1]
+        if crossover is None and ratio > 1:
+            crossover = size
+        print("%8d %12.1f %12.1f %8.2f" % (size, results[0], results[1],
+                                           ratio))
+    print("Zone is faster from %s objects" % crossover)
+
+
+if __name__ == '__main__':
+    main()
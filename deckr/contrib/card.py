@@ -12,7 +12,10 @@ class Card(GameObject):
     This represents a generic card in any card game.
     """
 
+    __slots__ = ()
+
     game_object_type = 'Card'
+    game_attribute_schema = ('face_up',)
 
     def __init__(self, *args, **kwargs):
         super(Card, self).__init__(*args, **kwargs)
@@ -2,11 +2,25 @@
 A simple class + utility functions for playing cards.
 """
 
+from array import array
+
 from deckr.contrib.card import Card
+from deckr.core.game_object import GameObject
 
 SUITS = ['clubs', 'spades', 'hearts', 'diamonds']
 
 
+def get_card_id(number, suit_index):
+    """
+    Calculate the card id for a number and the index of a suit in SUITS.
+    Aces come first, followed by kings, queens, etc.
+    """
+
+    if number == 1:
+        return suit_index + 1
+    return (14 - number) * 4 + suit_index + 1
+
+
 def create_deck():
     """
     Creates a deck of playing cards. Does not include jokers.
@@ -21,19 +35,312 @@ class PlayingCard(Card):
     Represents a playing card with a suit and a number.
     """
 
+    __slots__ = ()
+
+    game_attribute_schema = ('face_up', 'card_id', 'number', 'suit')
+
     def __init__(self, number, suit):
         super(PlayingCard, self).__init__()
-        self.number = number
-        self.suit = suit
 
-        # Calculate the card ID
-        if self.number == 1:
-            card_id = SUITS.index(suit) + 1
-        else:
-            card_id = (14 - number) * 4 + SUITS.index(suit) + 1
-        self.set_game_attribute('card_id', card_id)
+        self.set_game_attribute('card_id',
+                                get_card_id(number, SUITS.index(suit)))
         self.set_game_attribute('number', number)
         self.set_game_attribute('suit', suit)
 
+    @property
+    def number(self):
+        """
+        The number of this card (1 is an ace, 13 is a king).
+        """
+
+        return self.get_game_attribute('number')
+
+    @property
+    def suit(self):
+        """
+        The suit of this card.
+        """
+
+        return self.get_game_attribute('suit')
+
     def __eq__(self, other):
         return self.number == other.number and self.suit == other.suit
+
+
+class CardTable(object):
+
+    """
+    Stores a set of playing cards as columns (one array per attribute) with
+    one row per card. This makes it cheap to create, shuffle and deal large
+    numbers of cards: no objects are created, and operations loop over rows
+    (plain integers) instead of objects. These are still Python loops, one
+    iteration per row: the array module has no vectorized operations, so the
+    saving comes from not creating objects. PlayingCard objects are only
+    created on demand, as views over a row (see TablePlayingCard).
+
+    Each row also has a zone, which is an integer chosen by the caller (-1
+    means the card isn't in any zone). A zone code can be bound to a Zone
+    (see bind_zone), in which case the column follows the Zone's membership.
+    """
+
+    columns = ('face_up', 'card_id', 'number', 'suit')
+
+    def __init__(self, cards):
+        """
+        Create a table from a list of (number, suit) tuples.
+        """
+
+        suit_indices = {suit: i for i, suit in enumerate(SUITS)}
+        self.number = array('b', [number for number, _ in cards])
+        self.suit = array('b', [suit_indices[suit] for _, suit in cards])
+        self.card_id = array('b', [get_card_id(number, suit) for number, suit
+                                   in zip(self.number, self.suit)])
+        self.face_up = array('b', [0]) * len(cards)
+        self.zone = array('i', [-1]) * len(cards)
+        self._views = [None] * len(cards)
+        # Zone codes to the Zones they are bound to, and back.
+        self._bound = {}
+        self._codes = {}
+
+    @classmethod
+    def create_deck(cls, decks=1):
+        """
+        Create a table with the given number of standard 52 card decks, in
+        the same order as create_deck.
+        """
+
+        return cls([(num, suit) for _ in range(decks) for num in range(1, 14)
+                    for suit in SUITS])
+
+    def __len__(self):
+        return len(self.number)
+
+    def get_value(self, row, name):
+        """
+        Get the value of the attribute name for a row.
+        """
+
+        if name == 'suit':
+            return SUITS[self.suit[row]]
+        elif name == 'face_up':
+            return bool(self.face_up[row])
+        return getattr(self, name)[row]
+
+    def set_value(self, row, name, value):
+        """
+        Set the value of the attribute name for a row. If the row's card has
+        been created this goes through its set_game_attribute, so the card's
+        version is bumped and a transition is produced.
+        """
+
+        view = self._views[row]
+        if view is not None:
+            view.set_game_attribute(name, value)
+        else:
+            self.store_value(row, name, value)
+
+    def store_value(self, row, name, value):
+        """
+        Write the value of the attribute name into a row without telling the
+        row's card (see set_value).
+        """
+
+        if name == 'suit':
+            value = SUITS.index(value)
+        getattr(self, name)[row] = value
+
+    def card(self, row):
+        """
+        Get the PlayingCard for a row. The same object is returned every time.
+        """
+
+        view = self._views[row]
+        if view is None:
+            view = TablePlayingCard(self, row)
+            self._views[row] = view
+        return view
+
+    def cards(self, rows=None):
+        """
+        Get the PlayingCards for a list of rows (or all rows if rows is None).
+        """
+
+        if rows is None:
+            rows = range(len(self))
+        return [self.card(row) for row in rows]
+
+    def rows_in(self, zone):
+        """
+        Get all of the rows in the given zone.
+        """
+
+        zones = self.zone
+        return array('i', [row for row, code in enumerate(zones)
+                           if code == zone])
+
+    def bind_zone(self, code, zone):
+        """
+        Bind a zone code to a Zone. From then on the zone column follows the
+        Zone: cards from this table that are added to or removed from it
+        update their row, and moving rows to code moves their cards into it.
+        Rows that had the code but whose cards aren't in the Zone are taken
+        out of it.
+        """
+
+        if zone.membership_listener not in (None, self):
+            raise ValueError("Zone is already bound to another table")
+        self._bound[code] = zone
+        self._codes[zone] = code
+        zone.membership_listener = self
+        column = self.zone
+        views = self._views
+        for row in range(len(self)):
+            if column[row] == code and (views[row] is None or
+                                        views[row] not in zone):
+                column[row] = -1
+        self.objects_added(zone, list(zone))
+
+    def objects_added(self, zone, objs):
+        """
+        Called by a bound Zone when objects are added to it.
+        """
+
+        code = self._codes[zone]
+        column = self.zone
+        for obj in objs:
+            if getattr(obj, 'table', None) is self:
+                column[obj.row] = code
+
+    def objects_removed(self, zone, objs):
+        """
+        Called by a bound Zone when objects are removed from it.
+        """
+
+        code = self._codes[zone]
+        column = self.zone
+        for obj in objs:
+            if (getattr(obj, 'table', None) is self and
+                    column[obj.row] == code and obj not in zone):
+                column[obj.row] = -1
+
+    def move(self, rows, zone):
+        """
+        Move a list of rows to a zone. Cards that are in a bound Zone are
+        taken out of it, and if zone is bound the cards are added to its Zone
+        (producing a single move_many transition).
+        """
+
+        column = self.zone
+        bound = self._bound
+        target = bound.get(zone)
+        if not bound:
+            for row in rows:
+                column[row] = zone
+            return
+
+        leaving = {}
+        for row in rows:
+            source = bound.get(column[row])
+            if source is not None and source is not target:
+                leaving.setdefault(column[row], []).append(self.card(row))
+        if target is None:
+            for code, cards in leaving.items():
+                for card in cards:
+                    bound[code].remove(card)
+            for row in rows:
+                column[row] = zone
+        else:
+            for code, cards in leaving.items():
+                bound[code].discard_many(cards)
+            target.extend([self.card(row) for row in rows
+                           if self.card(row) not in target])
+
+    def shuffled(self, rng, rows=None):
+        """
+        Get a random ordering of rows (or all rows if rows is None) using the
+        given random.Random instance.
+        """
+
+        if rows is None:
+            order = array('i', range(len(self)))
+        else:
+            order = array('i', rows)
+        rng.shuffle(order)
+        return order
+
+    def deal(self, order, zones, count):
+        """
+        Deal count cards to each of the zones round robin, starting from the
+        top (end) of order. Returns a list with the rows dealt to each zone and
+        the rows left in order.
+        """
+
+        dealt = len(zones) * count
+        if dealt > len(order):
+            raise ValueError("Not enough cards to deal")
+        remaining = order[:len(order) - dealt]
+        top = order[len(order) - dealt:]
+        top.reverse()
+        hands = [top[i::len(zones)] for i in range(len(zones))]
+        for zone, hand in zip(zones, hands):
+            self.move(hand, zone)
+        return hands, remaining
+
+    def set_face_up(self, rows=None, face_up=True):
+        """
+        Turn a list of rows (or every row if rows is None) face up or face
+        down. Cards that have been registered with a game produce a single
+        set_many transition per game.
+        """
+
+        value = 1 if face_up else 0
+        if rows is None:
+            rows = range(len(self))
+            self.face_up = array('b', [value]) * len(self)
+        else:
+            column = self.face_up
+            for row in rows:
+                column[row] = value
+
+        changed = {}
+        views = self._views
+        for row in rows:
+            view = views[row]
+            if view is not None:
+                view.version += 1
+                if view.game is not None:
+                    changed.setdefault(view.game, []).append(view.game_id)
+        for game, game_ids in changed.items():
+            game.add_transition({'update_type': 'set_many',
+                                 'game_objects': game_ids,
+                                 'field': 'face_up',
+                                 'value': bool(face_up)})
+
+
+class TablePlayingCard(PlayingCard):
+
+    """
+    A playing card whose number, suit, card_id and face_up live in a row of a
+    CardTable. Use CardTable.card rather than creating these directly.
+    """
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):  # pylint: disable=super-init-not-called
+        # The attributes already live in the table, so skip the PlayingCard
+        # and Card constructors (which would set them).
+        GameObject.__init__(self)  # pylint: disable=non-parent-init-called
+        self._attributes = None
+        self.table = table
+        self.row = row
+
+    def _load_attribute(self, name):
+        if name in CardTable.columns:
+            return self.table.get_value(self.row, name)
+        return super(TablePlayingCard, self)._load_attribute(name)
+
+    def _store_attribute(self, name, value):
+        if name in CardTable.columns:
+            self.table.store_value(self.row, name, value)
+        else:
+            super(TablePlayingCard, self)._store_attribute(name, value)
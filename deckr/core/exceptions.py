@@ -12,6 +12,15 @@ class FailedRestrictionException(Exception):
     pass
 
 
+class GameLoadError(Exception):
+
+    """
+    Raised when the module or class of a game definition can't be loaded.
+    """
+
+    pass
+
+
 class TooManyPlayers(Exception):
 
     """
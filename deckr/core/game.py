@@ -3,31 +3,68 @@ This file provides the base Game class. Any game will have to extend this
 class.
 """
 
+import inspect
+import itertools
+import random
+from collections import deque
+
 from deckr.core.exceptions import FailedRestrictionException, TooManyPlayers
-from deckr.core.game_object import GameObject
+from deckr.core.game_object import GameObject, clean_game_objects
 from deckr.core.player import Player
 from deckr.core.zone import HasZones
 
 
-def action(params=None, restrictions=None):
+def action(params=None, restrictions=None, choices=None):
     """
     A simple decorator to define an action. This takes in an optional list
     of restrictions. These will be run before the function. If these fail
     they should raise an appropriate FailedRestrictionException.
+
+    choices maps arguments that aren't game objects to a function that takes
+    the game and a player and returns every value the argument could have.
+    They are only used to enumerate the legal actions (see
+    Game.legal_actions).
+
+    If the game has a journal, every action (other than actions run from
+    inside of another action) is recorded in it before it runs. Every action
+    that runs (even if it fails) bumps the game's actions_run, which is part
+    of the key legal_actions are memoized on.
     """
 
     if restrictions is None:
         restrictions = []
     if params is None:
         params = {}
+    if choices is None:
+        choices = {}
     # pylint: disable=missing-docstring
 
     def wrapper(func):
         def inner(*args, **kwargs):
             for res in restrictions:
                 res(*args, **kwargs)
-            return func(*args, **kwargs)
+            game = args[0] if args else None
+            try:
+                if getattr(game, 'journal', None) is None or game.in_action:
+                    return func(*args, **kwargs)
+                game.journal.record(['action', func.__name__,
+                                     clean_game_objects(list(args[1:])),
+                                     clean_game_objects(kwargs)])
+                game.in_action = True
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    game.in_action = False
+                    game.journal.checkpoint(game)
+            finally:
+                if isinstance(game, Game):
+                    game.actions_run += 1
         inner.action = True
+        inner.func = func
+        inner.restrictions = restrictions
+        inner.choices = choices
+        inner.__name__ = func.__name__
+        inner.__doc__ = func.__doc__
         # py3k (using annotaions)
         # inner.__annotations__ = func.__annotations__
         # python 2.7 (faking annotations)
@@ -41,6 +78,12 @@ def restriction(desciption):
     A simple decorator that can be applied to restrictions. Restrictions
     must return a Boolean. If this is false, the decorator will raise an
     exception describing what went wrong.
+
+    Restrictions are passed the game and every argument of the action, but
+    when the legal actions are enumerated a restriction that names (at most)
+    one of the enumerated arguments is checked against each candidate for
+    that argument on its own. So a restriction should name every argument
+    it looks at.
     """
 
     # pylint: disable=missing-docstring
@@ -48,10 +91,185 @@ def restriction(desciption):
         def inner(*args, **kwargs):
             if not func(*args, **kwargs):
                 raise FailedRestrictionException(desciption)
+        inner.arguments = frozenset(inspect.getargspec(func).args[1:])
         return inner
     return wrapper
 
 
+def merge_transitions(public, private):
+    """
+    Merge a list of public transitions with a list of private ones. Each
+    private transition is a (position, transition) tuple where position is
+    the number of public transitions that came before it.
+    """
+
+    if not private:
+        return list(public)
+    result = []
+    last = 0
+    for position, transition in private:
+        result.extend(public[last:position])
+        result.append(transition)
+        last = position
+    result.extend(public[last:])
+    return result
+
+
+# The action table of each game class.
+ACTION_TABLES = {}
+
+
+class Action(object):
+
+    """
+    An entry in a game class's action table (see get_actions). convert takes
+    a game and a dictionary of arguments from a client, and returns the
+    keyword arguments for the action (with game ids replaced by the game
+    objects they refer to). It raises a ValueError if the arguments don't
+    fit the action.
+
+    enumerated lists the arguments that are filled in when enumerating the
+    legal actions: the required arguments (other than the player) and any
+    optional ones that have choices. pruning maps each of them (and None)
+    to the restrictions that only look at that argument (or none of them),
+    so candidates can be ruled out before they're combined. The rest of the
+    restrictions are in combined.
+    """
+
+    __slots__ = ('name', 'function', 'params', 'takes_player', 'convert',
+                 'restrictions', 'choices', 'enumerated', 'pruning',
+                 'combined')
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+        self.params = function.__annotations__
+        self.restrictions = getattr(function, 'restrictions', [])
+        self.choices = getattr(function, 'choices', {})
+        argspec = inspect.getargspec(function.func)
+        names = argspec.args[1:]
+        required = names[:len(names) - len(argspec.defaults or ())]
+        self.takes_player = 'player' in names or argspec.keywords is not None
+        self.enumerated = [arg for arg in names if arg != 'player' and
+                           (arg in required or arg in self.choices)]
+        self.pruning = {}
+        self.combined = []
+        for res in self.restrictions:
+            used = getattr(res, 'arguments', None)
+            if used is not None and self.takes_player:
+                used = used - set(['player'])
+            if (used is not None and len(used) <= 1 and
+                    used.issubset(self.enumerated)):
+                self.pruning.setdefault(next(iter(used), None), []).append(res)
+            else:
+                self.combined.append(res)
+        self.convert = compile_converter(
+            name, self.params.items(),
+            [arg for arg in required
+             if arg != 'player' and arg not in self.params],
+            None if argspec.keywords is not None else frozenset(names))
+
+    def allows(self, game, player, arguments, restrictions=None):
+        """
+        Run the action's restrictions (or the given ones) against some
+        (converted) arguments without running the action. Returns False as
+        soon as one of them fails.
+        """
+
+        if restrictions is None:
+            restrictions = self.restrictions
+        if self.takes_player:
+            arguments = dict(arguments, player=player)
+        try:
+            for res in restrictions:
+                res(game, **arguments)  # pylint: disable=star-args
+        except FailedRestrictionException:
+            return False
+        return True
+
+
+def _convert_object(objects, value, klass):
+    """
+    Look up the game object (or list of game objects) for an argument.
+    """
+
+    if isinstance(value, list):
+        return [_convert_object(objects, x, klass) for x in value]
+    try:
+        result = objects[value]
+    except (KeyError, TypeError):
+        result = None
+    if not isinstance(result, klass):
+        raise ValueError("Expected a {0} but got {1}".format(
+            klass.__name__, value))
+    return result
+
+
+def compile_converter(name, params, required, allowed):
+    """
+    Compile the argument converter for an action. params is a list of
+    (argument, class) pairs for arguments that are game objects, required
+    lists the other arguments that must be present and allowed is the set of
+    every argument the action takes (or None if it takes any).
+    """
+
+    lines = ['def convert(game, arguments):']
+    if allowed is not None:
+        lines.extend([
+            '    if not ALLOWED.issuperset(arguments):',
+            '        raise ValueError("Invalid arguments for %s: " + '
+            '", ".join(sorted(set(arguments) - ALLOWED)))' % name])
+    for arg in required:
+        lines.extend([
+            '    if %r not in arguments:' % arg,
+            '        raise ValueError(%r)' % (
+                "Missing argument for %s: %s" % (name, arg))])
+    if params:
+        lines.append('    objects = game.game_objects')
+    namespace = {'ALLOWED': allowed, 'ValueError': ValueError,
+                 'convert_object': _convert_object}
+    for position, (arg, klass) in enumerate(params):
+        namespace['K%d' % position] = klass
+        lines.extend([
+            '    try:',
+            '        value = arguments[%r]' % arg,
+            '    except KeyError:',
+            '        raise ValueError(%r)' % (
+                "Missing argument for %s: %s" % (name, arg)),
+            '    if value.__class__ is not list:',
+            '        result = objects.get(value) '
+            'if value.__class__ in HASHABLE else None',
+            '        if isinstance(result, K%d):' % position,
+            '            arguments[%r] = result' % arg,
+            '        else:',
+            '            arguments[%r] = convert_object(objects, value, '
+            'K%d)' % (arg, position),
+            '    else:',
+            '        arguments[%r] = convert_object(objects, value, K%d)' % (
+                arg, position)])
+    namespace['HASHABLE'] = frozenset([int, long, str, unicode])
+    lines.append('    return arguments')
+    exec('\n'.join(lines), namespace)  # pylint: disable=exec-used
+    return namespace['convert']
+
+
+def get_actions(klass):
+    """
+    Get the action table of a game class: a dictionary of every action's
+    name to its Action. This is built once per class.
+    """
+
+    actions = ACTION_TABLES.get(klass)
+    if actions is None:
+        actions = {}
+        for name in dir(klass):
+            function = getattr(klass, name, None)
+            if getattr(function, 'action', False):
+                actions[name] = Action(name, function.__func__)
+        ACTION_TABLES[klass] = actions
+    return actions
+
+
 def operate_on_list_or_single(singleton_function, obj, **kwargs):
     """
     This will allow functions to operate on either lists or singletons. It
@@ -72,18 +290,53 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
     and processing updates.
     """
 
+    # The journal and transition log need their own per-game state.
+    # pylint: disable=too-many-instance-attributes
+
     game_object_type = 'Game'
     max_players = None
     game_zones = []
     player_zones = []
+    # How many transitions to keep around for clients that are resuming.
+    transition_log_size = 1024
+    # Headless games that nobody is watching can turn this off. The sequence
+    # number still goes up, but transitions are dropped.
+    record_transitions = True
+    # The number of actions that have run (see legal_actions).
+    actions_run = 0
 
     def __init__(self, *args, **kwargs):
         super(Game, self).__init__(*args, **kwargs)
 
         self.game_objects = {}
-        self.transitions = {}
+        # Bumped whenever an object is registered or deregistered (and so
+        # game ids may have been given out or taken away).
+        self.registry_version = 0
+        # Public transitions are only stored once, no matter how many players
+        # there are. Private transitions are stored per player along with
+        # their position relative to the public transitions.
+        self.public_transitions = []
+        self.private_transitions = {}
         self.players = []
         self.next_game_id = 0
+        # Every transition gets a sequence number. The most recent ones are
+        # kept in the transition log so clients can catch up after a
+        # disconnect without having to fetch the whole state.
+        self.sequence = 0
+        self.transition_log = deque(maxlen=self.transition_log_size)
+        # All randomness in the game should come from here so that games can
+        # be replayed from their seed.
+        self.random = random.Random()
+        self.random_seed = None
+        self.seed()
+        # Set by the game master when the game is being persisted (see
+        # deckr.core.persistence).
+        self.journal = None
+        self.in_action = False
+        # The legal actions of each player, as of legal_actions_version (see
+        # legal_actions).
+        self.legal_actions_cache = {}
+        self.legal_actions_version = None
 
         self.register(self)
         self.load_zones(self.game_zones)
@@ -101,6 +354,117 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
 
         raise NotImplementedError
 
+    def start(self):
+        """
+        Set up the game, recording it in the journal (if there is one).
+        """
+
+        self.run_journaled(['set_up'], self.set_up)
+
+    def is_over(self):  # pylint: disable=no-self-use
+        """
+        Overriden by subclasses that can end. Used to know when to stop
+        playing headless games (see deckr.core.simulation).
+        """
+
+        return False
+
+    def winners(self):  # pylint: disable=no-self-use
+        """
+        Overriden by subclasses that can end. The players that won the game
+        (if it is over).
+        """
+
+        return []
+
+    def legal_actions(self, player=None):
+        """
+        Get every action that player could take right now, along with its
+        arguments. Each one is a dictionary in the same form as an action
+        message: {'action': name, argument: value, ...}.
+
+        Arguments that are game objects are filled in with every registered
+        object of the right class, and other arguments with the action's
+        choices (see action). Actions with a required argument that can't be
+        filled in are left out.
+
+        The result is memoized until the game changes: its sequence number,
+        its registry version or the number of actions that have run. Code
+        outside of actions that changes something restrictions look at
+        (without a transition) should call invalidate_legal_actions.
+        """
+
+        version = (self.sequence, self.registry_version, self.actions_run)
+        if self.legal_actions_version != version:
+            self.legal_actions_cache = {}
+            self.legal_actions_version = version
+        result = self.legal_actions_cache.get(player)
+        if result is None:
+            result = self._find_legal_actions(player)
+            self.legal_actions_cache[player] = result
+        return result
+
+    def invalidate_legal_actions(self):
+        """
+        Throw away the memoized legal actions.
+        """
+
+        self.legal_actions_cache = {}
+        self.legal_actions_version = None
+
+    def _find_legal_actions(self, player):
+        """
+        Enumerate the legal actions for a player (see legal_actions).
+        """
+
+        # Every action with an argument of the same class shares the list of
+        # candidates.
+        candidates = {}
+        result = []
+        for name, entry in sorted(get_actions(type(self)).items()):
+            domains = []
+            for arg in entry.enumerated:
+                if arg in entry.choices:
+                    domains.append(list(entry.choices[arg](self, player)))
+                elif arg in entry.params:
+                    klass = entry.params[arg]
+                    if klass not in candidates:
+                        candidates[klass] = [
+                            obj for _, obj in sorted(self.game_objects.items())
+                            if isinstance(obj, klass)]
+                    domains.append(candidates[klass])
+                else:
+                    break
+            else:
+                if not entry.allows(self, player, {},
+                                    entry.pruning.get(None, ())):
+                    continue
+                # Rule out the candidates for each argument on their own
+                # before trying every combination of them.
+                for position, arg in enumerate(entry.enumerated):
+                    if arg in entry.pruning:
+                        domains[position] = [
+                            value for value in domains[position]
+                            if entry.allows(self, player, {arg: value},
+                                            entry.pruning[arg])]
+                for values in itertools.product(*domains):
+                    arguments = dict(zip(entry.enumerated, values))
+                    if entry.allows(self, player, arguments, entry.combined):
+                        arguments['action'] = name
+                        result.append(arguments)
+        return result
+
+    def seed(self, seed=None):
+        """
+        Seed the game's random number generator. If seed is None a new seed
+        is picked at random. The seed is stored in random_seed.
+        """
+
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.random_seed = seed
+        self.random.seed(seed)
+
     def get_all_transitions(self):
         """
         Get all the current transitions.
@@ -114,25 +478,50 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
         Flush all transitions.
         """
 
-        self.transitions = {}
+        self.public_transitions = []
+        self.private_transitions = {}
 
     def get_transitions(self, player):
         """
-        Get the transitions for a given player.
+        Get the transitions for a given player (public transitions interleaved
+        with the player's private transitions). If player is None only the
+        public transitions are returned.
         """
 
-        return self.transitions.get(player, [])
+        return merge_transitions(self.public_transitions,
+                                 self.private_transitions.get(player))
 
     def add_transition(self, transition, player=None):
         """
-        Add a transition to this game.
+        Add a transition to this game. If player is None the transition is
+        public and will be seen by everyone (including spectators).
         """
 
+        self.sequence += 1
+        if not self.record_transitions:
+            return
+        self.transition_log.append((self.sequence, player, transition))
+
         if player is not None:
-            self.transitions.setdefault(player, []).append(transition)
+            position = len(self.public_transitions)
+            self.private_transitions.setdefault(player, []).append(
+                (position, transition))
         else:
-            for player in self.players:
-                self.add_transition(transition, player)
+            self.public_transitions.append(transition)
+
+    def get_transitions_since(self, sequence, player=None):
+        """
+        Get all of the transitions visible to player that came after the given
+        sequence number. Returns None if some of those transitions are no
+        longer in the transition log (the caller will need the full state).
+        """
+
+        if sequence > self.sequence:
+            return None
+        if sequence < self.sequence - len(self.transition_log):
+            return None
+        return [transition for seq, owner, transition in self.transition_log
+                if seq > sequence and (owner is None or owner == player)]
 
     def get_state(self, player=None):
         """
@@ -152,6 +541,36 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
         if (self.max_players is not None and
                 len(self.players) >= self.max_players):
             raise TooManyPlayers
+        return self.run_journaled(['add_player'], self.create_player)
+
+    ######################
+    # Internal Functions #
+    ######################
+
+    def run_journaled(self, record, func):
+        """
+        Run func, recording record in the journal first (if there is one
+        and this isn't already part of something that was recorded). The
+        record covers everything func does, so actions it runs aren't
+        recorded separately (and replaying the record doesn't run them
+        twice).
+        """
+
+        if self.journal is None or self.in_action:
+            return func()
+        self.journal.record(record)
+        self.in_action = True
+        try:
+            return func()
+        finally:
+            self.in_action = False
+            self.journal.checkpoint(self)
+
+    def create_player(self):
+        """
+        Create a player, along with their zones, and add them to the game.
+        """
+
         player = Player()
         player.load_zones(self.player_zones)
         self.register(player)
@@ -161,10 +580,6 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
         self.players.append(player)
         return player
 
-    ######################
-    # Internal Functions #
-    ######################
-
     def register_single(self, obj):
         """
         Registers a single object.
@@ -175,7 +590,9 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
             self.game_objects[game_id] = obj
             obj.game_id = game_id
             obj.game = self
+            obj.version += 1
             self.next_game_id += 1
+            self.registry_version += 1
             return game_id
         else:
             return obj.game_id
@@ -188,6 +605,8 @@ class Game(GameObject, HasZones):  # pylint: disable=abstract-class-not-used
         if obj.game_id is not None:
             del self.game_objects[obj.game_id]
             obj.game_id = None
+            obj.version += 1
+            self.registry_version += 1
 
     def get_object_single(self, obj_id, klass):
         """
@@ -2,51 +2,250 @@
 This file provides the GameDefinition class.
 """
 
+import imp
+import logging
 import os
 import sys
 
 import yaml
+# Use libyaml when it's available.
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+from deckr.core.exceptions import GameLoadError
+
+# Parsed configuration files, by path, along with their modification time.
+# The cache belongs to the process, so every worker of a sharded game master
+# parses the files once for itself.
+CONFIGS = {}
+# The module name each game directory was given, and the directory that owns
+# each module name.
+MODULE_NAMES = {}
+MODULE_PATHS = {}
+
+
+def load_config(path):
+    """
+    Load a configuration file. Files are only parsed again if they have been
+    modified since the last time they were loaded.
+    """
+
+    mtime = os.path.getmtime(path)
+    cached = CONFIGS.get(path)
+    if cached is not None and cached[0] == mtime:
+        return dict(cached[1])
+    with open(path) as config_file:
+        config = yaml.load(config_file, Loader=SafeLoader)
+    if not isinstance(config, dict):
+        raise ValueError("Configuration file is not a dictionary.")
+    CONFIGS[path] = (mtime, config)
+    return dict(config)
+
+
+def module_name(path, game_file):
+    """
+    Pick the name the game module in path will be imported as. This is the
+    name of the game file, unless that name is already taken by another
+    module.
+    """
+
+    name = MODULE_NAMES.get(path)
+    if name is None:
+        name = game_file
+        suffix = 0
+        while name in MODULE_PATHS or name in sys.modules:
+            suffix += 1
+            name = '%s_%d' % (game_file, suffix)
+        MODULE_NAMES[path] = name
+        MODULE_PATHS[name] = path
+    return name
 
 
 class GameDefinition(object):
 
     """
-    A game definition includes all the core information for a game.
+    A game definition includes all the core information for a game. The game
+    module isn't imported until the game class is first needed (load only
+    checks that it exists), and a GameLoadError is raised then if it can't
+    be imported or doesn't have the game class.
+
+    Definitions can be reloaded while games are running. The new version of
+    the game module is imported under a new name (<module>__v<version>), so
+    games created before the reload keep running with the old classes.
     """
 
     def __init__(self):
         self.config = None
-        self.klass = None
+        self.path = None
+        self.base_module_name = None
+        self.module_name = None
+        self.version = 0
         self.name = None
+        self._klass = None
+        # The files this definition was loaded from, and their modification
+        # times.
+        self._mtimes = {}
 
     def load(self, path):
         """
         Load a game definition from a specified path.
         """
 
-        config_file = open(os.path.join(path, 'config.yml'))
-        self.config = yaml.load(config_file)
+        path = os.path.abspath(path)
+        config_path = os.path.join(path, 'config.yml')
+        self._mtimes = {config_path: os.path.getmtime(config_path)}
+        self.config = self._load_config(config_path)
+        try:
+            module_file = imp.find_module(self.config['game_file'],
+                                          [path])[0]
+        except ImportError:
+            raise ValueError("Game file %s not found in %s" %
+                             (self.config['game_file'], path))
+        if module_file is not None:
+            module_file.close()
+        self.path = path
+        self.base_module_name = module_name(path, self.config['game_file'])
+        self.module_name = self.base_module_name
+        self.version = 0
+        self._klass = None
+
+        # Load other useful attributes
+        self.name = self.config.get('name', 'Unnamed Game')
+
+    @staticmethod
+    def _load_config(config_path):
+        """
+        Load and check the configuration file.
+        """
 
-        if 'game_file' not in self.config or 'game_class' not in self.config:
+        config = load_config(config_path)
+        if 'game_file' not in config or 'game_class' not in config:
             raise ValueError(
                 "Configuration file is missing required attributes.")
+        return config
 
-        # Add the super directory to the system path
-        sys.path.append(path)
-        # Explicitly import our game as the game object
-        game_module = __import__(self.config['game_file'])
-        # Clean up the system path that we don't care about any more.
-        sys.path.remove(path)
+    def changed(self):
+        """
+        Check whether any of the files this definition was loaded from have
+        been modified since.
+        """
 
-        # Load the class
-        self.klass = getattr(game_module, self.config['game_class'])
+        for path, mtime in self._mtimes.items():
+            try:
+                if os.path.getmtime(path) != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
 
-        # Load other useful attributes
-        self.name = self.config.get('name', 'Unnamed Game')
+    def reload(self):
+        """
+        Load the configuration file again, and if the game module has been
+        imported import the new version of it (under a new name). If that
+        fails the old version is kept, and the definition still counts as
+        changed (so the reload is tried again).
+        """
+
+        config_path = os.path.join(self.path, 'config.yml')
+        mtimes = {path: os.path.getmtime(path) if os.path.exists(path)
+                        else mtime for path, mtime in self._mtimes.items()}
+        config = self._load_config(config_path)
+        if self.module_name not in sys.modules:
+            self.config = config
+            self.name = config.get('name', 'Unnamed Game')
+            self._mtimes = mtimes
+            return
+
+        version = self.version + 1
+        name = '%s__v%d' % (self.base_module_name, version)
+        while name in sys.modules:
+            version += 1
+            name = '%s__v%d' % (self.base_module_name, version)
+        module = self._import(name, config['game_file'], mtimes)
+        try:
+            klass = getattr(module, config['game_class'])
+        except AttributeError:
+            del sys.modules[name]
+            raise
+        logging.info("Reloaded %s as %s", self.path, name)
+        self._mtimes = mtimes
+        self.config = config
+        self.name = config.get('name', 'Unnamed Game')
+        self.module_name = name
+        self.version = version
+        self._klass = klass
+
+    def owns_module(self, name):
+        """
+        Check whether a module name belongs to (any version of) this game.
+        """
+
+        return (name == self.base_module_name or
+                name.startswith(self.base_module_name + '__v'))
+
+    def load_module(self):
+        """
+        Import the game module (if it hasn't been already). The module is
+        loaded straight from the game's directory.
+        """
+
+        module = sys.modules.get(self.module_name)
+        if module is None:
+            module = self._import(self.module_name, self.config['game_file'],
+                                  self._mtimes)
+        return module
+
+    def _import(self, name, game_file, mtimes):
+        """
+        Import the game file as a module called name. The module's
+        modification time is added to mtimes. The game's directory is on
+        sys.path while the module is loaded, so the game file can import the
+        other modules next to it. Those are imported under their own names
+        and aren't reloaded.
+        """
+
+        module_file, pathname, description = imp.find_module(game_file,
+                                                             [self.path])
+        mtimes[pathname] = os.path.getmtime(pathname)
+        sys.path.insert(0, self.path)
+        try:
+            return imp.load_module(name, module_file, pathname, description)
+        except:
+            sys.modules.pop(name, None)
+            raise
+        finally:
+            sys.path.remove(self.path)
+            if module_file is not None:
+                module_file.close()
+
+    @property
+    def klass(self):
+        """
+        The game class.
+        """
+
+        return self.load_class()
+
+    def load_class(self):
+        """
+        Get the game class, importing the game module if needed.
+        """
+
+        if self._klass is None:
+            try:
+                self._klass = getattr(self.load_module(),
+                                      self.config['game_class'])
+            except Exception as ex:  # pylint: disable=broad-except
+                logging.exception("Could not load %s", self.path)
+                raise GameLoadError("Could not load %s: %s" % (self.name,
+                                                               ex))
+        return self._klass
 
     def create_instance(self):
         """
         Create a game using this game definition.
         """
 
-        return self.klass()
+        return self.load_class()()
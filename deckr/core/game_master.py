@@ -3,6 +3,8 @@ This file contains code for the game master.
 """
 
 import logging
+import sys
+import time
 
 from deckr.core.game_definition import GameDefinition
 
@@ -14,13 +16,22 @@ class GameMaster(object):
     games. This class offers a list of games that it supports, and interfaces
     to create and destory games. It will store a dictionary of all games that
     this master manages.
+
+    If a store (see deckr.core.persistence) is given every game is persisted
+    to it, and recover can bring the games back after a restart. Recovered
+    games are only restored from their snapshots (in snapshots) when they
+    are first asked for. Set hibernator (see deckr.core.hibernation) to
+    hibernate idle games.
     """
 
-    def __init__(self):
+    def __init__(self, store=None):
         self.game_types = {}
         self.games = {}
         self.game_type_id = 0
         self.game_id = 0
+        self.store = store
+        self.snapshots = {}
+        self.hibernator = None
 
     def register(self, game_path):
         """
@@ -34,17 +45,29 @@ class GameMaster(object):
         self.game_type_id += 1
         return self.game_type_id - 1
 
-    def create(self, game_type_id):
+    def create(self, game_type_id, seed=None, game_id=None):
         """
         Create a new game instance, of the specified game type. Returns
-        the game id of the newly created game.
+        the game id of the newly created game. If seed is given it will be
+        used to seed the game's random number generator. If game_id is given
+        it is used instead of the next free id (raises a ValueError if it is
+        already in use).
         """
 
+        if game_id is None:
+            game_id = self.game_id
+        elif game_id in self.games or game_id in self.snapshots:
+            raise ValueError("Game id %s is already in use" % game_id)
         game = self.game_types[game_type_id].create_instance()
-        self.games[self.game_id] = game
-        game.master_game_id = self.game_id
-        self.game_id += 1
-        return self.game_id - 1
+        if seed is not None:
+            game.seed(seed)
+        self.games[game_id] = game
+        game.master_game_id = game_id
+        self.game_id = max(self.game_id, game_id + 1)
+        if self.store is not None:
+            self.store.attach(game, game_id)
+        self.touch(game_id)
+        return game_id
 
     def destroy(self, game_id):
         """
@@ -52,7 +75,81 @@ class GameMaster(object):
         on the game.
         """
 
-        del self.games[game_id]
+        if game_id in self.snapshots:
+            del self.snapshots[game_id]
+        else:
+            del self.games[game_id]
+        if self.hibernator is not None:
+            self.hibernator.forget(game_id)
+        if self.store is not None:
+            self.store.remove(game_id)
+
+    def recover(self):
+        """
+        Open the snapshot of every game in the store. The games themselves
+        are restored by get_game. Returns the ids of the recovered games.
+        """
+
+        recovered = []
+        for game_id in sorted(self.store.game_ids()):
+            try:
+                self.snapshots[game_id] = self.store.open(game_id)
+            except (EnvironmentError, ValueError):
+                logging.exception("Could not recover game %s", game_id)
+                continue
+            self.game_id = max(self.game_id, game_id + 1)
+            recovered.append(game_id)
+        return recovered
+
+    def restore(self, game_id):
+        """
+        Restore a recovered game from its snapshot (and journal). The game
+        types should already have been registered (so that their modules
+        have been imported).
+        """
+
+        start = time.time()
+        game = self.store.load(game_id, self.snapshots.pop(game_id),
+                               self.find_global)
+        game.master_game_id = game_id
+        self.games[game_id] = game
+        if self.hibernator is not None:
+            self.hibernator.rehydrated(game_id, time.time() - start)
+        return game
+
+    def find_global(self, module, name):
+        """
+        Look up a class for unpickling a game. Game modules are imported
+        through their game definitions, since they aren't on sys.path.
+        """
+
+        if module not in sys.modules:
+            for game_definition in self.game_types.values():
+                if game_definition.owns_module(module):
+                    # Games saved by an older version of a reloaded game
+                    # come back with the current version.
+                    return getattr(game_definition.load_module(), name)
+            __import__(module)
+        return getattr(sys.modules[module], name)
+
+    def reload_game_types(self):
+        """
+        Reload every game definition whose files have changed. New games are
+        created with the new version, running games aren't affected. Returns
+        the ids of the reloaded game types.
+        """
+
+        reloaded = []
+        for game_type_id, game_definition in sorted(self.game_types.items()):
+            if not game_definition.changed():
+                continue
+            try:
+                game_definition.reload()
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Could not reload %s", game_definition.path)
+                continue
+            reloaded.append(game_type_id)
+        return reloaded
 
     def list_game_types(self):
         """
@@ -66,4 +163,18 @@ class GameMaster(object):
         Get the game for a specific id.
         """
 
-        return self.games[game_id]
+        game = self.games.get(game_id)
+        if game is None:
+            if game_id not in self.snapshots:
+                raise KeyError(game_id)
+            game = self.restore(game_id)
+        self.touch(game_id)
+        return game
+
+    def touch(self, game_id):
+        """
+        Note that a game was just used (so it shouldn't be hibernated).
+        """
+
+        if self.hibernator is not None:
+            self.hibernator.touch(game_id)
@@ -3,61 +3,313 @@ This files provides the GameObject class.
 """
 
 
-def clean_game_objects(obj):
+def clean_game_objects(obj, found=None):
     """
-    Clean up game objects for serialization.
+    Clean up game objects for serialization. If found is given every game
+    object that gets replaced by its id is appended to it.
     """
 
     if isinstance(obj, list):
-        return [clean_game_objects(x) for x in obj]
+        return [clean_game_objects(x, found) for x in obj]
     elif isinstance(obj, dict):
-        return {clean_game_objects(key): clean_game_objects(value) for
-                key, value in obj.items()}
+        return {clean_game_objects(key, found): clean_game_objects(value,
+                                                                   found)
+                for key, value in obj.items()}
     elif isinstance(obj, GameObject):
+        if found is not None:
+            found.append(obj)
         return obj.game_id
     return obj
 
 
+class _Unset(object):
+
+    """
+    The type of _UNSET. Pickles by reference, so _UNSET is still _UNSET
+    after a game has been unpickled.
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_UNSET'
+
+
+# Marks a schema attribute that hasn't been set.
+_UNSET = _Unset()
+
+
+def _read_only(*args, **kwargs):  # pylint: disable=unused-argument
+    """
+    Refuse to change an AttributeView.
+    """
+
+    raise AttributeError(
+        "Game attributes are read only, use set_game_attribute")
+
+
+class AttributeView(dict):
+
+    """
+    A read only copy of an object's attributes (see
+    GameObject.game_attributes). Writing to it raises an AttributeError
+    rather than silently changing nothing.
+    """
+
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+
+def schema_positions(klass):
+    """
+    Get a dictionary mapping each name in the game_attribute_schema of klass
+    to its position. This is computed once per class.
+    """
+
+    positions = klass.__dict__.get('_schema_positions')
+    if positions is None:
+        positions = {name: i for i, name in
+                     enumerate(klass.game_attribute_schema)}
+        # pylint: disable=protected-access
+        klass._schema_positions = positions
+    return positions
+
+
+# Values of these types never need cleaning.
+SCALAR_TYPES = frozenset([bool, int, float, str, type(None), type(u''),
+                          type(2 ** 64)])
+
+
+def compile_serializer(klass):
+    """
+    Build a function that serializes instances of klass into dictionaries,
+    producing the same result as cleaning their game attributes with
+    clean_game_objects. The function is generated from the class's attribute
+    schema so that schema attributes are read straight out of storage, and
+    only values that might contain game objects are cleaned: attributes
+    listed in game_attribute_references are expected to hold game objects,
+    and anything that isn't a plain scalar falls back to clean_game_objects.
+    Like clean_game_objects, the function appends every game object it
+    replaces by its id to found (if it is given).
+    """
+
+    # pylint: disable=protected-access
+    custom_storage = klass._load_attribute is not GameObject._load_attribute
+    lines = ['def serialize(obj, found=None):',
+             '    result = {}']
+    if not custom_storage and klass.game_attribute_schema:
+        lines.append('    values = obj._attributes')
+    for position, name in enumerate(klass.game_attribute_schema):
+        if custom_storage:
+            lines.append('    value = obj._load_attribute(%r)' % name)
+        else:
+            lines.append('    value = values[%d]' % position)
+        lines.append('    if value is not UNSET:')
+        if name in klass.game_attribute_references:
+            lines.extend([
+                '        if isinstance(value, GameObject):',
+                '            if found is not None:',
+                '                found.append(value)',
+                '            result[%r] = value.game_id' % name,
+                '        else:',
+                '            result[%r] = clean(value, found)' % name])
+        else:
+            lines.append('        result[%r] = (value if value.__class__ in '
+                         'SCALARS else clean(value, found))' % name)
+    lines.extend([
+        '    extra = obj._extra_attributes',
+        '    if extra:',
+        '        for name, value in extra.items():',
+        '            result[name] = (value if value.__class__ in SCALARS '
+        'else clean(value, found))',
+        '    result["game_id"] = obj.game_id',
+        '    result["type"] = obj.game_object_type',
+        '    return result'])
+
+    namespace = {'UNSET': _UNSET, 'SCALARS': SCALAR_TYPES,
+                 'GameObject': GameObject, 'clean': clean_game_objects}
+    exec('\n'.join(lines), namespace)  # pylint: disable=exec-used
+    return namespace['serialize']
+
+
+def get_serializer(klass):
+    """
+    Get the compiled serializer for klass, compiling it the first time.
+    """
+
+    serializer = klass.__dict__.get('_serializer')
+    if serializer is None:
+        serializer = compile_serializer(klass)
+        # pylint: disable=protected-access
+        klass._serializer = staticmethod(serializer)
+    else:
+        serializer = serializer.__func__
+    return serializer
+
+
 class GameObject(object):
 
     """
     A game object can represent an arbitrary object in the game (a card,
     a board tile, etc).
+
+    Game objects use __slots__ to keep their memory footprint small. Classes
+    can list the game attributes they always have in game_attribute_schema;
+    those are stored in a flat list shared by position with every other
+    instance of the class, and anything else goes into a dictionary that is
+    only created when needed. Player overrides are also created lazily.
+    Subclasses that don't define __slots__ get a __dict__ as usual.
+
+    Serializations are cached until the object changes, and only
+    set_game_attribute counts as a change. Registering or deregistering one
+    of the objects it refers to also invalidates the cache, since that
+    changes the id it is serialized as. Attribute values (lists and
+    dictionaries in particular) must be replaced, never mutated in place:
+    a mutated value isn't sent to clients and the cached serialization keeps
+    the old contents.
     """
 
+    __slots__ = ('game_id', 'game', 'version', '_attributes',
+                 '_extra_attributes', '_player_overrides', '_serialized_key',
+                 '_serialized', '_serialized_overrides', '_serialized_refs',
+                 '__weakref__')
+
     game_object_type = 'GameObject'
+    game_attribute_schema = ()
+    # Schema attributes that are expected to hold other game objects.
+    game_attribute_references = ()
 
     def __init__(self, *args, **kwargs):
         super(GameObject, self).__init__(*args, **kwargs)
         # Specifies the id of this object
         self.game_id = None
         self.game = None
-        self.game_attributes = {}
-        self.player_overrides = {}
+        self._attributes = [_UNSET] * len(self.game_attribute_schema)
+        self._extra_attributes = None
+        self._player_overrides = None
+        # Bumped every time something about this object changes. Used to
+        # decide when the cached serialization has to be rebuilt.
+        self.version = 0
+        self._serialized_key = None
+        self._serialized = None
+        self._serialized_overrides = None
+        # The game objects the cached serialization refers to, and the ids
+        # they had when it was built.
+        self._serialized_refs = None
+
+    @property
+    def game_attributes(self):
+        """
+        A dictionary of all the public game attributes. This is a read only
+        copy (see AttributeView), use set_game_attribute to make changes.
+        """
+
+        result = {}
+        for name in self.game_attribute_schema:
+            value = self._load_attribute(name)
+            if value is not _UNSET:
+                result[name] = value
+        if self._extra_attributes:
+            result.update(self._extra_attributes)
+        return AttributeView(result)
+
+    @property
+    def player_overrides(self):
+        """
+        A dictionary of player to a dictionary of their overriden attributes.
+        This is a read only copy, use set_game_attribute to make changes.
+        """
+
+        if self._player_overrides is None:
+            return AttributeView()
+        return AttributeView(
+            (player, AttributeView(overrides))
+            for player, overrides in self._player_overrides.items())
 
     def serialize(self, player=None):
         """
         This function will convert this object to a dictionary that can be
         transmitted over some kind of network (i.e. all internal references
-        have been removed).
+        have been removed). The public part and each player's overrides are
+        cached until the object (or the id of an object it refers to)
+        changes.
+        """
+
+        registry_version = (self.game.registry_version
+                            if self.game is not None else None)
+        key = self._serialized_key
+        if key is None or key[0] != self.version:
+            self._rebuild_serialization(registry_version)
+        elif key[1] != registry_version:
+            # Something was registered or deregistered, which only matters
+            # if it is one of the objects this serialization refers to.
+            refs, ids = self._serialized_refs
+            if any(obj.game_id != game_id
+                   for obj, game_id in zip(refs, ids)):
+                self._rebuild_serialization(registry_version)
+            else:
+                self._serialized_key = (self.version, registry_version)
+
+        # Copy the lists and dictionaries as well, so that changing the
+        # result doesn't change the cache.
+        result = {name: (value if value.__class__ in SCALAR_TYPES
+                         else clean_game_objects(value))
+                  for name, value in self._serialized.items()}
+        if (player is not None and self._player_overrides is not None and
+                player in self._player_overrides):
+            if self._serialized_overrides is None:
+                self._serialized_overrides = {}
+            overrides = self._serialized_overrides.get(player)
+            if overrides is None:
+                found = []
+                overrides = clean_game_objects(
+                    {name: value for name, value in
+                     self._player_overrides[player].items()
+                     if self.has_game_attribute(name)}, found)
+                refs, ids = self._serialized_refs
+                refs.extend(found)
+                ids.extend(obj.game_id for obj in found)
+                self._serialized_overrides[player] = overrides
+            result.update(clean_game_objects(overrides))
+        return result
+
+    def _rebuild_serialization(self, registry_version):
+        """
+        Rebuild the cached serialization, remembering the ids of the objects
+        it refers to.
         """
 
-        result = {key: self.get_game_attribute(key, player) for
-                  key in self.game_attributes}
-        result['game_id'] = self.game_id
-        result['type'] = self.game_object_type
-        return clean_game_objects(result)
+        found = []
+        self._serialized = self.serialize_public(found)
+        self._serialized_overrides = None
+        self._serialized_refs = (found, [obj.game_id for obj in found])
+        self._serialized_key = (self.version, registry_version)
+
+    def serialize_public(self, found=None):
+        """
+        Build the serialization of this object that everyone can see. This
+        bypasses the cache, so subclasses that serialize extra information
+        should override this rather than serialize. Every game object that
+        the serialization refers to by id should be appended to found (if it
+        is given), so the cache knows when those ids change.
+        """
+
+        return get_serializer(type(self))(self, found)
 
     def set_game_attribute(self, name, value, player=None):
         """
         Sets a specific game attribute. These will be tracked and sent out in
-        updates/the game state.
+        updates/the game state. To change a list or dictionary value, set a
+        new one (see the class docstring).
         """
 
         if player is not None:
-            self.player_overrides.setdefault(player, {})[name] = value
+            if self._player_overrides is None:
+                self._player_overrides = {}
+            self._player_overrides.setdefault(player, {})[name] = value
         else:
-            self.game_attributes[name] = value
+            self._store_attribute(name, value)
+        self.version += 1
 
         # Register the change with my game.
         if self.game is not None:
@@ -70,13 +322,47 @@ class GameObject(object):
         attribute doesn't exist.
         """
 
-        if player is not None:
+        if player is not None and self._player_overrides is not None:
             try:
-                return self.player_overrides[player][name]
+                return self._player_overrides[player][name]
             except KeyError:
                 pass
-        try:
-            return self.game_attributes[name]
-        except KeyError:
+        value = self._load_attribute(name)
+        if value is _UNSET:
             error = 'Could not find game attribute {0}'.format(name)
             raise AttributeError(error)
+        return value
+
+    def has_game_attribute(self, name):
+        """
+        Check whether a public game attribute has been set.
+        """
+
+        return self._load_attribute(name) is not _UNSET
+
+    def _load_attribute(self, name):
+        """
+        Get the public value of an attribute out of storage, or _UNSET. This
+        can be overriden by subclasses that store their attributes elsewhere.
+        """
+
+        position = schema_positions(type(self)).get(name)
+        if position is not None:
+            return self._attributes[position]
+        elif self._extra_attributes is not None:
+            return self._extra_attributes.get(name, _UNSET)
+        return _UNSET
+
+    def _store_attribute(self, name, value):
+        """
+        Put the public value of an attribute into storage. This can be
+        overriden by subclasses that store their attributes elsewhere.
+        """
+
+        position = schema_positions(type(self)).get(name)
+        if position is not None:
+            self._attributes[position] = value
+        elif self._extra_attributes is None:
+            self._extra_attributes = {name: value}
+        else:
+            self._extra_attributes[name] = value
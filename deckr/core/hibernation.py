@@ -0,0 +1,179 @@
+"""
+This module contains the code for hibernating idle games. A hibernated game
+is written to a snapshot (see deckr.core.snapshot) and dropped from memory.
+It is restored the next time it is asked for.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+
+
+class Hibernator(object):
+
+    """
+    Keeps track of when each game in a game master was last used, and
+    hibernates the least recently used games once there are more than
+    max_games games in memory, or more than max_objects registered objects
+    between them (a stand in for their memory). Games that have been idle for
+    longer than idle_timeout seconds are hibernated as well.
+
+    is_busy is called with a game id before the game is hibernated. Games it
+    returns True for (i.e. games with clients connected) are left alone.
+
+    Snapshots are written by the store's writer thread, and a game is only
+    dropped from memory once its snapshot has been written (and only if it
+    hasn't been used in the meantime). Games that go idle are only noticed
+    by enforce, so it should be called periodically.
+
+    stats holds the number of games hibernated and rehydrated, along with the
+    total and the worst time (in seconds) spent on each.
+    """
+
+    def __init__(self, game_master, max_games=None, max_objects=None,
+                 idle_timeout=None, is_busy=None):
+        # pylint: disable=too-many-arguments
+        self.game_master = game_master
+        self.max_games = max_games
+        self.max_objects = max_objects
+        self.idle_timeout = idle_timeout
+        self.is_busy = is_busy or (lambda game_id: False)
+        # Game id to the time it was last used, least recently used first.
+        self.last_used = OrderedDict()
+        # Game id to the game, for games whose snapshots are being written.
+        self.hibernating = {}
+        self.sizes = {}
+        self.objects = 0
+        self.stats = {'hibernated': 0, 'hibernate_time': 0.0,
+                      'hibernate_max': 0.0, 'rehydrated': 0,
+                      'rehydrate_time': 0.0, 'rehydrate_max': 0.0}
+
+    def touch(self, game_id):
+        """
+        Note that a game (which must be in memory) was just used, and
+        hibernate other games if we're over budget.
+        """
+
+        self.hibernating.pop(game_id, None)
+        self.last_used.pop(game_id, None)
+        self.last_used[game_id] = time.time()
+        size = len(self.game_master.games[game_id].game_objects)
+        self.objects += size - self.sizes.get(game_id, 0)
+        self.sizes[game_id] = size
+        self.enforce(keep=game_id)
+
+    def forget(self, game_id):
+        """
+        Stop keeping track of a game (because it was destroyed or
+        hibernated).
+        """
+
+        self.hibernating.pop(game_id, None)
+        if self.last_used.pop(game_id, None) is not None:
+            self.objects -= self.sizes.pop(game_id)
+
+    def over_budget(self):
+        """
+        Check whether too many games (or objects) are in memory.
+        """
+
+        return ((self.max_games is not None and
+                 len(self.last_used) > self.max_games) or
+                (self.max_objects is not None and
+                 self.objects > self.max_objects))
+
+    def enforce(self, keep=None):
+        """
+        Hibernate games until we're within budget. The game keep is never
+        hibernated.
+        """
+
+        if self.idle_timeout is not None:
+            cutoff = time.time() - self.idle_timeout
+        else:
+            cutoff = None
+        for game_id, last_used in self.last_used.items():
+            over_budget = self.over_budget()
+            if not over_budget and (cutoff is None or last_used > cutoff):
+                break
+            if game_id != keep and not self.is_busy(game_id):
+                self.hibernate(game_id)
+
+    def hibernate(self, game_id):
+        """
+        Start writing a game to its snapshot. The game is dropped from memory
+        once that's done.
+        """
+
+        start = time.time()
+        game = self.game_master.games[game_id]
+        self.forget(game_id)
+        self.hibernating[game_id] = game
+        saved = self.game_master.store.save(game, game_id)
+        saved.addCallbacks(self.saved, self.not_saved,
+                           callbackArgs=(game, start),
+                           errbackArgs=(game_id, game))
+
+    def saved(self, game_id, game, start):
+        """
+        Called once a game's snapshot has been written. Drops the game from
+        memory, unless it has been used since or the snapshot can't be
+        opened.
+        """
+
+        if self.hibernating.get(game_id) is not game:
+            return
+        del self.hibernating[game_id]
+        game_master = self.game_master
+        try:
+            snapshot = game_master.store.open(game_id)
+        except (EnvironmentError, ValueError):
+            logging.exception("Could not open the snapshot of game %s",
+                              game_id)
+            self.touch(game_id)
+            return
+        del game_master.games[game_id]
+        game_master.snapshots[game_id] = snapshot
+        self.record('hibernate', time.time() - start)
+        logging.debug("Hibernated game %s", game_id)
+
+    def not_saved(self, failure, game_id, game):
+        """
+        Called if a game's snapshot couldn't be written. The game stays in
+        memory.
+        """
+
+        logging.error("Could not hibernate game %s: %s", game_id,
+                      failure.getErrorMessage())
+        if self.hibernating.get(game_id) is game:
+            self.touch(game_id)
+
+    def rehydrated(self, game_id, elapsed):
+        """
+        Called by the game master once it has restored a game.
+        """
+
+        self.record('rehydrate', elapsed)
+        logging.debug("Rehydrated game %s in %.1fms", game_id, elapsed * 1e3)
+
+    def report(self):
+        """
+        Log how many games are in memory and the stats.
+        """
+
+        stats = self.stats
+        logging.info("%d games in memory, %d hibernated. %d hibernates "
+                     "(%.1fms max), %d rehydrates (%.1fms max)",
+                     len(self.game_master.games),
+                     len(self.game_master.snapshots), stats['hibernated'],
+                     stats['hibernate_max'] * 1e3, stats['rehydrated'],
+                     stats['rehydrate_max'] * 1e3)
+
+    def record(self, event, elapsed):
+        """
+        Add a hibernate or rehydrate to the stats.
+        """
+
+        self.stats[event + 'd'] += 1
+        self.stats[event + '_time'] += elapsed
+        self.stats[event + '_max'] = max(self.stats[event + '_max'], elapsed)
@@ -0,0 +1,431 @@
+"""
+This module contains the code for persisting games to disk, so they survive a
+restart of the game master.
+
+Every game is stored as a snapshot plus a journal. The snapshot (see
+deckr.core.snapshot) holds the whole game and the journal is an append-only
+log (one JSON list per line) of everything that was done to the game after
+the snapshot was taken:
+
+* ['add_player']: A player was added.
+* ['set_up']: The game was started.
+* ['action', name, args, kwargs]: An action was run. Game objects in the
+  arguments are replaced by their game ids.
+
+Transitions aren't journaled. Games get all of their randomness from their
+seeded random number generator (which is part of the snapshot), so replaying
+the journal on top of the snapshot regenerates them.
+
+Writes happen on a background thread. Everything that is waiting to be
+written is written together, followed by a single fsync per file (group
+commit), so a burst of actions only costs a single sync.
+"""
+
+import inspect
+import json
+import logging
+import os
+import threading
+from Queue import Queue
+
+from twisted.internet.defer import Deferred
+
+from deckr.core.game import get_actions
+from deckr.core.snapshot import Snapshot, dump_snapshot
+
+
+# Marks a player argument that wasn't in an action record.
+_NO_PLAYER = object()
+
+
+def replay_action(game, name, args, kwargs):
+    """
+    Replay an action record. The action is found in the game's action table
+    and its arguments are converted just like a client's would be.
+    """
+
+    action = get_actions(type(game))[name]
+    if args:
+        names = inspect.getargspec(action.function.func).args[1:]
+        kwargs.update(zip(names, args))
+    player = _NO_PLAYER
+    if 'player' not in action.params:
+        player = kwargs.pop('player', _NO_PLAYER)
+    arguments = action.convert(game, kwargs)
+    if player is not _NO_PLAYER:
+        # Spectators run actions as player None.
+        arguments['player'] = (None if player is None
+                               else game.get_object(player))
+    action.function(game, **arguments)  # pylint: disable=star-args
+
+
+def replay(game, records):
+    """
+    Replay journal records on top of a game. Actions are journaled before
+    they run, so an action that failed (after changing the game) fails the
+    same way when it's replayed. Records that fail are logged and skipped.
+    Returns the number of records that were replayed without failing.
+    """
+
+    count = 0
+    for record in records:
+        try:
+            kind = record[0]
+            if kind == 'add_player':
+                game.add_player()
+            elif kind == 'set_up':
+                game.set_up()
+            elif kind == 'action':
+                replay_action(game, *record[1:])
+            else:
+                raise ValueError("Unknown journal record %s" % kind)
+        except Exception:  # pylint: disable=broad-except
+            logging.exception("Could not replay journal record %s", record)
+            continue
+        count += 1
+    # Clients will get the whole game state, so nobody needs these.
+    game.flush_all_transitions()
+    return count
+
+
+def read_journal(path):
+    """
+    Read all of the complete records in a journal.
+    """
+
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'rb') as journal_file:
+        for line in journal_file:
+            if not line.endswith('\n'):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+class GameJournal(object):
+
+    """
+    The journal of a single game. Records are handed to the store to be
+    written, and once snapshot_interval records have been written since the
+    last snapshot a new snapshot is taken.
+    """
+
+    def __init__(self, store, game_id, generation=0, records=0):
+        self.store = store
+        self.game_id = game_id
+        self.generation = generation
+        self.records = records
+
+    def record(self, record):
+        """
+        Record something that is about to happen to the game.
+        """
+
+        self.records += 1
+        self.store.append(self.store.journal_path(self.game_id,
+                                                  self.generation),
+                          json.dumps(record) + '\n')
+
+    def checkpoint(self, game):
+        """
+        Called after each journaled change to the game. Takes a snapshot if
+        the journal has gotten long enough.
+        """
+
+        if self.records >= self.store.snapshot_interval:
+            self.snapshot(game)
+
+    def snapshot(self, game, saved=None):
+        """
+        Snapshot the game and start a new journal. saved is passed on to
+        GameStore.write_snapshot.
+        """
+
+        self.generation += 1
+        self.records = 0
+        self.store.write_snapshot(self.game_id, self.generation,
+                                  dump_snapshot(game, self.generation), saved)
+
+
+class GameStore(object):
+
+    """
+    Stores games in a directory. Each game has a snapshot,
+    <game_id>.snapshot, and a journal, <game_id>.<generation>.journal.
+    Snapshots are written to a temporary file and renamed into place, and the
+    journals of older generations are only deleted after that.
+
+    If sync is False the store never calls fsync (which is faster, but a crash
+    of the machine can lose the most recent changes). If journaling is False
+    games aren't persisted as they change, the store only holds the snapshots
+    it is asked to write (see deckr.core.hibernation).
+
+    call_from_thread is used to hand results from the writer thread back to
+    the thread the games run on (the reactor's, by default).
+    """
+
+    def __init__(self, directory, snapshot_interval=100, sync=True,
+                 journaling=True, call_from_thread=None):
+        # pylint: disable=too-many-arguments
+        if call_from_thread is None:
+            from twisted.internet import reactor
+            call_from_thread = reactor.callFromThread
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.sync = sync
+        self.journaling = journaling
+        self.call_from_thread = call_from_thread
+        self.queue = Queue()
+        self.files = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.writer = threading.Thread(target=self.write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def snapshot_path(self, game_id):
+        """
+        Get the path of a game's snapshot.
+        """
+
+        return os.path.join(self.directory, '%s.snapshot' % game_id)
+
+    def journal_path(self, game_id, generation):
+        """
+        Get the path of one of a game's journals.
+        """
+
+        return os.path.join(self.directory,
+                            '%s.%d.journal' % (game_id, generation))
+
+    def game_ids(self):
+        """
+        Get the ids of all of the stored games.
+        """
+
+        return [int(filename[:-len('.snapshot')])
+                for filename in os.listdir(self.directory)
+                if filename.endswith('.snapshot')]
+
+    def attach(self, game, game_id):
+        """
+        Start persisting a game. This takes an initial snapshot.
+        """
+
+        if not self.journaling:
+            return
+        game.journal = GameJournal(self, game_id)
+        game.journal.snapshot(game)
+
+    def open(self, game_id):
+        """
+        Open a game's snapshot (without restoring the game).
+        """
+
+        return Snapshot.open(self.snapshot_path(game_id))
+
+    def load(self, game_id, snapshot=None, find_global=None):
+        """
+        Load a stored game, replaying its journal. The game is persisted from
+        then on. snapshot can be the game's already opened snapshot.
+        find_global is passed on to Snapshot.restore.
+        """
+
+        if snapshot is None:
+            snapshot = self.open(game_id)
+        game = snapshot.restore(find_global)
+        generation = snapshot.generation
+        records = read_journal(self.journal_path(game_id, generation))
+        count = replay(game, records)
+        if count < len(records):
+            logging.warning("Skipped %d journal records of game %s",
+                            len(records) - count, game_id)
+        if self.journaling:
+            game.journal = GameJournal(self, game_id, generation, count)
+            path = self.journal_path(game_id, generation)
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                # Start over with a clean journal (without any partial
+                # records).
+                game.journal.snapshot(game)
+        return game
+
+    def save(self, game, game_id):
+        """
+        Snapshot a game right away. Returns a Deferred that fires (through
+        call_from_thread) once the snapshot has been written, or fails if it
+        couldn't be.
+        """
+
+        saved = Deferred()
+        if game.journal is not None:
+            game.journal.snapshot(game, saved)
+        else:
+            self.write_snapshot(game_id, 0, dump_snapshot(game, 0), saved)
+        return saved
+
+    def remove(self, game_id):
+        """
+        Delete everything stored for a game.
+        """
+
+        self.queue.put(('remove', game_id, None))
+
+    def append(self, path, data):
+        """
+        Append data to a file (in the background).
+        """
+
+        self.queue.put(('append', path, data))
+
+    def write_snapshot(self, game_id, generation, data, saved=None):
+        """
+        Write a snapshot (in the background). If saved (a Deferred) is given
+        it is fired through call_from_thread once the snapshot has been
+        written.
+        """
+
+        self.queue.put(('snapshot', game_id, (generation, data, saved)))
+
+    def flush(self):
+        """
+        Wait until everything so far has been written.
+        """
+
+        done = threading.Event()
+        self.queue.put(('flush', None, done))
+        done.wait()
+
+    def close(self):
+        """
+        Write everything that's left and stop the writer.
+        """
+
+        self.queue.put(('close', None, None))
+        self.writer.join()
+
+    ##################
+    # Writer thread  #
+    ##################
+
+    def write_loop(self):
+        """
+        Write everything in the queue until the store is closed.
+        """
+
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get())
+            running, saved, events = self.write_batch(batch)
+            for fire, result in saved:
+                self.call_from_thread(fire, result)
+            for event in events:
+                event.set()
+        for journal_file in self.files.values():
+            journal_file.close()
+
+    def write_batch(self, batch):
+        """
+        Write a batch of items from the queue, syncing each journal once.
+        Returns whether the store is still open, the (callback, result)
+        pairs of the snapshots that were written and the flush events that
+        can be set.
+        """
+
+        running = True
+        dirty = set()
+        events = []
+        saved = []
+        for kind, key, value in batch:
+            try:
+                if kind == 'append':
+                    self.open_file(key).write(value)
+                    dirty.add(key)
+                elif kind == 'snapshot':
+                    self.commit(dirty)
+                    dirty.clear()
+                    generation, data, deferred = value
+                    self.store_snapshot(key, generation, data)
+                    if deferred is not None:
+                        saved.append((deferred.callback, key))
+                elif kind == 'remove':
+                    self.remove_files(key)
+                    dirty = set(path for path in dirty
+                                if path in self.files)
+                elif kind == 'flush':
+                    events.append(value)
+                elif kind == 'close':
+                    running = False
+            except (IOError, OSError):
+                logging.exception("Could not write %s", key)
+                if kind == 'snapshot' and value[2] is not None:
+                    saved.append((value[2].errback, IOError(
+                        "Could not write the snapshot of game %s" % key)))
+        self.commit(dirty)
+        return running, saved, events
+
+    def open_file(self, path):
+        """
+        Get an open journal.
+        """
+
+        journal_file = self.files.get(path)
+        if journal_file is None:
+            journal_file = open(path, 'ab')
+            self.files[path] = journal_file
+        return journal_file
+
+    def commit(self, paths):
+        """
+        Flush (and sync) the given journals.
+        """
+
+        for path in paths:
+            journal_file = self.files[path]
+            journal_file.flush()
+            if self.sync:
+                os.fsync(journal_file.fileno())
+
+    def store_snapshot(self, game_id, generation, data):
+        """
+        Write a snapshot and delete the journals it replaces.
+        """
+
+        path = self.snapshot_path(game_id)
+        with open(path + '.tmp', 'wb') as snapshot_file:
+            snapshot_file.write(data)
+            snapshot_file.flush()
+            if self.sync:
+                os.fsync(snapshot_file.fileno())
+        os.rename(path + '.tmp', path)
+        if generation > 0:
+            self.close_file(self.journal_path(game_id, generation - 1))
+
+    def remove_files(self, game_id):
+        """
+        Delete a game's snapshot and journals.
+        """
+
+        prefix = '%s.' % game_id
+        for filename in os.listdir(self.directory):
+            if filename.startswith(prefix):
+                path = os.path.join(self.directory, filename)
+                if path in self.files:
+                    self.files.pop(path).close()
+                os.remove(path)
+
+    def close_file(self, path):
+        """
+        Close and delete a journal if it exists.
+        """
+
+        if path in self.files:
+            self.files.pop(path).close()
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,304 @@
+"""
+This module contains a headless runner for playing games in process, without
+a server (i.e. to balance test a game definition). Players are driven by
+policies, and transitions are only recorded when asked for.
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import multiprocessing
+import random
+import struct
+import time
+from collections import Counter
+
+from deckr.core.game import get_actions
+from deckr.core.game_definition import GameDefinition
+
+
+def derive_seed(seed, index):
+    """
+    Derive the seed of game number index of a run from the run's master
+    seed. Seeds don't depend on how the games are split up.
+    """
+
+    digest = hashlib.sha1('%d:%d' % (seed, index)).digest()
+    return struct.unpack('>Q', digest[:8])[0]
+
+
+class SimulationResult(object):
+
+    """
+    Totals for a batch of simulated games: the number of games, finished
+    games (games that were over) and actions, the wins of each seat (see
+    Game.winners), a histogram of game lengths (in actions) and the number
+    of times each action was taken. Results of separate batches can be
+    merged, in any order.
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.finished = 0
+        self.actions = 0
+        self.wins = Counter()
+        self.lengths = Counter()
+        self.action_counts = Counter()
+
+    def add(self, game, actions, taken):
+        """
+        Add a played game.
+        """
+
+        self.games += 1
+        self.actions += actions
+        self.lengths[actions] += 1
+        self.action_counts.update(taken)
+        if game.is_over():
+            self.finished += 1
+            for player in game.winners():
+                self.wins[game.players.index(player)] += 1
+
+    def merge(self, other):
+        """
+        Add the totals of another result to this one.
+        """
+
+        self.games += other.games
+        self.finished += other.finished
+        self.actions += other.actions
+        self.wins.update(other.wins)
+        self.lengths.update(other.lengths)
+        self.action_counts.update(other.action_counts)
+        return self
+
+    def report(self, seed, elapsed):
+        """
+        Summarize the result of a run with the given master seed that took
+        elapsed seconds.
+        """
+
+        games = self.games or 1
+        return {'seed': seed, 'games': self.games, 'finished': self.finished,
+                'actions': self.actions, 'elapsed': elapsed,
+                'games_per_second': self.games / elapsed if elapsed else 0.0,
+                'actions_per_second': (self.actions / elapsed if elapsed
+                                       else 0.0),
+                'win_rates': {seat: float(wins) / games
+                              for seat, wins in self.wins.items()},
+                'lengths': dict(self.lengths),
+                'action_counts': dict(self.action_counts)}
+
+
+class RandomPolicy(object):
+
+    """
+    Picks one of the legal actions at random. The game's random number
+    generator is used, so a playout can be replayed from the game's seed.
+    """
+
+    def choose(self, game, player, actions):
+        """
+        Pick one of actions.
+        """
+
+        # Other policies look at the player (and keep state of their own).
+        # pylint: disable=no-self-use,unused-argument
+
+        return game.random.choice(actions)
+
+
+class Simulation(object):
+
+    """
+    Plays games of a GameDefinition. policies holds the policy of each player
+    (so it also sets the number of players). A policy is anything with a
+    choose(game, player, actions) method that returns one of actions (see
+    Game.legal_actions).
+
+    The players take turns (in order) choosing an action, and players without
+    any legal actions are skipped. A game ends once it is over (see
+    Game.is_over), once nobody has a legal action or after max_actions
+    actions. Transitions are only recorded if record_transitions is True.
+
+    Actions are run through their action wrappers, just like a client's
+    would be (so their restrictions are checked again). The games are never
+    persisted, and games with a journal must not be played this way: every
+    simulated action would be journaled.
+    """
+
+    def __init__(self, game_definition, policies, max_actions=10000,
+                 record_transitions=False):
+        self.game_definition = game_definition
+        self.policies = policies
+        self.max_actions = max_actions
+        self.record_transitions = record_transitions
+
+    def create_game(self, seed=None):
+        """
+        Create a game, add the players and start it.
+        """
+
+        game = self.game_definition.create_instance()
+        if not self.record_transitions:
+            game.record_transitions = False
+            game.flush_all_transitions()
+            game.transition_log.clear()
+        game.seed(seed)
+        players = [game.add_player() for _ in self.policies]
+        game.start()
+        return game, players
+
+    def play(self, seed=None, taken=None):
+        """
+        Play a single game. Returns the game and the number of actions that
+        were taken. If taken is given (a Counter) the number of times each
+        action was taken is added to it.
+        """
+
+        game, players = self.create_game(seed)
+        table = get_actions(type(game))
+        seats = zip(players, self.policies)
+        actions = 0
+        while actions < self.max_actions and not game.is_over():
+            moved = False
+            for player, policy in seats:
+                legal = game.legal_actions(player)
+                if not legal:
+                    continue
+                arguments = dict(policy.choose(game, player, legal))
+                name = arguments.pop('action')
+                action = table[name]
+                if action.takes_player:
+                    arguments['player'] = player
+                action.function(game, **arguments)  # pylint: disable=star-args
+                actions += 1
+                moved = True
+                if taken is not None:
+                    taken[name] += 1
+                if actions >= self.max_actions or game.is_over():
+                    break
+            if not moved:
+                break
+        return game, actions
+
+    def play_batch(self, seed, start, count):
+        """
+        Play games start to start + count of the run with the given master
+        seed (see derive_seed). Returns a SimulationResult.
+        """
+
+        result = SimulationResult()
+        for index in range(start, start + count):
+            taken = Counter()
+            game, actions = self.play(derive_seed(seed, index), taken)
+            result.add(game, actions, taken)
+        return result
+
+    def run(self, games, seed=None):
+        """
+        Play a number of games in this process. Each game's seed is derived
+        from seed, so the whole run can be repeated. Returns a summary (see
+        SimulationResult.report).
+        """
+
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        start = time.time()
+        result = self.play_batch(seed, 0, games)
+        return result.report(seed, time.time() - start)
+
+    def run_parallel(self, games, seed=None, processes=None,
+                     chunk_size=None):
+        """
+        The same as run, but the games are farmed out to a pool of processes
+        (one per core by default) in chunks of chunk_size games. Results are
+        merged as chunks finish. Games get the same seeds as they would in
+        run, so the results don't depend on the number of processes.
+        """
+
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if chunk_size is None:
+            chunk_size = max(1, min(1000, games // (processes * 4)))
+        chunks = ((seed, first, min(chunk_size, games - first))
+                  for first in range(0, games, chunk_size))
+
+        start = time.time()
+        result = SimulationResult()
+        pool = multiprocessing.Pool(processes, _start_worker, (self,))
+        try:
+            for chunk in pool.imap_unordered(_play_chunk, chunks):
+                result.merge(chunk)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        return result.report(seed, time.time() - start)
+
+
+# The simulation a pool worker is running (see Simulation.run_parallel).
+WORKER_SIMULATION = None
+
+
+def _start_worker(simulation):
+    """
+    Set up a pool worker. Workers are forked, so the simulation (and its game
+    definition) doesn't need to be pickled.
+    """
+
+    global WORKER_SIMULATION  # pylint: disable=global-statement
+    WORKER_SIMULATION = simulation
+
+
+def _play_chunk(chunk):
+    """
+    Play a chunk of games in a pool worker.
+    """
+
+    return WORKER_SIMULATION.play_batch(*chunk)  # pylint: disable=star-args
+
+
+def main():
+    """
+    Simulate games of a game definition with random players.
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Play games headlessly with random players.")
+    parser.add_argument('game', help="The game definition's directory.")
+    parser.add_argument('--players', type=int, default=2)
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--max-actions', type=int, default=10000)
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Play games in this many processes (0 for one "
+                        "per core).")
+    args = parser.parse_args()
+
+    game_definition = GameDefinition()
+    game_definition.load(args.game)
+    simulation = Simulation(game_definition,
+                            [RandomPolicy() for _ in range(args.players)],
+                            max_actions=args.max_actions)
+    if args.processes == 1:
+        result = simulation.run(args.games, args.seed)
+    else:
+        result = simulation.run_parallel(args.games, args.seed,
+                                         args.processes or None)
+    print("%d games (%d finished), %d actions in %.2fs (seed %d)" % (
+        result['games'], result['finished'], result['actions'],
+        result['elapsed'], result['seed']))
+    print("%.0f games/s, %.0f actions/s" % (result['games_per_second'],
+                                            result['actions_per_second']))
+    for seat, rate in sorted(result['win_rates'].items()):
+        print("player %d won %.1f%%" % (seat, rate * 100))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+This module contains the binary format of game snapshots. Opening a
+snapshot only reads its header, so recovered games cost next to nothing
+(not even a file descriptor) until they are restored.
+
+A snapshot is made up of:
+
+* A header: the magic string, the format version, the journal generation
+  and the game's sequence number.
+* The game itself, pickled. This is only read when the game is restored.
+"""
+
+import cPickle as pickle
+import struct
+from cStringIO import StringIO
+
+MAGIC = 'DECKRSNP'
+VERSION = 2
+
+HEADER = struct.Struct('>8sBQQ')
+
+
+def dump_snapshot(game, generation):
+    """
+    Build a snapshot of a game. The game's journal isn't included.
+    """
+
+    journal = game.journal
+    game.journal = None
+    try:
+        state = pickle.dumps(game, pickle.HIGHEST_PROTOCOL)
+    finally:
+        game.journal = journal
+    return HEADER.pack(MAGIC, VERSION, generation, game.sequence) + state
+
+
+class Snapshot(object):
+
+    """
+    A read only view of a snapshot. data holds at least the header, and the
+    rest of the snapshot is read from data or, for an opened snapshot, from
+    the file at path when the game is restored.
+    """
+
+    def __init__(self, data, path=None):
+        if len(data) < HEADER.size:
+            raise ValueError("Not a version %d snapshot" % VERSION)
+        self.data = data
+        self.path = path
+        magic, version, self.generation, self.sequence = HEADER.unpack_from(
+            data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a version %d snapshot" % VERSION)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Read a snapshot file's header. The file isn't kept open.
+        """
+
+        with open(path, 'rb') as snapshot_file:
+            return cls(snapshot_file.read(HEADER.size), path)
+
+    def restore(self, find_global=None):
+        """
+        Build the game. If find_global is given it is used to look up the
+        classes in the pickle (see cPickle.Unpickler.find_global).
+        """
+
+        if self.path is None:
+            return self.load(StringIO(self.data[HEADER.size:]), find_global)
+        with open(self.path, 'rb') as snapshot_file:
+            snapshot_file.seek(HEADER.size)
+            return self.load(snapshot_file, find_global)
+
+    @staticmethod
+    def load(state_file, find_global):
+        """
+        Unpickle the game from a file.
+        """
+
+        unpickler = pickle.Unpickler(state_file)
+        if find_global is not None:
+            unpickler.find_global = find_global
+        return unpickler.load()
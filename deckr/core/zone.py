@@ -3,29 +3,98 @@ This file provides all the code related to zones.
 """
 
 import copy
+import random
 
 from deckr.core.game_object import GameObject
 
 
+class _Removed(object):
+
+    """
+    The type of _REMOVED. Pickles by reference, so tombstones are still
+    tombstones after a zone has been unpickled.
+    """
+
+    __slots__ = ()
+
+    def __reduce__(self):
+        return '_REMOVED'
+
+
+# Marks a slot in a zone whose object has been removed.
+_REMOVED = _Removed()
+
+# Whether each class defines its own equality (see compares_by_value).
+_VALUE_CLASSES = {}
+
+
+def compares_by_value(klass):
+    """
+    Check whether instances of klass can be equal to objects other than
+    themselves, i.e. whether klass (or a base class) defines __eq__ or
+    __cmp__. This is computed once per class.
+    """
+
+    result = _VALUE_CLASSES.get(klass)
+    if result is None:
+        result = any('__eq__' in vars(base) or '__cmp__' in vars(base)
+                     for base in getattr(klass, '__mro__', (klass,))
+                     if base is not object)
+        _VALUE_CLASSES[klass] = result
+    return result
+
+
 class Zone(GameObject):
 
     """
     A zone acts very similarly to a list, but it includes builtin functionality
     for handling game objects.
+
+    Objects are kept in a list of slots along with an index from each object
+    (by identity) to the slots it occupies. Removing an object from the middle
+    of the zone just leaves a tombstone in its slot, and the slots are
+    compacted once tombstones make up half the zone. This makes containment
+    checks and removal O(1) (amortized) instead of a scan over the zone.
+    Objects are looked up by identity first. Only if that fails, and the
+    object's class defines its own equality (like PlayingCard), is the zone
+    scanned for an equal object, so membership is still by equality.
+
+    While there are tombstones, positions (index and []) are worked out with
+    a Fenwick tree counting the tombstones before each slot. It is built on
+    the first positional lookup after a removal and kept up to date until the
+    zone is next compacted, so lookups are O(log n) rather than a rebuild.
+
+    If membership_listener is set, its objects_added(zone, objs) and
+    objects_removed(zone, objs) methods are called whenever objects enter or
+    leave the zone (see CardTable.bind_zone).
     """
 
     game_object_type = 'Zone'
+    game_attribute_schema = ('name', 'owner')
+    game_attribute_references = ('owner',)
+    membership_listener = None
 
     def __init__(self, *args, **kwargs):
         super(Zone, self).__init__(*args, **kwargs)
         self._zone = []
+        self._positions = {}
+        self._removed = 0
+        # The Fenwick tree over the tombstones (1 based), or None if it hasn't
+        # been built.
+        self._tombstones = None
 
     def push(self, obj):
         """
         Push a game object into this zone.
         """
 
+        self._index_add(obj, len(self._zone))
         self._zone.append(obj)
+        if self._tombstones is not None:
+            self._tree_append()
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_added(self, [obj])
         if self.game is not None:
             self.game.add_transition({'update_type': 'add',
                                       'zone': self.game_id,
@@ -37,11 +106,17 @@ class Zone(GameObject):
         such element exists.
         """
 
+        self._strip_removed()
         try:
             obj = self._zone.pop()
         except IndexError:
             return None
+        self._index_discard(obj, len(self._zone))
+        self._truncate_tree()
 
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_removed(self, [obj])
         if self.game is not None:
             self.game.add_transition({'update_type': 'remove',
                                       'zone': self.game_id,
@@ -55,24 +130,184 @@ class Zone(GameObject):
 
         self.push(obj)
 
+    def insert(self, index, obj):
+        """
+        Insert an object at the given position (0 is the bottom of the zone).
+        """
+
+        self._compact()
+        size = len(self._zone)
+        if index < 0:
+            index = max(size + index, 0)
+        index = min(index, size)
+        self._zone.insert(index, obj)
+        self._reindex()
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_added(self, [obj])
+        if self.game is not None:
+            self.game.add_transition({'update_type': 'add',
+                                      'zone': self.game_id,
+                                      'game_object': obj.game_id,
+                                      'index': index})
+
     def remove(self, obj):
         """
         Remove a specificed object from the zone.
         """
 
-        try:
-            self._zone.remove(obj)
-        except ValueError:
+        obj = self._discard(obj)
+        if obj is None:
             return
 
+        self.version += 1
         if self.game is not None:
             self.game.add_transition({'update_type': 'remove',
                                       'zone': self.game_id,
                                       'game_object': obj.game_id})
 
+    def index(self, obj):
+        """
+        Get the position of an object in the zone. Raises a ValueError if the
+        object isn't in the zone.
+        """
+
+        _, slot = self._find(obj)
+        if slot is None:
+            raise ValueError("Object is not in the zone")
+        if self._removed:
+            slot -= self._removed_before(slot)
+        return slot
+
+    def extend(self, objs):
+        """
+        Push a list of objects onto the zone. Unlike pushing them one at a
+        time this only produces a single move_many transition.
+        """
+
+        objs = list(objs)
+        if not objs:
+            return
+        self._append_all(objs)
+        self._add_move_many_transition(objs, False)
+
+    def replace(self, objs):
+        """
+        Replace everything in this zone with a list of objects. Produces a
+        single move_many transition.
+        """
+
+        objs = list(objs)
+        if self.membership_listener is not None:
+            self.membership_listener.objects_removed(self, list(self))
+        self._zone = objs
+        self._removed = 0
+        self._reindex()
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_added(self, objs)
+        self._add_move_many_transition(objs, True)
+
+    def move_many(self, objs, target_zone):
+        """
+        Move a list of objects from this zone to the top of target_zone.
+        Objects that aren't in this zone are skipped. Produces a single
+        move_many transition.
+        """
+
+        target_zone.extend(self.discard_many(objs))
+
+    def discard_many(self, objs):
+        """
+        Take a list of objects out of this zone without producing a
+        transition, for callers that produce one that implies their removal
+        (such as a move_many into another zone). Objects that aren't in this
+        zone are skipped. Returns the objects that were taken out.
+        """
+
+        moved = [obj for obj in map(self._discard, objs) if obj is not None]
+        if moved:
+            self.version += 1
+        return moved
+
+    def move_all_to(self, target_zone):
+        """
+        Move everything in this zone to the top of target_zone. Produces a
+        single move_many transition.
+        """
+
+        objs = list(self)
+        self.clear()
+        target_zone.extend(objs)
+
+    def shuffle(self, rng=None):
+        """
+        Shuffle the zone in place. rng should be a random.Random instance and
+        defaults to the game's (seeded) random number generator. Produces a
+        single move_many transition with the new order.
+        """
+
+        self._compact()
+        self._get_rng(rng).shuffle(self._zone)
+        self._reindex()
+        self.version += 1
+        self._add_move_many_transition(self._zone, True)
+
+    def cut(self, index=None, rng=None):
+        """
+        Cut the zone: the bottom index objects are moved to the top. If index
+        is None a random cut is made using rng (which defaults to the game's
+        random number generator). Produces a single move_many transition.
+        """
+
+        self._compact()
+        if index is None:
+            if len(self._zone) < 2:
+                return
+            index = self._get_rng(rng).randint(1, len(self._zone) - 1)
+        self._zone = self._zone[index:] + self._zone[:index]
+        self._reindex()
+        self.version += 1
+        self._add_move_many_transition(self._zone, True)
+
+    def draw(self, count, target_zone):
+        """
+        Draw count objects off the top of this zone onto target_zone (as if
+        they were popped and pushed one at a time). If there aren't enough
+        objects everything is drawn. Produces a single move_many transition.
+        Returns the drawn objects.
+        """
+
+        drawn = self._take_top(count)
+        target_zone.extend(drawn)
+        return drawn
+
+    def deal(self, count, target_zones):
+        """
+        Deal count objects off the top of this zone to each of the target
+        zones, round robin. Stops early if this zone runs out. Produces a
+        single deal transition. Returns a list of the objects dealt to each
+        zone.
+        """
+
+        drawn = self._take_top(count * len(target_zones))
+        hands = [drawn[i::len(target_zones)]
+                 for i in range(len(target_zones))]
+        for zone, hand in zip(target_zones, hands):
+            zone._append_all(hand)  # pylint: disable=protected-access
+        if self.game is not None and drawn:
+            self.game.add_transition({
+                'update_type': 'deal',
+                'zone': self.game_id,
+                'deals': [{'zone': zone.game_id,
+                           'game_objects': [obj.game_id for obj in hand]}
+                          for zone, hand in zip(target_zones, hands)]})
+        return hands
+
     def set(self, objs):
         """
-        Takes in a list and sets the current inner zone to that list.
+        Takes in a list and sets the current inner zone to that list. This
+        produces an add transition per object, replace should be preferred.
         """
 
         self.clear()
@@ -84,56 +319,357 @@ class Zone(GameObject):
         Completely clear out everything in this zone.
         """
 
-        while len(self._zone) != 0:
-            self._zone.pop()
+        if self.membership_listener is not None:
+            removed = list(self)
+        self._zone = []
+        self._positions = {}
+        self._removed = 0
+        self._tombstones = None
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_removed(self, removed)
 
     def transfer(self, target_zone):
         """
-        Send all of the objects in this zone to another zone.
+        Send all of the objects in this zone to another zone. This produces an
+        add transition per object, move_all_to should be preferred.
         """
 
-        target_zone.set(self._zone)
+        target_zone.set(list(self))
         self.clear()
 
-    def serialize(self, player=None):
+    def serialize_public(self, found=None):
         """
         This will include an 'objects' element in the serialized result that
         contains a list of all the game_ids.
         """
 
-        result = super(Zone, self).serialize(player)
-        result['objects'] = [x.game_id for x in self._zone]
+        result = super(Zone, self).serialize_public(found)
+        objects = list(self)
+        if found is not None:
+            found.extend(objects)
+        result['objects'] = [x.game_id for x in objects]
         return result
 
+    def _get_rng(self, rng):
+        """
+        Get the random number generator to use for an operation.
+        """
+
+        if rng is not None:
+            return rng
+        if self.game is not None:
+            return self.game.random
+        return random.Random()
+
+    def _take_top(self, count):
+        """
+        Take up to count objects off the top of the zone without producing a
+        transition. Returns them in the order they would have been popped.
+        """
+
+        zone = self._zone
+        taken = []
+        while len(taken) < count and zone:
+            obj = zone.pop()
+            if obj is _REMOVED:
+                self._removed -= 1
+                continue
+            self._index_discard(obj, len(zone))
+            taken.append(obj)
+        if not taken:
+            return taken
+        self._truncate_tree()
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_removed(self, taken)
+        return taken
+
+    def _append_all(self, objs):
+        """
+        Append a list of objects without producing a transition.
+        """
+
+        for obj in objs:
+            self._index_add(obj, len(self._zone))
+            self._zone.append(obj)
+            if self._tombstones is not None:
+                self._tree_append()
+        self.version += 1
+        if self.membership_listener is not None:
+            self.membership_listener.objects_added(self, objs)
+
+    def _add_move_many_transition(self, objs, replace):
+        """
+        Tell the game that objs were moved to the top of this zone (and are
+        implicitly removed from wherever they were before). If replace is
+        True they replace everything that was in the zone.
+        """
+
+        if self.game is not None:
+            self.game.add_transition({'update_type': 'move_many',
+                                      'zone': self.game_id,
+                                      'game_objects': [obj.game_id for obj
+                                                       in objs],
+                                      'replace': replace})
+
+    def _discard(self, obj):
+        """
+        Take the first occurrence of obj (see _find) out of the zone without
+        producing a transition. Returns the object that was taken out, or
+        None if obj isn't in the zone.
+        """
+
+        obj, slot = self._find(obj)
+        if slot is None:
+            return None
+        self._index_discard(obj, slot)
+        if slot == len(self._zone) - 1:
+            self._zone.pop()
+            self._strip_removed()
+        else:
+            self._zone[slot] = _REMOVED
+            self._removed += 1
+            if self._removed * 2 > len(self._zone):
+                self._compact()
+            elif self._tombstones is not None:
+                self._tree_add(slot + 1)
+        if self.membership_listener is not None:
+            self.membership_listener.objects_removed(self, [obj])
+        return obj
+
+    def _find(self, obj):
+        """
+        Find obj in the zone, by identity or failing that by equality.
+        Returns the object in the zone and its first slot, or (None, None)
+        if there is no such object.
+        """
+
+        slot = self._first_slot(obj)
+        if slot is not None:
+            return obj, slot
+        if compares_by_value(type(obj)):
+            for slot, member in enumerate(self._zone):
+                if member is not _REMOVED and obj == member:
+                    return member, slot
+        return None, None
+
+    # Index maintenance. An object that is in the zone more than once maps to
+    # a sorted list of its slots, otherwise it maps straight to its slot.
+    def _index_add(self, obj, slot):
+        """
+        Record that obj occupies the given slot (which must be after any slot
+        it already occupies).
+        """
+
+        key = id(obj)
+        current = self._positions.get(key)
+        if current is None:
+            self._positions[key] = slot
+        elif isinstance(current, list):
+            current.append(slot)
+        else:
+            self._positions[key] = [current, slot]
+
+    def _index_discard(self, obj, slot):
+        """
+        Forget that obj occupies the given slot.
+        """
+
+        key = id(obj)
+        current = self._positions[key]
+        if isinstance(current, list):
+            current.remove(slot)
+            if len(current) == 1:
+                self._positions[key] = current[0]
+        else:
+            del self._positions[key]
+
+    def _first_slot(self, obj):
+        """
+        Get the first slot the object occupies, or None if it isn't in the
+        zone.
+        """
+
+        current = self._positions.get(id(obj))
+        if isinstance(current, list):
+            return current[0]
+        return current
+
+    def _strip_removed(self):
+        """
+        Drop any tombstones at the top of the zone.
+        """
+
+        while self._zone and self._zone[-1] is _REMOVED:
+            self._zone.pop()
+            self._removed -= 1
+        self._truncate_tree()
+
+    def _compact(self):
+        """
+        Get rid of all the tombstones.
+        """
+
+        if self._removed:
+            self._zone = [obj for obj in self._zone if obj is not _REMOVED]
+            self._removed = 0
+            self._reindex()
+
+    def _reindex(self):
+        """
+        Rebuild the index from scratch.
+        """
+
+        self._positions = {}
+        self._tombstones = None
+        for slot, obj in enumerate(self._zone):
+            if obj is not _REMOVED:
+                self._index_add(obj, slot)
+
+    # The tombstone tree. Node i covers the (i & -i) slots ending at slot i
+    # (1 based) and holds the number of tombstones in them.
+    def _build_tree(self):
+        """
+        Build the tombstone tree in O(n).
+        """
+
+        size = len(self._zone)
+        tree = [0] * (size + 1)
+        for slot, obj in enumerate(self._zone):
+            if obj is _REMOVED:
+                tree[slot + 1] += 1
+        for node in range(1, size + 1):
+            parent = node + (node & -node)
+            if parent <= size:
+                tree[parent] += tree[node]
+        self._tombstones = tree
+        return tree
+
+    def _tree_prefix(self, count):
+        """
+        Count the tombstones in the first count slots.
+        """
+
+        tree = self._tombstones
+        total = 0
+        while count > 0:
+            total += tree[count]
+            count -= count & -count
+        return total
+
+    def _tree_add(self, node):
+        """
+        Record a new tombstone in (1 based) slot node.
+        """
+
+        tree = self._tombstones
+        size = len(tree) - 1
+        while node <= size:
+            tree[node] += 1
+            node += node & -node
+
+    def _tree_append(self):
+        """
+        Extend the tree to cover a live object that was just appended.
+        """
+
+        node = len(self._zone)
+        self._tombstones.append(self._tree_prefix(node - 1) -
+                                self._tree_prefix(node - (node & -node)))
+
+    def _truncate_tree(self):
+        """
+        Drop the nodes for slots that were taken off the end of the zone. No
+        other node covers them, so the rest of the tree is still correct.
+        """
+
+        if self._tombstones is not None:
+            del self._tombstones[len(self._zone) + 1:]
+
+    def _removed_before(self, slot):
+        """
+        Count the tombstones below a slot.
+        """
+
+        if self._tombstones is None:
+            self._build_tree()
+        return self._tree_prefix(slot)
+
+    def _live_slot(self, index):
+        """
+        Find the slot of the object at a position (0 <= index < len(self)).
+        """
+
+        tree = self._tombstones
+        if tree is None:
+            tree = self._build_tree()
+        size = len(tree) - 1
+        node = 0
+        remaining = index + 1
+        step = 1
+        while step * 2 <= size:
+            step *= 2
+        while step:
+            child = node + step
+            if child <= size and step - tree[child] < remaining:
+                node = child
+                remaining -= step - tree[child]
+            step //= 2
+        return node
+
     # Builtins
+    def __setstate__(self, state):
+        """
+        The index is keyed by object identity, so it has to be rebuilt after
+        unpickling.
+        """
+
+        attributes, slots = state
+        self.__dict__.update(attributes)
+        for name, value in slots.items():
+            setattr(self, name, value)
+        self._reindex()
+
     def __iter__(self):
         """
         Provide an iterator for the zone.
         """
 
         for obj in self._zone:
-            yield obj
+            if obj is not _REMOVED:
+                yield obj
 
     def __contains__(self, obj):
         """
         Check for containment in the zone.
         """
 
-        return obj in self._zone
+        return (id(obj) in self._positions or
+                self._find(obj)[1] is not None)
 
     def __getitem__(self, index):
         """
         Get an item at the specified index.
         """
 
-        return self._zone[index]
+        if not self._removed:
+            return self._zone[index]
+        if isinstance(index, slice):
+            return list(self)[index]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("zone index out of range")
+        return self._zone[self._live_slot(index)]
 
     def __len__(self):
         """
         Proxy to the underlying _zone object.
         """
 
-        return len(self._zone)
+        return len(self._zone) - self._removed
 
 
 class HasZones(object):
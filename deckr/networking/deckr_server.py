@@ -2,14 +2,25 @@
 This module contains the code for running the deckr server.
 """
 
-import json
 import logging
 
+from twisted.internet.interfaces import IPushProducer
 from twisted.internet.protocol import Factory
+from twisted.internet.task import LoopingCall
 from twisted.protocols.basic import LineReceiver
+from zope.interface import implementer
 
+from deckr.core.exceptions import GameLoadError
+from deckr.core.game import get_actions, merge_transitions
 from deckr.core.game_master import GameMaster
-from deckr.core.game_object import GameObject
+from deckr.core.game_object import clean_game_objects
+from deckr.core.hibernation import Hibernator
+from deckr.core.persistence import GameStore
+from deckr.networking.symbols import SymbolTable
+from deckr.networking.wire import (COMPRESSED, COMPRESSIONS,
+                                   DEFAULT_WIRE_FORMAT, ENCODINGS, FRAMINGS,
+                                   JsonEncoding, LengthPrefixedFraming,
+                                   WireFormat)
 
 
 def requires_arguments(arguments):
@@ -58,24 +69,27 @@ def requires_authenticated(func):
         return func(self, payload)
     return inner
 
-def handle_argument_conversion(game, arg_types, arguments):
-    """
-    Convert a list of arguments into game objects as specified by
-    arg_types. arguments should be a dictionary of key value pairs
-    and arg_types should be a dictionary of keys to game object classes.
-    """
-
-    for arg in arg_types:
-        arguments[arg] = game.get_object(arguments[arg], arg_types[arg])
-    return arguments
-
-
+@implementer(IPushProducer)
 class DeckrProtocol(LineReceiver):
 
     """
     A simple protocol for the Deckr server.
+
+    Each connection registers itself as a producer with its transport, so it
+    finds out when the client isn't keeping up. While that's the case we stop
+    reading from the client, and once more than the factory's
+    high_water_mark bytes have been written the factory's overflow_policy
+    kicks in: either 'conflate' (stop sending updates, and send a fresh game
+    state once the client catches up) or 'disconnect'.
     """
 
+    # The connection keeps its wire format, symbol table and flow control
+    # state alongside the game it is in.
+    # pylint: disable=too-many-instance-attributes
+
+    # Messages shorter than this are never compressed.
+    compression_threshold = 512
+
     def __init__(self, factory):
         self.factory = factory
         self.game = None
@@ -83,6 +97,72 @@ class DeckrProtocol(LineReceiver):
         self.player = None
         self.game_master = factory.game_master
         self.game_room = None
+        self.batch_updates = False
+        self.wire_format = DEFAULT_WIRE_FORMAT
+        self.compression = None
+        self.symbols = None
+        self.known_symbols = 0
+        self.symbols_generation = 0
+        self.paused = False
+        self.stale = False
+        # Bytes written since the transport paused us.
+        self.buffered = 0
+        self._frame_buffer = ''
+
+    def connectionMade(self):
+        self.transport.registerProducer(self, True)
+
+    def pauseProducing(self):
+        """
+        The transport's buffer is full, so stop reading from the client
+        until it has caught up.
+        """
+
+        self.paused = True
+        self.transport.pauseProducing()
+
+    def resumeProducing(self):
+        """
+        The client has caught up. If we skipped any updates, send the whole
+        game state.
+        """
+
+        self.paused = False
+        self.buffered = 0
+        self.transport.resumeProducing()
+        if self.stale:
+            self.stale = False
+            if self.game is not None:
+                self.send_game_state()
+
+    def stopProducing(self):
+        """
+        The connection is going away.
+        """
+
+        pass
+
+    def overflowed(self):
+        """
+        Check if we have written more than the high water mark since the
+        transport paused us.
+        """
+
+        return self.paused and self.buffered > self.factory.high_water_mark
+
+    def handle_overflow(self):
+        """
+        Deal with a client that isn't keeping up with updates, according to
+        the overflow policy.
+        """
+
+        if self.factory.overflow_policy == 'disconnect':
+            logging.info("Disconnecting a slow client")
+            abort = getattr(self.transport, 'abortConnection',
+                            self.transport.loseConnection)
+            abort()
+        else:
+            self.stale = True
 
     def send(self, message_type, data):
         """
@@ -92,17 +172,64 @@ class DeckrProtocol(LineReceiver):
         payload = {key: value for key, value in data.items()}
         payload['message_type'] = message_type
         logging.debug("Sending %s", payload)
-        self.transport.write(json.dumps(payload) + '\r\n')
+        self.write_message(self.wire_format.encoding.encode(payload))
+
+    def write_message(self, data):
+        """
+        Frame (and possibly compress) a message that has already been encoded
+        with this connection's encoding and write it out.
+        """
+
+        data = self.wire_format.frame(data, self.compression)
+        if self.paused:
+            self.buffered += len(data)
+        self.transport.write(data)
 
     def broadcast_to_room(self, message_type, data):
         """
-        Broadcast a message to the room (assumes the room exists)
+        Broadcast a message to the room (assumes the room exists). The message
+        is only encoded once per encoding in use.
         """
         payload = {key: value for key, value in data.items()}
         payload['message_type'] = message_type
-        payload = json.dumps(payload) + '\r\n'
+        encoded = {}
         for connection in self.factory.game_rooms[self.game.master_game_id]:
-            connection.transport.write(payload)
+            encoding = connection.wire_format.encoding
+            if encoding.name not in encoded:
+                encoded[encoding.name] = encoding.encode(payload)
+            connection.write_message(encoded[encoding.name])
+
+    def compact(self, value):
+        """
+        Replace the symbols in value with codes from this connection's symbol
+        table, if it has one. Makes sure the client has been sent every
+        symbol in the table first.
+        """
+
+        if self.symbols is None:
+            return value
+        self.symbols.reset_if_full()
+        value = self.symbols.compact(value)
+        self.sync_symbols()
+        return value
+
+    def sync_symbols(self):
+        """
+        Send the client any symbols that have been added to its symbol table
+        since it last heard about it, or the whole table if it has been reset
+        since.
+        """
+
+        if self.symbols_generation != self.symbols.generation:
+            self.send('symbols', {'offset': 0,
+                                  'symbols': list(self.symbols.symbols)})
+            self.known_symbols = len(self.symbols)
+            self.symbols_generation = self.symbols.generation
+        elif self.known_symbols < len(self.symbols):
+            self.send('symbols',
+                      {'offset': self.known_symbols,
+                       'symbols': self.symbols.symbols[self.known_symbols:]})
+            self.known_symbols = len(self.symbols)
 
     def send_error(self, message):
         """
@@ -111,33 +238,141 @@ class DeckrProtocol(LineReceiver):
 
         self.send('error', {'message': message})
 
+    def connectionLost(self, reason=None):
+        """
+        Leave the game room (if we're in one) when the client goes away.
+        """
+
+        if self.game is not None:
+            self.leave_room()
+
     def lineReceived(self, data):
+        """
+        Process a single line (when using line framing).
+        """
+
+        self.messageReceived(data)
+
+    def rawDataReceived(self, data):
+        """
+        Process raw data (when using length prefixed framing). Splits the data
+        into frames and processes each of them.
+        """
+
+        data = self._frame_buffer + data
+        offset = 0
+        while True:
+            try:
+                flags, message, offset = LengthPrefixedFraming.read_frame(
+                    data, offset, self.MAX_LENGTH)
+            except ValueError:
+                self._frame_buffer = ''
+                self.send_error("Malformed message: Frame too long")
+                self.transport.loseConnection()
+                return
+            if message is None:
+                break
+            if flags & COMPRESSED:
+                try:
+                    if self.compression is None:
+                        raise ValueError("Compression isn't enabled")
+                    message = self.compression.decompress(message,
+                                                          self.MAX_LENGTH)
+                except ValueError:
+                    # The compression stream is unusable from here on.
+                    self._frame_buffer = ''
+                    self.send_error("Malformed message: Could not decompress")
+                    self.transport.loseConnection()
+                    return
+            self.messageReceived(message)
+            if self.wire_format.framing is not LengthPrefixedFraming:
+                # The client switched back to lines, so everything after this
+                # frame is line delimited.
+                self._frame_buffer = ''
+                self.setLineMode(data[offset:])
+                return
+        self._frame_buffer = data[offset:]
+
+    def messageReceived(self, data):  # pylint: disable=invalid-name
         """
         Process a single message. Mostly passes off to handler functions.
         """
 
-        logging.debug("Recived a message %s", data)
+        logging.debug("Recived a message %r", data)
 
+        encoding = self.wire_format.encoding
         try:
-            payload = json.loads(data)
+            payload = encoding.decode(data)
         except ValueError:
-            self.send_error("Malformed message: Could not decode JSON")
+            self.send_error("Malformed message: Could not decode %s" %
+                            encoding.label)
             return
 
-        if 'message_type' not in payload:
+        if not isinstance(payload, dict) or 'message_type' not in payload:
             self.send_error("Malformed message: missing message_type")
             return
 
         message_type = payload['message_type']
         try:
             func = getattr(self, 'handle_' + message_type)
-        except AttributeError:
+        except (AttributeError, TypeError):
             self.send_error(
                 "Invalid message type: %s" %
                 payload['message_type'])
             return
         func(payload) # Run the actual command
 
+    @requires_arguments(['encoding'])
+    def handle_set_encoding(self, payload):
+        """
+        Handle the set_encoding command. The response is sent using the old
+        wire format, everything after it uses the new one. Compression can
+        only be used with length prefixed framing, and every set_encoding
+        starts new compression streams.
+        """
+
+        for field in ('encoding', 'framing', 'compression'):
+            value = payload.get(field)
+            if value is not None and not isinstance(value, basestring):
+                self.send_error("Invalid %s: %s" % (field, value))
+                return
+        encoding = ENCODINGS.get(payload['encoding'])
+        if encoding is None:
+            self.send_error("Invalid encoding: %s" % payload['encoding'])
+            return
+        compression = payload.get('compression')
+        if compression is not None and compression not in COMPRESSIONS:
+            self.send_error("Invalid compression: %s" % compression)
+            return
+        compression = COMPRESSIONS.get(compression)
+        if encoding is JsonEncoding and compression is None:
+            default_framing = 'line'
+        else:
+            default_framing = 'length_prefixed'
+        framing = FRAMINGS.get(payload.get('framing', default_framing))
+        if framing is None:
+            self.send_error("Invalid framing: %s" % payload['framing'])
+            return
+        try:
+            wire_format = WireFormat(encoding, framing)
+        except ValueError as ex:
+            self.send_error(str(ex))
+            return
+        if compression is not None and framing is not LengthPrefixedFraming:
+            self.send_error("Compression requires length_prefixed framing")
+            return
+
+        self.send('set_encoding_response',
+                  {'encoding': encoding.name, 'framing': framing.name,
+                   'compression': compression and compression.name})
+        self.wire_format = wire_format
+        if compression is None:
+            self.compression = None
+        else:
+            self.compression = compression(self.compression_threshold)
+        if framing is LengthPrefixedFraming:
+            self.setRawMode()
+
     # Server managment commands
 
     @requires_arguments(['secret_key'])
@@ -159,10 +394,33 @@ class DeckrProtocol(LineReceiver):
         Handle the register command.
         """
 
-        def_id = self.game_master.register(payload['game_definition_path'])
-        logging.info("Registering a new game located at %s",
-                     payload['game_definition_path'])
-        self.send('register_game_response', {'game_definition_id': def_id})
+        def_id = self.register_game(payload['game_definition_path'])
+        if def_id is not None:
+            self.send('register_game_response',
+                      {'game_definition_id': def_id})
+
+    def register_game(self, path):
+        """
+        Register a game definition. Returns its id, or sends an error and
+        returns None if it can't be registered.
+        """
+
+        try:
+            def_id = self.game_master.register(path)
+        except (ValueError, EnvironmentError) as ex:
+            self.send_error("Could not register %s: %s" % (path, ex))
+            return None
+        logging.info("Registering a new game located at %s", path)
+        return def_id
+
+    @requires_authenticated
+    def handle_reload_games(self, _):
+        """
+        Handle the reload_games command.
+        """
+
+        reloaded = self.factory.reload_game_types()
+        self.send('reload_games_response', {'game_type_ids': reloaded})
 
     # Game managment commands
     def handle_list(self, _):
@@ -179,17 +437,34 @@ class DeckrProtocol(LineReceiver):
         Handle the create command.
         """
 
+        self.create_game(payload)
+
+    def create_game(self, payload, game_id=None):
+        """
+        Create a game for a create command and send the response (or an
+        error). If game_id is given the game gets that id.
+        """
+
         try:
-            game_id = self.game_master.create(payload['game_type_id'])
+            game_id = self.game_master.create(payload['game_type_id'],
+                                              payload.get('seed'), game_id)
         except KeyError:
-            self.send_error(
-                "No game type with id %s" %
-                payload['game_type_id'])
+            self.send_unknown_game_type(payload['game_type_id'])
+            return
+        except (ValueError, GameLoadError) as ex:
+            self.send_error(str(ex))
             return
         self.send('create_response',
                   {'game_id': game_id,
                    'game_type_id': payload['game_type_id']})
 
+    def send_unknown_game_type(self, game_type_id):
+        """
+        Send the error for a game type that doesn't exist.
+        """
+
+        self.send_error("No game type with id %s" % game_type_id)
+
     @requires_arguments(['game_id'])
     def handle_destroy(self, payload):
         """
@@ -235,7 +510,20 @@ class DeckrProtocol(LineReceiver):
         self.game = game
         self.game_room = self.factory.game_rooms.setdefault(payload['game_id'], [])
         self.game_room.append(self)
-        self.send('join_response', {'player_id': player_id})
+        self.batch_updates = bool(payload.get('batch_updates', False))
+        symbols = None
+        if payload.get('symbols', False):
+            # Everyone in the room shares a table, so updates only have to be
+            # compacted (and encoded) once.
+            self.symbols = self.factory.symbol_tables.setdefault(
+                payload['game_id'], SymbolTable())
+            self.known_symbols = len(self.symbols)
+            self.symbols_generation = self.symbols.generation
+            symbols = list(self.symbols.symbols)
+        self.send('join_response', {'player_id': player_id,
+                                    'batch_updates': self.batch_updates,
+                                    'symbols': symbols,
+                                    'sequence': game.sequence})
 
     @requires_join
     def handle_quit(self, _):
@@ -243,11 +531,20 @@ class DeckrProtocol(LineReceiver):
         Handle the quit command.
         """
 
+        self.leave_room()
+        self.send('quit_response', {})
+
+    def leave_room(self):
+        """
+        Leave the game we're connected to.
+        """
+
         self.factory.game_rooms[self.game.master_game_id].remove(self)
         if self.factory.game_rooms[self.game.master_game_id] == []:
             del self.factory.game_rooms[self.game.master_game_id]
+            self.factory.symbol_tables.pop(self.game.master_game_id, None)
         self.game = None
-        self.send('quit_response', {})
+        self.symbols = None
 
     @requires_join
     def handle_game_state(self, _):
@@ -255,8 +552,38 @@ class DeckrProtocol(LineReceiver):
         Handle the game_state command.
         """
 
+        self.send_game_state()
+
+    def send_game_state(self):
+        """
+        Send the whole game state.
+        """
+
         self.send('game_state_response',
-                  {'game_state': self.game.get_state(self.player)})
+                  {'game_state': self.compact(self.game.get_state(
+                      self.player)),
+                   'sequence': self.game.sequence})
+
+    @requires_arguments(['sequence'])
+    @requires_join
+    def handle_resume(self, payload):
+        """
+        Handle the resume command. Sends every update that happened after the
+        given sequence number, or the whole game state if they are no longer
+        available.
+        """
+
+        updates = self.game.get_transitions_since(payload['sequence'],
+                                                  self.player)
+        if updates is None:
+            self.send('resume_response',
+                      {'game_state': self.compact(self.game.get_state(
+                          self.player)),
+                       'sequence': self.game.sequence})
+        else:
+            self.send('resume_response',
+                      {'updates': self.compact(clean_game_objects(updates)),
+                       'sequence': self.game.sequence})
 
     @requires_join
     def handle_start(self, _):
@@ -265,9 +592,21 @@ class DeckrProtocol(LineReceiver):
         started.
         """
 
-        self.game.set_up()
-        self.game.flush_all_transitions() # No need to keep these around
+        self.game.start()
         self.broadcast_to_room('start', {})
+        self.process_updates(start=True)
+
+    @requires_join
+    def handle_legal_actions(self, _):
+        """
+        Handle the legal_actions command. Sends every action the client
+        could run right now.
+        """
+
+        self.send('legal_actions_response',
+                  {'actions': clean_game_objects(
+                      self.game.legal_actions(self.player)),
+                   'sequence': self.game.sequence})
 
     @requires_arguments(['action'])
     @requires_join
@@ -279,61 +618,266 @@ class DeckrProtocol(LineReceiver):
         # Get rid of extra data
         payload.pop('message_type')
 
-        # Get the action name
-        action = payload.pop('action')
-        # Find the function on the game
+        # Find the action in the game's action table
+        name = payload.pop('action')
         try:
-            action = getattr(self.game, action)
-        except AttributeError:
-            self.send_error("Invalid action %s" % action)
+            action = get_actions(type(self.game)).get(name)
+        except TypeError:
+            action = None
+        if action is None:
+            self.send_error("Invalid action %s" % name)
             return
 
         # Perform argument conversion
-        arguments = handle_argument_conversion(self.game, action.__annotations__, payload)
-        arguments['player'] = self.player
-        action(**arguments) # pylint: disable=star-args
+        try:
+            arguments = action.convert(self.game, payload)
+        except ValueError as error:
+            self.send_error(str(error))
+            return
+        if action.takes_player:
+            arguments['player'] = self.player
+        action.function(self.game, **arguments) # pylint: disable=star-args
+        self.game_master.touch(self.game.master_game_id)
 
         self.process_updates()
 
-    def process_updates(self):
+    def process_updates(self, start=False):
         """
         This will be called whenever something has happened in the game. It
         will gather all of the state transitions off of the game and send
-        them out to the appropriate clients.
+        them out to the appropriate clients. start should be True for the
+        transitions produced while setting up the game.
         """
 
-        transitions = self.game.get_all_transitions()
+        batch = UpdateBatch(self.game, self.game.sequence,
+                            self.factory.symbol_tables.get(
+                                self.game.master_game_id), start)
         for client in self.game_room:
-            client.handle_updates(transitions)
+            client.handle_updates(batch)
         self.game.flush_all_transitions()
 
-    def handle_updates(self, transitions):
+    def handle_updates(self, batch):
         """
-        Handle my updates.
+        Handle my updates. Clients that negotiated batch_updates at join get
+        a single 'updates' message carrying every transition in order,
+        everyone else gets one 'update' message per transition.
+
+        Clients that didn't negotiate batch_updates predate updates for
+        spectators and for setting up the game, so they don't get those.
         """
 
-        for player, updates in transitions:
-            if player == self.player:
-                for update in updates:
-                    if update['update_type'] == 'set':
-                        update['game_object'] = update['game_object'].game_id
-                        if isinstance(update['value'], GameObject):
-                            update['value'] = update['value'].game_id
-                    self.send('update', update)
+        if self.stale:
+            return
+        if not self.batch_updates and (batch.start or self.player is None):
+            return
+        if self.overflowed():
+            self.handle_overflow()
+            return
+        encoding = self.wire_format.encoding
+        compact = self.symbols is not None
+        if compact:
+            self.sync_symbols()
+        if self.batch_updates:
+            message = batch.updates_message(self.player, encoding, compact)
+            if message is not None:
+                self.write_message(message)
+        else:
+            for message in batch.update_messages(self.player, encoding,
+                                                 compact):
+                self.write_message(message)
+
+
+class UpdateBatch(object):
+
+    """
+    All of the transitions produced by a single action, ready to be sent out.
+    Public transitions are encoded exactly once per encoding and the
+    resulting buffers are shared by every connection in the room (each
+    connection only frames them). Only players with private transitions get
+    buffers of their own.
+
+    If symbols (the room's symbol table) is given, a compacted copy of the
+    updates is kept for the connections that use it. start marks the batch
+    produced while setting up the game.
+    """
+
+    def __init__(self, game, sequence, symbols=None, start=False):
+        self.sequence = sequence
+        self.start = start
+        public = [clean_game_objects(transition)
+                  for transition in game.public_transitions]
+        private = {player: [(position, clean_game_objects(transition))
+                            for position, transition in transitions]
+                   for player, transitions in
+                   game.private_transitions.items()}
+        self._updates = {False: (public, private)}
+        if symbols is not None:
+            # A batch is compacted in one go, so it never mixes the codes
+            # from before and after a reset.
+            symbols.reset_if_full()
+            self._updates[True] = (
+                [symbols.compact(update) for update in public],
+                {player: [(position, symbols.compact(update))
+                          for position, update in updates]
+                 for player, updates in private.items()})
+        self._encoded = {}
+        self._messages = {}
+        self._batches = {}
+
+    def _encode_updates(self, player, encoding, compact):
+        """
+        Get the encoding of every update for the player, in order.
+        """
+
+        public, private = self._updates[compact]
+        key = (encoding.name, compact)
+        if key not in self._encoded:
+            self._encoded[key] = [encoding.encode(update)
+                                  for update in public]
+        private = [(position, encoding.encode(update)) for position, update
+                   in private.get(player, [])]
+        return merge_transitions(self._encoded[key], private)
+
+    def update_messages(self, player, encoding, compact=False):
+        """
+        Get a list of encoded 'update' messages for the player. If compact
+        is True the updates use the symbol table.
+        """
+
+        public, private = self._updates[compact]
+        key = (encoding.name, compact)
+        if key not in self._messages:
+            self._messages[key] = [self._encode_message(update, encoding)
+                                   for update in public]
+        private = [(position, self._encode_message(update, encoding))
+                   for position, update in private.get(player, [])]
+        return merge_transitions(self._messages[key], private)
+
+    def updates_message(self, player, encoding, compact=False):
+        """
+        Get a single encoded 'updates' message for the player. Returns None
+        if there is nothing to send. If compact is True the updates use the
+        symbol table.
+        """
+
+        private = self._updates[compact][1]
+        key = (player if player in private else None, encoding.name, compact)
+        if key not in self._batches:
+            encoded = self._encode_updates(key[0], encoding, compact)
+            if encoded:
+                self._batches[key] = encoding.encode_updates(self.sequence,
+                                                             encoded)
+            else:
+                self._batches[key] = None
+        return self._batches[key]
+
+    @staticmethod
+    def _encode_message(update, encoding):
+        """
+        Encode a single 'update' message.
+        """
+
+        payload = dict(update)
+        payload['message_type'] = 'update'
+        return encoding.encode(payload)
+
 
 class DeckrFactory(Factory):
 
     """
     The persistent backend for Deckr.
+
+    If config has a 'persistence' section every game is written to disk (see
+    deckr.core.persistence) and the games from the last run are recovered
+    at startup. It takes a directory, and optionally a snapshot_interval
+    (100 journal records by default) and sync (true by default).
+
+    If config has a 'hibernation' section games nobody is connected to are
+    hibernated (see deckr.core.hibernation) once there are too many of them.
+    It takes max_games, max_objects and idle_timeout (all optional), and a
+    directory for the snapshots if the games aren't persisted already. Idle
+    games are looked for (and the hibernation stats are logged) every
+    check_interval seconds (60 by default).
+
+    If config has a reload_interval the game definitions are checked for
+    changes (and reloaded) every reload_interval seconds.
     """
 
     def __init__(self, config):
-        self.game_master = GameMaster()
+        persistence = config.get('persistence')
+        hibernation = config.get('hibernation')
+        store = None
+        if persistence is not None:
+            store = GameStore(persistence['directory'],
+                              persistence.get('snapshot_interval', 100),
+                              persistence.get('sync', True))
+        elif hibernation is not None:
+            store = GameStore(hibernation['directory'], sync=False,
+                              journaling=False)
+            # Anything in there is left over from the last run.
+            for game_id in store.game_ids():
+                store.remove(game_id)
+        self.game_master = GameMaster(store)
         self.game_rooms = {}
+        self.check_interval = None
+        if hibernation is not None:
+            self.game_master.hibernator = Hibernator(
+                self.game_master, hibernation.get('max_games'),
+                hibernation.get('max_objects'),
+                hibernation.get('idle_timeout'),
+                is_busy=self.game_rooms.__contains__)
+            self.check_interval = hibernation.get('check_interval', 60)
+        self.hibernation_checker = None
+        self.symbol_tables = {}
+        self.high_water_mark = config.get('high_water_mark', 1024 * 1024)
+        self.overflow_policy = config.get('overflow_policy', 'conflate')
+        self.reload_interval = config.get('reload_interval')
+        self.reloader = None
         self.secret_key = None
 
         for game in config['games']:
             self.game_master.register(game)
+        if persistence is not None:
+            self.game_master.recover()
+
+    def startFactory(self):
+        """
+        Start checking for changed game definitions and idle games.
+        """
+
+        if self.reload_interval:
+            self.reloader = LoopingCall(self.reload_game_types)
+            self.reloader.start(self.reload_interval, now=False)
+        if self.game_master.hibernator is not None:
+            self.hibernation_checker = LoopingCall(self.check_hibernation)
+            self.hibernation_checker.start(self.check_interval, now=False)
+
+    def stopFactory(self):
+        """
+        Stop checking for changed game definitions and idle games.
+        """
+
+        for checker in (self.reloader, self.hibernation_checker):
+            if checker is not None and checker.running:
+                checker.stop()
+        self.reloader = None
+        self.hibernation_checker = None
+
+    def check_hibernation(self):
+        """
+        Hibernate idle games and log the hibernation stats.
+        """
+
+        self.game_master.hibernator.enforce()
+        self.game_master.hibernator.report()
+
+    def reload_game_types(self):
+        """
+        Reload the game definitions that have changed. Returns the ids of the
+        reloaded game types.
+        """
+
+        return self.game_master.reload_game_types()
 
     def buildProtocol(self, addr):
         """
@@ -0,0 +1,390 @@
+"""
+This module contains the code for running a deckr gateway in front of
+several game master backends (possibly on other machines). The gateway works
+just like the front process of a sharded server (see sharding), except that
+its links are pooled TCP connections to backends and games are mapped to
+backends with consistent hashing.
+
+Backends are added in generations. Every generation has a hash ring of all
+the backends in it, and every game id starts with the generation it was
+created in. Adding backends starts a new generation, so new games are spread
+over every backend while existing games stay where they are and any gateway
+with the same list of generations routes them the same way. Games are never
+rebalanced: a game stays on the backend it was created on for as long as it
+exists.
+
+Backends only process frames from gateways that know the shared secret key.
+A backend opens every link with a random challenge, and the gateway has to
+answer with an HMAC of it (keyed on the secret key) before anything else it
+sends is looked at. Gateways can only register game definitions that are
+under the backend's games root.
+"""
+
+import bisect
+import hashlib
+import hmac
+import logging
+import os
+import random
+import struct
+
+from twisted.internet.protocol import Factory, ReconnectingClientFactory
+
+from deckr.networking.deckr_server import DeckrFactory, requires_arguments
+from deckr.networking.sharding import (REGISTER, RELOAD, FrontLink,
+                                       ShardedDeckrFactory, ShardWorker,
+                                       WorkerConnection)
+
+# Game ids are the generation followed by this many random bits (which keeps
+# them small enough to survive a round trip through JSON).
+GAME_ID_BITS = 40
+
+# Link frame kinds only used between gateways and backends (following on
+# from the ones in sharding)
+CHALLENGE = 5  # Prove you know the secret key (backend to gateway)
+AUTH = 6  # The answer to a challenge (gateway to backend)
+RETRY = 7  # A create picked a game id that's in use (backend to gateway)
+
+CHALLENGE_BYTES = 16
+
+
+def link_digest(secret_key, challenge):
+    """
+    Get the answer to a link challenge.
+    """
+
+    return hmac.new(secret_key.encode('utf-8'), challenge,
+                    hashlib.sha256).digest()
+
+
+class HashRing(object):
+
+    """
+    A consistent hash ring. Each node is placed on the ring replicas times.
+    """
+
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        ring = sorted((self._hash('%s-%d' % (node, i)), node)
+                      for node in self.nodes for i in range(replicas))
+        self._keys = [key for key, _ in ring]
+        self._nodes = [node for _, node in ring]
+
+    @staticmethod
+    def _hash(key):
+        """
+        Hash a key to a point on the ring.
+        """
+
+        return struct.unpack_from('>Q', hashlib.md5(key).digest())[0]
+
+    def get_node(self, key):
+        """
+        Get the node that owns a key.
+        """
+
+        index = bisect.bisect(self._keys, self._hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+class BackendLink(FrontLink):
+
+    """
+    A pooled link to a backend. The link joins its pool once it has answered
+    the backend's challenge.
+    """
+
+    def __init__(self, factory, pool):
+        FrontLink.__init__(self, factory)
+        self.pool = pool
+
+    def connectionLost(self, reason=None):
+        if self in self.pool.links:
+            self.pool.links.remove(self)
+        FrontLink.connectionLost(self, reason)
+
+    def frameReceived(self, kind, connection_id, encoding, data):
+        """
+        Process a frame from the backend.
+        """
+
+        if kind == CHALLENGE:
+            self.send_frame(AUTH, 0, data=link_digest(
+                self.factory.link_secret_key, data))
+            if self not in self.pool.links:
+                self.pool.links.append(self)
+        elif kind == RETRY:
+            connection = self.factory.connections.get(connection_id)
+            if connection is not None:
+                connection.handle_create(encoding.decode(data))
+        else:
+            FrontLink.frameReceived(self, kind, connection_id, encoding,
+                                    data)
+
+
+class BackendPool(ReconnectingClientFactory):
+
+    """
+    A pool of persistent links to a single backend. Dropped links are
+    reconnected automatically.
+    """
+
+    def __init__(self, factory, address, size):
+        self.factory = factory
+        self.address = address
+        self.size = size
+        self.links = []
+
+    def connect(self, reactor):
+        """
+        Open all of the links.
+        """
+
+        host, port = self.address.rsplit(':', 1)
+        for _ in range(self.size):
+            reactor.connectTCP(host, int(port), self)
+
+    def buildProtocol(self, addr):
+        """
+        Build a link.
+        """
+
+        self.resetDelay()
+        return BackendLink(self.factory, self)
+
+    def link_for(self, connection_id):
+        """
+        Get the link a client connection should use. Raises a ValueError if
+        there aren't any.
+        """
+
+        if not self.links:
+            raise ValueError("Game server %s is unavailable" % self.address)
+        return self.links[connection_id % len(self.links)]
+
+
+class GatewayFactory(ShardedDeckrFactory):
+
+    """
+    A gateway in front of several backends. config should include a list of
+    generations under 'backends', where each generation is a list of backend
+    addresses (host:port), and the secret_key the backends share. Call
+    connect once the reactor is running.
+    """
+
+    def __init__(self, config, pool_size=4):
+        if not config.get('secret_key'):
+            raise ValueError("A gateway needs the backends' secret_key")
+        ShardedDeckrFactory.__init__(self, config)
+        self.link_secret_key = config['secret_key']
+        self.pool_size = pool_size
+        self.pools = {}
+        self.rings = []
+        self.random = random.SystemRandom()
+        self._reactor = None
+
+        for backends in config['backends']:
+            self.add_generation(backends)
+
+    def add_generation(self, backends):
+        """
+        Start a new generation with the given backends. New games will be
+        spread over these backends.
+        """
+
+        self.rings.append(HashRing(backends))
+        for address in backends:
+            if address not in self.pools:
+                pool = BackendPool(self, address, self.pool_size)
+                self.pools[address] = pool
+                if self._reactor is not None:
+                    pool.connect(self._reactor)
+
+    def add_backends(self, backends):
+        """
+        Add new backends, keeping every backend from the latest generation.
+        """
+
+        self.add_generation(self.rings[-1].nodes +
+                            [address for address in backends
+                             if address not in self.rings[-1].nodes])
+
+    def connect(self, reactor=None):
+        """
+        Connect to all of the backends.
+        """
+
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        for pool in self.pools.values():
+            pool.connect(reactor)
+
+    def shard(self, game_id, connection_id=None):
+        """
+        Get the link a client connection should use to reach a game. Raises a
+        ValueError if game_id isn't a valid game id or the backend is
+        unavailable.
+        """
+
+        if not isinstance(game_id, (int, long)) or game_id < 0:
+            raise ValueError("No game with id %s" % game_id)
+        generation = game_id >> GAME_ID_BITS
+        if generation >= len(self.rings):
+            raise ValueError("No game with id %s" % game_id)
+        address = self.rings[generation].get_node(game_id)
+        return self.pools[address].link_for(connection_id or 0)
+
+    def next_game_id(self):
+        """
+        Pick an id for a new game in the latest generation. Ids are random so
+        that gateways don't need to coordinate. If the backend already has a
+        game with the id it sends the create back, and another id is picked.
+        """
+
+        return ((len(self.rings) - 1) << GAME_ID_BITS |
+                self.random.getrandbits(GAME_ID_BITS))
+
+    def register_game(self, connection_id, game_definition_path):
+        """
+        Have every backend register a game definition (once).
+        """
+
+        for pool in self.pools.values():
+            if not pool.links:
+                logging.warning("Can't register %s with %s",
+                                game_definition_path, pool.address)
+                continue
+            pool.links[0].send_frame(
+                REGISTER, connection_id,
+                data=game_definition_path.encode('utf-8'))
+
+    def reload_game_types(self):
+        """
+        Have every backend reload its changed game definitions.
+        """
+
+        for pool in self.pools.values():
+            if not pool.links:
+                logging.warning("Can't reload games on %s", pool.address)
+                continue
+            pool.links[0].send_frame(RELOAD, 0)
+        return self.game_master.reload_game_types()
+
+
+class BackendConnection(WorkerConnection):
+
+    """
+    Stands in for a client connection of a gateway inside of a backend.
+    """
+
+    @requires_arguments(['game_type_id', 'game_id'])
+    def handle_create(self, payload):
+        """
+        Handle the create command. If the game id the gateway picked is in
+        use the command is sent back to the gateway to try again.
+        """
+
+        game_id = payload['game_id']
+        if (game_id in self.game_master.games or
+                game_id in self.game_master.snapshots):
+            encoding = self.wire_format.encoding
+            self.link.send_frame(RETRY, self.connection_id, encoding,
+                                 encoding.encode(payload))
+            return
+        WorkerConnection.handle_create(self, payload)
+
+
+class BackendWorker(ShardWorker):
+
+    """
+    The backend end of a link from a gateway. Nothing the gateway sends is
+    processed until it has answered the challenge, and it can only register
+    game definitions under games_root (none if games_root is None).
+    """
+
+    connection_class = BackendConnection
+
+    def __init__(self, factory, secret_key, games_root):
+        ShardWorker.__init__(self, factory)
+        self.secret_key = secret_key
+        self.games_root = games_root
+        self.challenge = None
+        self.authenticated = False
+
+    def connectionMade(self):
+        """
+        Challenge the gateway.
+        """
+
+        self.challenge = os.urandom(CHALLENGE_BYTES)
+        self.send_frame(CHALLENGE, 0, data=self.challenge)
+
+    def frameReceived(self, kind, connection_id, encoding, data):
+        """
+        Process a frame from the gateway.
+        """
+
+        if not self.authenticated:
+            if kind == AUTH and hmac.compare_digest(
+                    data, link_digest(self.secret_key, self.challenge)):
+                self.authenticated = True
+            else:
+                logging.warning("Dropping a link that failed the handshake")
+                self.transport.loseConnection()
+            return
+        if kind == REGISTER and not self.in_games_root(data):
+            logging.warning("Refusing to register %s, it isn't under the "
+                            "games root", data)
+            return
+        ShardWorker.frameReceived(self, kind, connection_id, encoding, data)
+
+    def in_games_root(self, path):
+        """
+        Check if a game definition path is under the games root.
+        """
+
+        if self.games_root is None:
+            return False
+        root = os.path.realpath(self.games_root)
+        path = os.path.realpath(path.decode('utf-8'))
+        return path.startswith(os.path.join(root, ''))
+
+
+class BackendFactory(Factory):
+
+    """
+    A game master that serves gateways instead of clients. Every link from a
+    gateway runs against the same DeckrFactory. config needs a secret_key
+    (shared with the gateways), and can have a games_root directory that
+    gateways may register game definitions from.
+    """
+
+    def __init__(self, config):
+        if not config.get('secret_key'):
+            raise ValueError("A backend needs a secret_key")
+        self.deckr_factory = DeckrFactory(config)
+        self.secret_key = config['secret_key']
+        self.games_root = config.get('games_root')
+
+    def startFactory(self):
+        """
+        Start the game master.
+        """
+
+        self.deckr_factory.doStart()
+
+    def stopFactory(self):
+        """
+        Stop the game master.
+        """
+
+        self.deckr_factory.doStop()
+
+    def buildProtocol(self, addr):
+        """
+        Build the protocol.
+        """
+
+        return BackendWorker(self.deckr_factory, self.secret_key,
+                             self.games_root)
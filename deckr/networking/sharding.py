@@ -0,0 +1,528 @@
+"""
+This module contains the code for running a sharded deckr server, where games
+are spread over several worker processes. A front process owns all of the
+client sockets. It handles the connection level commands (set_encoding,
+authenticate, list, ...) itself and forwards every game command to the worker
+that owns the game (game_id % number of workers). Workers run a normal
+DeckrFactory, with one WorkerConnection per client standing in for the
+client's socket, and send everything those connections produce back to the
+front process to be framed and written out.
+
+The front process and the workers talk over a link (the worker's stdin and
+stdout). Every link frame is length prefixed and carries a kind, a
+connection id and the encoding of its payload.
+"""
+
+import logging
+import os
+import struct
+import sys
+
+from twisted.internet.error import ProcessDone
+from twisted.internet.protocol import Factory, ProcessProtocol, Protocol
+
+from deckr.core.game_master import GameMaster
+from deckr.networking.deckr_server import (DeckrFactory, DeckrProtocol,
+                                           requires_arguments)
+from deckr.networking.wire import (JsonEncoding, LengthPrefixedFraming,
+                                   MsgpackEncoding, WireFormat)
+
+# Link frame kinds
+MESSAGE = 0  # A message to or from a client
+CLOSE = 1  # The client has gone away (front to worker)
+LEFT = 2  # The client isn't in a game anymore (worker to front)
+REGISTER = 3  # Register a game definition (front to worker)
+RELOAD = 4  # Reload changed game definitions (front to worker)
+
+LINK_HEADER = struct.Struct('>BIB')
+LINK_ENCODINGS = (JsonEncoding, MsgpackEncoding)
+
+# Workers never frame messages themselves, but a WireFormat still needs a
+# framing that works with every encoding.
+WORKER_WIRE_FORMATS = {encoding: WireFormat(encoding, LengthPrefixedFraming)
+                       for encoding in LINK_ENCODINGS}
+
+
+class LinkProtocol(Protocol):
+
+    """
+    One end of a link between the front process and a worker.
+    """
+
+    max_length = 2 ** 26
+
+    def __init__(self):
+        self._buffer = ''
+
+    def dataReceived(self, data):
+        """
+        Split the data into link frames and process each of them.
+        """
+
+        data = self._buffer + data
+        offset = 0
+        while True:
+            _, message, offset = LengthPrefixedFraming.read_frame(
+                data, offset, self.max_length)
+            if message is None:
+                break
+            kind, connection_id, encoding = LINK_HEADER.unpack_from(message)
+            self.frameReceived(kind, connection_id, LINK_ENCODINGS[encoding],
+                               message[LINK_HEADER.size:])
+        self._buffer = data[offset:]
+
+    def send_frame(self, kind, connection_id, encoding=JsonEncoding,
+                   data=''):
+        """
+        Send a single link frame.
+        """
+
+        header = LINK_HEADER.pack(kind, connection_id,
+                                  LINK_ENCODINGS.index(encoding))
+        self.transport.write(LengthPrefixedFraming.frame(header + data))
+
+    # Named like the Twisted callbacks it comes from.
+    # pylint: disable=invalid-name
+    def frameReceived(self, kind, connection_id, encoding, data):
+        """
+        Process a single link frame. Should be overriden by subclasses.
+        """
+
+        raise NotImplementedError
+
+
+class WorkerConnection(DeckrProtocol):
+
+    """
+    Stands in for a client connection inside of a worker. Everything that
+    gets sent to the client is passed back over the link (still unframed).
+    """
+
+    def __init__(self, factory, link, connection_id):
+        DeckrProtocol.__init__(self, factory)
+        self.link = link
+        self.connection_id = connection_id
+
+    def write_message(self, data):
+        """
+        Send an encoded message back to the front process.
+        """
+
+        self.link.send_frame(MESSAGE, self.connection_id,
+                             self.wire_format.encoding, data)
+
+    @requires_arguments(['game_type_id', 'game_id'])
+    def handle_create(self, payload):
+        """
+        Handle the create command. The front process picks the game id.
+        """
+
+        self.create_game(payload, payload['game_id'])
+
+    def handle_join(self, payload):
+        """
+        Handle the join command. Tells the front process if we didn't end up
+        in a game.
+        """
+
+        DeckrProtocol.handle_join(self, payload)
+        self.report_left()
+
+    def handle_quit(self, payload):
+        """
+        Handle the quit command. Tells the front process we're not in a game
+        anymore.
+        """
+
+        DeckrProtocol.handle_quit(self, payload)
+        self.report_left()
+
+    def report_left(self):
+        """
+        Tell the front process if we aren't in a game.
+        """
+
+        if self.game is None:
+            self.link.send_frame(LEFT, self.connection_id)
+
+
+class ShardWorker(LinkProtocol):
+
+    """
+    The worker end of a link. Runs every game command it is sent against a
+    DeckrFactory. on_close is called once the front process goes away.
+    """
+
+    connection_class = WorkerConnection
+
+    def __init__(self, factory, on_close=None):
+        LinkProtocol.__init__(self)
+        self.factory = factory
+        self.connections = {}
+        self.on_close = on_close
+
+    def connectionLost(self, reason=None):
+        """
+        The front process is gone, and so are all of its clients.
+        """
+
+        for connection in self.connections.values():
+            connection.connectionLost()
+        self.connections = {}
+        if self.on_close is not None:
+            self.on_close()
+
+    def frameReceived(self, kind, connection_id, encoding, data):
+        """
+        Process a frame from the front process.
+        """
+
+        if kind == MESSAGE:
+            connection = self.connections.get(connection_id)
+            if connection is None:
+                connection = self.connection_class(self.factory, self,
+                                                   connection_id)
+                self.connections[connection_id] = connection
+            # Reply in whatever encoding the client is using.
+            connection.wire_format = WORKER_WIRE_FORMATS[encoding]
+            connection.messageReceived(data)
+        elif kind == CLOSE:
+            connection = self.connections.pop(connection_id, None)
+            if connection is not None:
+                connection.connectionLost()
+        elif kind == REGISTER:
+            # The front process checks definitions before sending them, but
+            # one that fails here mustn't take the link (and with it the
+            # worker) down.
+            try:
+                self.factory.game_master.register(data)
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Could not register %s", data)
+        elif kind == RELOAD:
+            self.factory.reload_game_types()
+
+
+class FrontLink(LinkProtocol):
+
+    """
+    The front process's end of a link to a worker.
+    """
+
+    def __init__(self, factory):
+        LinkProtocol.__init__(self)
+        self.factory = factory
+
+    def frameReceived(self, kind, connection_id, encoding, data):
+        """
+        Process a frame from the worker.
+        """
+
+        connection = self.factory.connections.get(connection_id)
+        if connection is None:
+            return  # The client has already gone away
+        if kind == MESSAGE:
+            connection.relay(encoding, data)
+        elif kind == LEFT and connection.shard is self:
+            connection.shard = None
+
+    def connectionLost(self, reason=None):
+        """
+        Tell every client that was in a game behind this link that it's
+        gone.
+        """
+
+        for connection in self.factory.connections.values():
+            connection.used_links.discard(self)
+            if connection.shard is self:
+                connection.shard = None
+                connection.send_error("Lost connection to the game server")
+
+
+class FrontProtocol(DeckrProtocol):
+
+    """
+    A client connection to the front process. Game commands are forwarded to
+    the worker that owns the game. Note that since responses from workers
+    are asynchronous, they can arrive after the responses to commands sent
+    later that the front process handles itself (i.e. list).
+
+    The front process can't tell updates apart from other messages without
+    decoding them, so slow clients are always disconnected rather than
+    conflated.
+    """
+
+    def __init__(self, factory):
+        DeckrProtocol.__init__(self, factory)
+        self.connection_id = None
+        # The link to the worker we're joined to a game on (or trying to).
+        self.shard = None
+        # Every link we have sent something over.
+        self.used_links = set()
+
+    def connectionMade(self):
+        DeckrProtocol.connectionMade(self)
+        self.connection_id = self.factory.add_connection(self)
+
+    def connectionLost(self, reason=None):
+        self.factory.remove_connection(self)
+
+    def forward(self, link, payload):
+        """
+        Forward a command to a worker.
+        """
+
+        self.used_links.add(link)
+        encoding = self.wire_format.encoding
+        link.send_frame(MESSAGE, self.connection_id, encoding,
+                        encoding.encode(payload))
+
+    def relay(self, encoding, data):
+        """
+        Send a message from a worker on to the client. Messages are passed
+        straight through, unless the client switched encodings while the
+        message was on its way.
+        """
+
+        if self.overflowed():
+            self.handle_overflow()
+            return
+        if encoding is not self.wire_format.encoding:
+            data = self.wire_format.encoding.encode(encoding.decode(data))
+        self.write_message(data)
+
+    def register_game(self, path):
+        """
+        Register a game definition. Once it has registered here every worker
+        registers it too.
+        """
+
+        def_id = DeckrProtocol.register_game(self, path)
+        if def_id is not None:
+            self.factory.register_game(self.connection_id, path)
+        return def_id
+
+    @requires_arguments(['game_type_id'])
+    def handle_create(self, payload):
+        """
+        Handle the create command by picking a game id and passing it on to
+        the worker that will own the game.
+        """
+
+        if payload['game_type_id'] not in self.game_master.game_types:
+            self.send_unknown_game_type(payload['game_type_id'])
+            return
+        payload['game_id'] = self.factory.next_game_id()
+        link = self.get_shard(payload['game_id'])
+        if link is not None:
+            self.forward(link, payload)
+
+    @requires_arguments(['game_id'])
+    def handle_destroy(self, payload):
+        """
+        Handle the destroy command.
+        """
+
+        link = self.get_shard(payload['game_id'])
+        if link is not None:
+            self.forward(link, payload)
+
+    @requires_arguments(['game_id'])
+    def handle_join(self, payload):
+        """
+        Handle the join command. If we're already on a worker the join goes
+        there (so it can complain that we're already in a game).
+        """
+
+        if self.shard is None:
+            self.shard = self.get_shard(payload['game_id'])
+            if self.shard is None:
+                return
+        self.forward(self.shard, payload)
+
+    def get_shard(self, game_id):
+        """
+        Get the link to the worker that owns a game. Sends an error and
+        returns None if there isn't one.
+        """
+
+        try:
+            return self.factory.shard(game_id, self.connection_id)
+        except ValueError as ex:
+            self.send_error(str(ex))
+            return None
+
+    def forward_to_game(self, payload):
+        """
+        Forward a command to the worker that owns the game we're in.
+        """
+
+        if self.shard is None:
+            self.send_error("You aren't connected to a game")
+            return
+        self.forward(self.shard, payload)
+
+    handle_quit = forward_to_game
+    handle_game_state = forward_to_game
+    handle_resume = forward_to_game
+    handle_start = forward_to_game
+    handle_action = forward_to_game
+    handle_legal_actions = forward_to_game
+
+
+class WorkerProcessProtocol(ProcessProtocol):
+
+    """
+    Connects a FrontLink to a worker process's stdin and stdout.
+    """
+
+    def __init__(self, link):
+        self.link = link
+
+    def connectionMade(self):
+        self.link.makeConnection(self.transport)
+
+    def outReceived(self, data):
+        self.link.dataReceived(data)
+
+    def processEnded(self, reason):
+        if reason.check(ProcessDone):
+            logging.info("Shard worker exited")
+        else:
+            logging.error("Shard worker exited: %s", reason.value)
+        self.link.connectionLost(reason)
+
+
+class ShardedDeckrFactory(Factory):
+
+    """
+    The front process of a sharded deckr server. Workers need to be added
+    with spawn_workers (or add_link) before any clients connect.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        # Only used for game types, the games themselves live in workers.
+        self.game_master = GameMaster()
+        self.secret_key = None
+        self.high_water_mark = config.get('high_water_mark', 1024 * 1024)
+        self.overflow_policy = 'disconnect'
+        self.links = []
+        self.connections = {}
+        self._next_connection_id = 0
+        self._next_game_id = 0
+
+        for game in config['games']:
+            self.game_master.register(game)
+
+    def add_link(self, link):
+        """
+        Add a link to a worker. Workers own games in the order they were
+        added.
+        """
+
+        self.links.append(link)
+
+    def spawn_workers(self, count, reactor=None):
+        """
+        Start count worker processes.
+        """
+
+        if reactor is None:
+            from twisted.internet import reactor
+        for _ in range(count):
+            link = FrontLink(self)
+            self.add_link(link)
+            reactor.spawnProcess(
+                WorkerProcessProtocol(link), sys.executable,
+                [sys.executable, '-m', 'deckr.networking.sharding'] +
+                list(self.config['games']),
+                env=os.environ, childFDs={0: 'w', 1: 'r', 2: 2})
+
+    def shard(self, game_id, connection_id=None):
+        """
+        Get the link to the worker that owns a game for a client connection.
+        Raises a ValueError if game_id isn't a valid game id. Every client
+        reaches a game over the same link here, connection_id is for
+        subclasses that spread clients over several links (see
+        GatewayFactory).
+        """
+
+        # pylint: disable=unused-argument
+
+        if not isinstance(game_id, (int, long)) or game_id < 0:
+            raise ValueError("No game with id %s" % game_id)
+        return self.links[game_id % len(self.links)]
+
+    def register_game(self, connection_id, game_definition_path):
+        """
+        Have every worker register a game definition.
+        """
+
+        for link in self.links:
+            link.send_frame(REGISTER, connection_id,
+                            data=game_definition_path.encode('utf-8'))
+
+    def reload_game_types(self):
+        """
+        Have every worker reload its changed game definitions. Returns the
+        ids of the game types that changed.
+        """
+
+        for link in self.links:
+            link.send_frame(RELOAD, 0)
+        return self.game_master.reload_game_types()
+
+    def next_game_id(self):
+        """
+        Get the id for a new game.
+        """
+
+        self._next_game_id += 1
+        return self._next_game_id - 1
+
+    def add_connection(self, connection):
+        """
+        Keep track of a new client connection. Returns its id.
+        """
+
+        connection_id = self._next_connection_id
+        self._next_connection_id += 1
+        self.connections[connection_id] = connection
+        return connection_id
+
+    def remove_connection(self, connection):
+        """
+        Forget about a client connection, and tell the workers it has talked
+        to that it's gone.
+        """
+
+        del self.connections[connection.connection_id]
+        for link in connection.used_links:
+            link.send_frame(CLOSE, connection.connection_id)
+
+    def buildProtocol(self, addr):
+        """
+        Build the protocol.
+        """
+
+        return FrontProtocol(self)
+
+
+def run_worker(game_paths):
+    """
+    Run a worker process, talking to the front process over stdin and
+    stdout.
+    """
+
+    from twisted.internet import reactor, stdio
+
+    # stdout belongs to the link, so make sure nothing else writes to it.
+    sys.stdout = sys.stderr
+    stdio.StandardIO(ShardWorker(DeckrFactory({'games': game_paths}),
+                                 reactor.stop))
+    reactor.run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    run_worker(sys.argv[1:])
@@ -0,0 +1,120 @@
+"""
+This module contains the symbol tables that clients can opt into at join.
+With a symbol table, field names, object types and update types are sent as
+small integer codes instead of strings.
+"""
+
+# The symbols every table starts out with.
+BASE_SYMBOLS = ('update_type', 'zone', 'game_object', 'game_objects',
+                'field', 'value', 'replace', 'index', 'deals', 'add',
+                'remove', 'set', 'move_many', 'deal', 'set_many', 'type',
+                'game_id', 'objects', 'name', 'owner', 'Zone', 'Player')
+
+# Keys whose (string) values are symbols as well.
+SYMBOL_VALUES = frozenset(['update_type', 'type', 'field'])
+
+
+class SymbolTable(object):
+
+    """
+    A growing list of symbols. A symbol's code is its position in the list,
+    so codes never change once they've been handed out and the table can be
+    sent to clients incrementally.
+
+    Every dictionary key is replaced by its code (recursively), as are the
+    string values of the keys in SYMBOL_VALUES. Integers and lists under
+    those keys are sent wrapped in a single element list, so they can't be
+    mistaken for codes. Note that encodings that only allow string keys (i.e.
+    JSON) will send codes used as keys as strings.
+
+    Once the table has grown past max_symbols, reset starts it over from
+    BASE_SYMBOLS and bumps its generation (so connections know to send the
+    whole table again). Callers should only reset between messages, never
+    while some of a message has been compacted with the old codes.
+    """
+
+    max_symbols = 4096
+
+    def __init__(self):
+        self.symbols = list(BASE_SYMBOLS)
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def reset_if_full(self):
+        """
+        Start the table over if it has more than max_symbols symbols.
+        Returns True if it was reset.
+        """
+
+        if len(self.symbols) <= self.max_symbols:
+            return False
+        self.symbols = list(BASE_SYMBOLS)
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        self.generation += 1
+        return True
+
+    def code(self, symbol):
+        """
+        Get the code for a symbol, adding it to the table if necessary.
+        """
+
+        code = self.codes.get(symbol)
+        if code is None:
+            code = len(self.symbols)
+            self.symbols.append(symbol)
+            self.codes[symbol] = code
+        return code
+
+    def compact(self, value):
+        """
+        Replace the symbols in a value (which should already have been
+        cleaned with clean_game_objects) with their codes.
+        """
+
+        if isinstance(value, list):
+            return [self.compact(x) if isinstance(x, (list, dict)) else x
+                    for x in value]
+        elif isinstance(value, dict):
+            codes = self.codes
+            result = {}
+            for key, item in value.iteritems():
+                if key in SYMBOL_VALUES and isinstance(item, basestring):
+                    item = codes.get(item)
+                    if item is None:
+                        item = self.code(value[key])
+                elif key in SYMBOL_VALUES and isinstance(item, (int, long,
+                                                                list)):
+                    item = [self.compact(item)]
+                elif isinstance(item, (list, dict)):
+                    item = self.compact(item)
+                code = codes.get(key)
+                if code is None:
+                    code = self.code(key)
+                result[code] = item
+            return result
+        return value
+
+    def expand(self, value):
+        """
+        The inverse of compact. Codes used as keys may be strings (see
+        above).
+        """
+
+        if isinstance(value, list):
+            return [self.expand(x) for x in value]
+        elif isinstance(value, dict):
+            result = {}
+            for key, item in value.items():
+                key = self.symbols[int(key)]
+                if key in SYMBOL_VALUES and isinstance(item, list):
+                    item = self.expand(item[0])
+                elif key in SYMBOL_VALUES and isinstance(item, (int, long)):
+                    item = self.symbols[item]
+                else:
+                    item = self.expand(item)
+                result[key] = item
+            return result
+        return value
@@ -0,0 +1,443 @@
+"""
+This module contains the encodings and framings that the deckr protocol can
+be spoken in. By default messages are JSON encoded and terminated by \\r\\n.
+Clients can switch to a length prefixed framing and/or a compact binary
+encoding (MessagePack) with the set_encoding message, and can turn on
+compression for length prefixed frames.
+"""
+
+import json
+import struct
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class JsonEncoding(object):
+
+    """
+    Encodes messages as JSON.
+    """
+
+    name = 'json'
+    label = 'JSON'
+
+    @staticmethod
+    def encode(obj):
+        """
+        Encode an object.
+        """
+
+        return json.dumps(obj)
+
+    @staticmethod
+    def decode(data):
+        """
+        Decode an object. Raises a ValueError if the data is malformed.
+        """
+
+        return json.loads(data)
+
+    @staticmethod
+    def encode_updates(sequence, encoded_updates):
+        """
+        Build an 'updates' message out of updates that have already been
+        encoded, without encoding them again.
+        """
+
+        return ('{"message_type": "updates", "sequence": %d, '
+                '"updates": [%s]}' % (sequence, ', '.join(encoded_updates)))
+
+
+# The MessagePack integer types that aren't fixints, from smallest to
+# largest (unsigned first): (smallest value, largest value, tag, format).
+INT_TYPES = ((0, 0xff, 0xcc, '>BB'), (0, 0xffff, 0xcd, '>BH'),
+             (0, 0xffffffff, 0xce, '>BI'),
+             (0, 0xffffffffffffffff, 0xcf, '>BQ'),
+             (-0x80, 0x7f, 0xd0, '>Bb'), (-0x8000, 0x7fff, 0xd1, '>Bh'),
+             (-0x80000000, 0x7fffffff, 0xd2, '>Bi'),
+             (-0x8000000000000000, 0x7fffffffffffffff, 0xd3, '>Bq'))
+
+
+def _pack_int(value):
+    """
+    Pack an integer into the smallest MessagePack representation.
+    """
+
+    if 0 <= value < 0x80:
+        return struct.pack('B', value)
+    elif -0x20 <= value < 0:
+        return struct.pack('b', value)
+    for lowest, highest, tag, fmt in INT_TYPES:
+        if lowest <= value <= highest:
+            return struct.pack(fmt, tag, value)
+    raise ValueError("Integer out of range: %d" % value)
+
+
+def _pack_header(size, fix_tag, fix_limit, tag16, tag32):
+    """
+    Pack the header of a string, array or map of the given size.
+    """
+
+    if size < fix_limit:
+        return struct.pack('B', fix_tag | size)
+    elif tag16 == 0xda and size <= 0xff:
+        return struct.pack('>BB', 0xd9, size)
+    elif size <= 0xffff:
+        return struct.pack('>BH', tag16, size)
+    return struct.pack('>BI', tag32, size)
+
+
+def _pack_array_header(size):
+    """
+    Pack the header of an array of the given size.
+    """
+
+    return _pack_header(size, 0x90, 16, 0xdc, 0xdd)
+
+
+def _pack(obj, out):
+    """
+    Pack obj onto the list of strings out.
+    """
+
+    if obj is None:
+        out.append('\xc0')
+    elif obj is True:
+        out.append('\xc3')
+    elif obj is False:
+        out.append('\xc2')
+    elif isinstance(obj, (int, long)):
+        out.append(_pack_int(obj))
+    elif isinstance(obj, float):
+        out.append(struct.pack('>Bd', 0xcb, obj))
+    elif isinstance(obj, basestring):
+        if isinstance(obj, unicode):
+            obj = obj.encode('utf-8')
+        out.append(_pack_header(len(obj), 0xa0, 32, 0xda, 0xdb))
+        out.append(obj)
+    elif isinstance(obj, (list, tuple)):
+        out.append(_pack_array_header(len(obj)))
+        for value in obj:
+            _pack(value, out)
+    elif isinstance(obj, dict):
+        out.append(_pack_header(len(obj), 0x80, 16, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError("Can not encode %r" % (obj,))
+
+
+class _Unpacker(object):
+
+    """
+    Decodes a single MessagePack document.
+    """
+
+    # tag: (struct format, size) for fixed width values
+    FIXED = {0xca: ('>f', 4), 0xcb: ('>d', 8),
+             0xcc: ('>B', 1), 0xcd: ('>H', 2), 0xce: ('>I', 4),
+             0xcf: ('>Q', 8), 0xd0: ('>b', 1), 0xd1: ('>h', 2),
+             0xd2: ('>i', 4), 0xd3: ('>q', 8)}
+    # tag: (kind, struct format, size) for values with a length header
+    SIZED = {0xd9: ('str', '>B', 1), 0xda: ('str', '>H', 2),
+             0xdb: ('str', '>I', 4), 0xc4: ('bin', '>B', 1),
+             0xc5: ('bin', '>H', 2), 0xc6: ('bin', '>I', 4),
+             0xdc: ('array', '>H', 2), 0xdd: ('array', '>I', 4),
+             0xde: ('map', '>H', 2), 0xdf: ('map', '>I', 4)}
+    # tag: value for nil and the booleans
+    CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def read(self, size):
+        """
+        Read size bytes.
+        """
+
+        end = self.offset + size
+        if end > len(self.data):
+            raise ValueError("Truncated data")
+        result = self.data[self.offset:end]
+        self.offset = end
+        return result
+
+    def unpack(self):
+        """
+        Unpack the next value.
+        """
+
+        tag = ord(self.read(1))
+        if tag < 0x80:
+            return tag
+        elif tag >= 0xe0:
+            return tag - 0x100
+        elif tag in self.CONSTANTS:
+            return self.CONSTANTS[tag]
+        elif tag in self.FIXED:
+            fmt, size = self.FIXED[tag]
+            return struct.unpack(fmt, self.read(size))[0]
+        kind, length = self.read_length(tag)
+        return self.unpack_sized(kind, length)
+
+    def unpack_sized(self, kind, length):
+        """
+        Unpack a value of the given kind (see read_length) and length.
+        """
+
+        # Every element takes at least a byte, so don't trust lengths that
+        # are longer than the rest of the data.
+        if length > len(self.data) - self.offset:
+            raise ValueError("Truncated data")
+        if kind == 'str':
+            return self.read(length).decode('utf-8')
+        elif kind == 'bin':
+            return self.read(length)
+        elif kind == 'array':
+            return [self.unpack() for _ in range(length)]
+        return self.unpack_map(length)
+
+    def read_length(self, tag):
+        """
+        Get the kind ('str', 'bin', 'array' or 'map') and length of a value
+        with a length, reading the length if it isn't part of the tag.
+        """
+
+        if tag & 0xe0 == 0xa0:
+            return 'str', tag & 0x1f
+        elif tag & 0xf0 == 0x90:
+            return 'array', tag & 0x0f
+        elif tag & 0xf0 == 0x80:
+            return 'map', tag & 0x0f
+        elif tag in self.SIZED:
+            kind, fmt, size = self.SIZED[tag]
+            return kind, struct.unpack(fmt, self.read(size))[0]
+        raise ValueError("Unknown type 0x%02x" % tag)
+
+    def unpack_map(self, length):
+        """
+        Unpack a map with length entries.
+        """
+
+        result = {}
+        for _ in range(length):
+            key = self.unpack()
+            result[key] = self.unpack()
+        return result
+
+
+class MsgpackEncoding(object):
+
+    """
+    Encodes messages with MessagePack. Uses the msgpack package if it is
+    installed, and a pure python implementation otherwise (the two are
+    interchangeable on the wire).
+    """
+
+    name = 'msgpack'
+    label = 'MessagePack'
+
+    @staticmethod
+    def encode(obj):
+        """
+        Encode an object.
+        """
+
+        if msgpack is not None:
+            return msgpack.packb(obj, use_bin_type=False)
+        out = []
+        _pack(obj, out)
+        return ''.join(out)
+
+    @staticmethod
+    def decode(data):
+        """
+        Decode an object. Raises a ValueError if the data is malformed.
+        """
+
+        if msgpack is not None:
+            try:
+                return msgpack.unpackb(data, raw=False)
+            except Exception as ex:  # pylint: disable=broad-except
+                raise ValueError(str(ex))
+        unpacker = _Unpacker(data)
+        try:
+            result = unpacker.unpack()
+        except (struct.error, UnicodeDecodeError, RuntimeError,
+                TypeError) as ex:
+            raise ValueError(str(ex))
+        if unpacker.offset != len(data):
+            raise ValueError("Extra data after message")
+        return result
+
+    @classmethod
+    def encode_updates(cls, sequence, encoded_updates):
+        """
+        Build an 'updates' message out of updates that have already been
+        encoded, without encoding them again.
+        """
+
+        out = ['\x83', cls.encode('message_type'), cls.encode('updates'),
+               cls.encode('sequence'), cls.encode(sequence),
+               cls.encode('updates'), _pack_array_header(len(encoded_updates))]
+        out.extend(encoded_updates)
+        return ''.join(out)
+
+
+class LineFraming(object):
+
+    """
+    Each message is terminated by \\r\\n. Only usable with encodings that
+    never produce line breaks (i.e. JSON).
+    """
+
+    name = 'line'
+
+    @staticmethod
+    def frame(data):
+        """
+        Frame a single encoded message.
+        """
+
+        return data + '\r\n'
+
+
+class LengthPrefixedFraming(object):
+
+    """
+    Each message is preceded by a 5 byte header: the length of the message
+    as a 32 bit big endian unsigned integer, followed by a byte of flags (see
+    COMPRESSED).
+    """
+
+    name = 'length_prefixed'
+    header = struct.Struct('>IB')
+
+    @classmethod
+    def frame(cls, data, flags=0):
+        """
+        Frame a single encoded message.
+        """
+
+        return cls.header.pack(len(data), flags) + data
+
+    @classmethod
+    def read_frame(cls, data, offset, max_length):
+        """
+        Read the frame that starts at offset in data. Returns a tuple of
+        (flags, message, end offset). If the whole frame hasn't arrived yet
+        the tuple is (None, None, offset). Raises a ValueError if the frame
+        is longer than max_length.
+        """
+
+        if len(data) - offset < cls.header.size:
+            return None, None, offset
+        length, flags = cls.header.unpack_from(data, offset)
+        if length > max_length:
+            raise ValueError("Frame too long")
+        start = offset + cls.header.size
+        if start + length > len(data):
+            return None, None, offset
+        return flags, data[start:start + length], start + length
+
+
+# Frame flag marking a compressed message.
+COMPRESSED = 0x01
+
+
+class ZlibCompression(object):
+
+    """
+    Per connection zlib compression for length prefixed frames. Messages
+    shorter than threshold are sent as is. Everything else goes through a
+    single compression stream that lives as long as the connection (each
+    message is flushed with Z_SYNC_FLUSH), so key names and values that have
+    already been sent cost almost nothing. Because the stream is shared,
+    compressed frames must be decompressed in the order they were sent.
+
+    Each direction has its own stream: compress is for messages we send and
+    decompress is for messages the other side sent.
+    """
+
+    name = 'zlib'
+
+    def __init__(self, threshold=512, level=6):
+        self.threshold = threshold
+        self._compressor = zlib.compressobj(level)
+        self._decompressor = zlib.decompressobj()
+
+    def compress(self, data):
+        """
+        Compress a message if it's long enough. Returns a tuple of (flags,
+        data).
+        """
+
+        if len(data) < self.threshold:
+            return 0, data
+        return COMPRESSED, (self._compressor.compress(data) +
+                            self._compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    def decompress(self, data, max_length):
+        """
+        Decompress a compressed message. Raises a ValueError if the data is
+        malformed or decompresses to more than max_length bytes. The stream
+        can't be used after an error.
+        """
+
+        try:
+            result = self._decompressor.decompress(data, max_length)
+        except zlib.error as ex:
+            raise ValueError(str(ex))
+        if self._decompressor.unconsumed_tail:
+            raise ValueError("Message too long")
+        return result
+
+
+ENCODINGS = {encoding.name: encoding for encoding in
+             (JsonEncoding, MsgpackEncoding)}
+FRAMINGS = {framing.name: framing for framing in
+            (LineFraming, LengthPrefixedFraming)}
+COMPRESSIONS = {compression.name: compression for compression in
+                (ZlibCompression,)}
+
+
+class WireFormat(object):
+
+    """
+    A combination of an encoding and a framing.
+    """
+
+    def __init__(self, encoding, framing):
+        if framing is LineFraming and encoding is not JsonEncoding:
+            raise ValueError("Only json can be used with line framing")
+        self.encoding = encoding
+        self.framing = framing
+        self.key = (encoding.name, framing.name)
+
+    def encode_message(self, payload, compression=None):
+        """
+        Encode and frame a single message. compression is the connection's
+        compression (if any).
+        """
+
+        return self.frame(self.encoding.encode(payload), compression)
+
+    def frame(self, data, compression=None):
+        """
+        Frame a single encoded message, compressing it with compression (if
+        it's not None).
+        """
+
+        if compression is None:
+            return self.framing.frame(data)
+        flags, data = compression.compress(data)
+        return self.framing.frame(data, flags)
+
+
+DEFAULT_WIRE_FORMAT = WireFormat(JsonEncoding, LineFraming)
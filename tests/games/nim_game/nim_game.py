@@ -0,0 +1,43 @@
+from deckr.core.game import action, Game, restriction
+
+
+@restriction('It is not your turn')
+def is_turn(game, player, **kwargs):
+    return game.get_game_attribute('turn') == game.players.index(player)
+
+
+@restriction('There are not enough tokens left')
+def enough_tokens(game, count, **kwargs):
+    return count <= game.get_game_attribute('tokens')
+
+
+class NimGame(Game):
+
+    """
+    Players take turns taking one to three tokens off of a pile. Whoever
+    takes the last token wins.
+    """
+
+    max_players = 2
+
+    def set_up(self):
+        self.set_game_attribute('tokens', 10)
+        self.set_game_attribute('turn', 0)
+        self.set_game_attribute('winner', None)
+
+    @action(restrictions=[is_turn, enough_tokens],
+            choices={'count': lambda game, player: [1, 2, 3]})
+    def take(self, player, count):
+        tokens = self.get_game_attribute('tokens') - count
+        self.set_game_attribute('tokens', tokens)
+        seat = self.players.index(player)
+        if tokens == 0:
+            self.set_game_attribute('winner', seat)
+        self.set_game_attribute('turn', (seat + 1) % len(self.players))
+
+    def is_over(self):
+        return self.get_game_attribute('winner') is not None
+
+    def winners(self):
+        winner = self.get_game_attribute('winner')
+        return [] if winner is None else [self.players[winner]]
@@ -22,6 +22,16 @@ class SimpleGame(Game):
     def test_update_action(self, player):
         self.game_object.set_game_attribute('foo', 'bar')
 
+    @action()
+    def test_multiple_update_action(self, player):
+        self.game_object.set_game_attribute('foo', 'bar')
+        self.game_object.set_game_attribute('baz', 'qux')
+
+    @action()
+    def test_private_update_action(self, player):
+        self.game_object.set_game_attribute('foo', 'bar')
+        self.game_object.set_game_attribute('secret', 'baz', player=player)
+
     @action(params={'game_object': GameObject})
     def test_parameter_action(self, player, game_object):
         self.test_parameter = game_object
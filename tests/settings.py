@@ -7,3 +7,4 @@ import os
 ROOT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 SIMPLE_GAME = os.path.join(ROOT_DIRECTORY, 'games/simple_game')
 BAD_GAME = os.path.join(ROOT_DIRECTORY, 'games/bad_game')
+NIM_GAME = os.path.join(ROOT_DIRECTORY, 'games/nim_game')
@@ -2,9 +2,13 @@
 Test the functionality related to playing cards.
 """
 
+import random
 from unittest import TestCase
 
-from deckr.contrib.playing_card import create_deck, PlayingCard, SUITS
+from deckr.contrib.playing_card import (CardTable, create_deck, PlayingCard,
+                                        SUITS)
+from deckr.core.game import Game
+from deckr.core.zone import Zone
 
 
 class UtilityTestCase(TestCase):
@@ -39,3 +43,163 @@ class PlayingCardTestCase(TestCase):
         self.assertEqual(PlayingCard(1, 'hearts'), PlayingCard(1, 'hearts'))
         self.assertNotEqual(PlayingCard(1, 'hearts'), PlayingCard(1, 'clubs'))
         self.assertNotEqual(PlayingCard(1, 'hearts'), PlayingCard(2, 'hearts'))
+
+    def test_attributes(self):
+        """
+        Make sure that the number and suit are read from the game attributes.
+        """
+
+        card = PlayingCard(12, 'spades')
+        self.assertEqual(card.number, 12)
+        self.assertEqual(card.suit, 'spades')
+        self.assertEqual(card.game_attributes,
+                         {'face_up': False, 'card_id': 10, 'number': 12,
+                          'suit': 'spades'})
+        self.assertFalse(hasattr(card, '__dict__'))
+
+
+class CardTableTestCase(TestCase):
+
+    """
+    Test the column based card table.
+    """
+
+    def setUp(self):
+        self.table = CardTable.create_deck()
+
+    def test_create_deck(self):
+        """
+        Make sure the table matches create_deck.
+        """
+
+        self.assertEqual(len(self.table), 52)
+        for card, table_card in zip(create_deck(), self.table.cards()):
+            self.assertEqual(card.game_attributes, table_card.game_attributes)
+            self.assertEqual(card, table_card)
+        self.assertIs(self.table.card(3), self.table.card(3))
+
+    def test_attributes(self):
+        """
+        Make sure that card views read and write through to the table.
+        """
+
+        card = self.table.card(0)
+        self.assertEqual(card.number, 1)
+        self.assertEqual(card.suit, 'clubs')
+        card.set_game_attribute('face_up', True)
+        self.assertEqual(self.table.face_up[0], 1)
+        card.set_game_attribute('foo', 'bar')
+        self.assertEqual(card.get_game_attribute('foo'), 'bar')
+        self.assertEqual(card.serialize(),
+                         {'face_up': True, 'card_id': 1, 'number': 1,
+                          'suit': 'clubs', 'foo': 'bar', 'game_id': None,
+                          'type': 'Card'})
+
+    def test_shuffle_and_deal(self):
+        """
+        Make sure that we can shuffle and deal rows into zones.
+        """
+
+        order = self.table.shuffled(random.Random(1))
+        self.assertEqual(sorted(order), list(range(52)))
+        self.assertEqual(order, self.table.shuffled(random.Random(1)))
+
+        hands, remaining = self.table.deal(order, [0, 1], 5)
+        self.assertEqual(len(remaining), 42)
+        self.assertEqual(list(hands[0]),
+                         [order[-1], order[-3], order[-5], order[-7],
+                          order[-9]])
+        self.assertEqual(list(self.table.rows_in(0)), sorted(hands[0]))
+        self.assertEqual(list(self.table.rows_in(1)), sorted(hands[1]))
+        self.assertEqual(len(self.table.rows_in(-1)), 42)
+        self.assertRaises(ValueError, self.table.deal, remaining,
+                          [0, 1, 2], 20)
+
+    def test_face_up(self):
+        """
+        Make sure that flipping cards updates the table and produces a single
+        transition for registered cards.
+        """
+
+        game = Game()
+        player = game.add_player()
+        cards = self.table.cards([0, 1, 2])
+        game.register(cards)
+        version = cards[0].version
+
+        self.table.set_face_up([0, 1, 2, 3])
+        self.assertTrue(cards[0].get_game_attribute('face_up'))
+        self.assertFalse(self.table.card(4).get_game_attribute('face_up'))
+        self.assertGreater(cards[0].version, version)
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'set_many',
+                           'game_objects': [card.game_id for card in cards],
+                           'field': 'face_up',
+                           'value': True}])
+
+        self.table.set_face_up(face_up=False)
+        self.assertEqual(list(self.table.face_up), [0] * 52)
+
+    def test_set_value(self):
+        """
+        Make sure that setting a value through the table updates the card's
+        serialization and produces a transition once the card exists.
+        """
+
+        self.table.set_value(1, 'face_up', True)
+        self.assertEqual(self.table.face_up[1], 1)
+
+        game = Game()
+        player = game.add_player()
+        card = self.table.card(0)
+        game.register(card)
+        self.assertFalse(card.serialize()['face_up'])
+        game.flush_all_transitions()
+
+        self.table.set_value(0, 'face_up', True)
+        self.assertEqual(self.table.face_up[0], 1)
+        self.assertTrue(card.serialize()['face_up'])
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'set', 'game_object': card,
+                           'field': 'face_up', 'value': True}])
+
+    def test_bound_zones(self):
+        """
+        Make sure the zone column follows bound Zones, whichever side the
+        change is made on.
+        """
+
+        hands = [Zone(), Zone()]
+        self.table.move([0, 1], 0)
+        hands[0].push(self.table.card(1))
+        self.table.bind_zone(0, hands[0])
+        self.table.bind_zone(1, hands[1])
+        self.assertEqual(list(self.table.rows_in(0)), [1])
+        self.assertRaises(ValueError, CardTable.create_deck().bind_zone, 0,
+                          hands[0])
+
+        # Changes made through the table move the cards between Zones.
+        self.table.move([1], -1)
+        self.assertEqual(len(hands[0]), 0)
+        order = self.table.shuffled(random.Random(1))
+        rows, _ = self.table.deal(order, [0, 1], 5)
+        for code, hand in enumerate(hands):
+            self.assertEqual([card.row for card in hand], list(rows[code]))
+            self.assertEqual(list(self.table.rows_in(code)),
+                             sorted(rows[code]))
+
+        # Changes made through the Zones update the column.
+        card = hands[0][0]
+        hands[0].move_many([card], hands[1])
+        self.assertEqual(self.table.zone[card.row], 1)
+        hands[1].remove(card)
+        self.assertEqual(self.table.zone[card.row], -1)
+        hands[1].draw(2, hands[0])
+        hands[0].clear()
+        self.assertEqual(len(self.table.rows_in(0)), 0)
+
+        # Moving to a code that isn't bound takes the cards out of their Zone.
+        row = hands[1][0].row
+        self.table.move([row], 7)
+        self.assertNotIn(self.table.card(row), hands[1])
+        self.assertEqual(self.table.zone[row], 7)
@@ -2,10 +2,11 @@
 This file contains all of the tests cases around the base game.
 """
 
+from collections import deque
 from unittest import TestCase
 
 from deckr.core.exceptions import FailedRestrictionException, TooManyPlayers
-from deckr.core.game import action, Game, restriction
+from deckr.core.game import action, Game, get_actions, restriction
 from deckr.core.game_object import GameObject
 from deckr.core.player import Player
 
@@ -183,3 +184,417 @@ class GameTestCase(TestCase):
         self.game.flush_all_transitions()
         self.assertEqual(self.game.get_all_transitions(),
                          [(player1, []), (player2, [])])
+
+    def test_private_transitions(self):
+        """
+        Make sure that public transitions are only stored once and that
+        private transitions keep their place relative to them.
+        """
+
+        player1 = self.game.add_player()
+        player2 = self.game.add_player()
+
+        self.game.add_transition({'public': 1})
+        self.game.add_transition({'private': 1}, player1)
+        self.game.add_transition({'public': 2})
+
+        self.assertEqual(self.game.public_transitions,
+                         [{'public': 1}, {'public': 2}])
+        self.assertEqual(self.game.get_transitions(player1),
+                         [{'public': 1}, {'private': 1}, {'public': 2}])
+        self.assertEqual(self.game.get_transitions(player2),
+                         [{'public': 1}, {'public': 2}])
+        # Spectators only get the public transitions
+        self.assertEqual(self.game.get_transitions(None),
+                         [{'public': 1}, {'public': 2}])
+
+    def test_transition_log(self):
+        """
+        Make sure we can get the transitions that happened after a sequence
+        number, and that we notice when the log has rolled over.
+        """
+
+        self.game.transition_log = deque(maxlen=3)
+        player1 = self.game.add_player()
+        player2 = self.game.add_player()
+
+        self.game.add_transition({'public': 1})
+        sequence = self.game.sequence
+        self.game.add_transition({'private': 1}, player1)
+        self.game.add_transition({'public': 2})
+
+        self.assertEqual(self.game.get_transitions_since(sequence, player1),
+                         [{'private': 1}, {'public': 2}])
+        self.assertEqual(self.game.get_transitions_since(sequence, player2),
+                         [{'public': 2}])
+        self.assertEqual(
+            self.game.get_transitions_since(self.game.sequence, player1), [])
+        # Flushing doesn't affect the log
+        self.game.flush_all_transitions()
+        self.assertEqual(self.game.get_transitions_since(0, player2),
+                         [{'public': 1}, {'public': 2}])
+
+        # Roll the log over
+        self.game.add_transition({'public': 3})
+        self.assertIsNone(self.game.get_transitions_since(0, player2))
+        self.assertEqual(self.game.get_transitions_since(sequence, player2),
+                         [{'public': 2}, {'public': 3}])
+        # Sequence numbers from the future are also rejected
+        self.assertIsNone(self.game.get_transitions_since(100, player2))
+
+    def test_seed(self):
+        """
+        Make sure that seeding the game makes its randomness repeatable.
+        """
+
+        self.assertIsNotNone(self.game.random_seed)
+        self.game.seed(42)
+        self.assertEqual(self.game.random_seed, 42)
+        first = [self.game.random.random() for _ in range(5)]
+        self.game.seed(42)
+        self.assertEqual([self.game.random.random() for _ in range(5)], first)
+
+
+class ActionGame(Game):
+
+    """
+    A game with a few actions for testing the action table.
+    """
+
+    # The actions don't need the game or the player.
+    # pylint: disable=no-self-use,unused-argument
+
+    def set_up(self):
+        """
+        Nothing to set up.
+        """
+
+        pass
+
+    @action(params={'target': GameObject})
+    def target_action(self, player, target, amount=1):
+        """
+        Return the target and the amount.
+        """
+
+        return target, amount
+
+    @action()
+    def counted_action(self, player, count):
+        """
+        Return the count.
+        """
+
+        return count
+
+    def not_an_action(self, player):
+        """
+        A method that isn't an action.
+        """
+
+        pass
+
+
+class SubActionGame(ActionGame):
+
+    """
+    A game that adds an action.
+    """
+
+    # pylint: disable=no-self-use,unused-argument
+
+    @action()
+    def extra_action(self, player, **kwargs):
+        """
+        Return the extra arguments.
+        """
+
+        return kwargs
+
+
+class ActionTableTestCase(TestCase):
+
+    """
+    Test the per class action table.
+    """
+
+    def setUp(self):
+        self.game = SubActionGame()
+        self.target = GameObject()
+        self.game.register(self.target)
+
+    def test_table(self):
+        """
+        Make sure only actions end up in the table, and every class gets its
+        own table.
+        """
+
+        self.assertEqual(sorted(get_actions(ActionGame)),
+                         ['counted_action', 'target_action'])
+        self.assertEqual(sorted(get_actions(SubActionGame)),
+                         ['counted_action', 'extra_action', 'target_action'])
+        self.assertIs(get_actions(ActionGame), get_actions(ActionGame))
+        self.assertEqual(SubActionGame.target_action.__name__,
+                         'target_action')
+
+    def test_convert(self):
+        """
+        Make sure arguments are converted and checked.
+        """
+
+        table = get_actions(SubActionGame)
+        convert = table['target_action'].convert
+        self.assertEqual(convert(self.game, {'target': self.target.game_id}),
+                         {'target': self.target})
+        self.assertEqual(
+            convert(self.game, {'target': [self.target.game_id]}),
+            {'target': [self.target]})
+        self.assertRaises(ValueError, convert, self.game, {})
+        self.assertRaises(ValueError, convert, self.game, {'target': 1000})
+        self.assertRaises(ValueError, convert, self.game, {'target': {}})
+        self.assertRaises(ValueError, convert, self.game,
+                          {'target': self.target.game_id, 'foo': 1})
+
+        convert = table['counted_action'].convert
+        self.assertEqual(convert(self.game, {'count': 3}), {'count': 3})
+        self.assertRaises(ValueError, convert, self.game, {})
+        # Anything goes if the action takes keyword arguments.
+        convert = table['extra_action'].convert
+        self.assertEqual(convert(self.game, {'foo': 1}), {'foo': 1})
+
+    def test_call(self):
+        """
+        Make sure actions can be called through the table.
+        """
+
+        action_entry = get_actions(SubActionGame)['target_action']
+        self.assertTrue(action_entry.takes_player)
+        arguments = action_entry.convert(self.game,
+                                         {'target': self.target.game_id,
+                                          'amount': 2})
+        self.assertEqual(action_entry.function(self.game, player=None,
+                                               **arguments),
+                         (self.target, 2))
+
+
+
+class Card(GameObject):
+
+    """
+    A card for testing legal actions.
+    """
+
+    game_object_type = 'Card'
+
+
+@restriction('Must be in your hand')
+def in_hand(game, player, card, **kwargs):
+    """
+    Make sure a card is in the player's hand.
+    """
+
+    # pylint: disable=unused-argument
+    game.checks += 1
+    return card in player.hand
+
+
+@restriction('Must be different cards')
+def different(game, card, other, **kwargs):
+    """
+    Make sure two cards aren't the same card.
+    """
+
+    # pylint: disable=unused-argument
+    game.checks += 1
+    return card is not other
+
+
+@restriction('Bid is too low')
+def high_enough(game, amount, **kwargs):
+    """
+    Make sure a bid is at least the minimum bid.
+    """
+
+    # pylint: disable=unused-argument
+    game.checks += 1
+    return amount >= game.get_game_attribute('minimum_bid')
+
+
+class CardGame(Game):
+
+    """
+    A game with restricted actions for testing legal actions.
+    """
+
+    player_zones = [{'name': 'hand'}]
+
+    # pylint: disable=unused-argument
+
+    def __init__(self):
+        super(CardGame, self).__init__()
+        self.checks = 0
+
+    def set_up(self):
+        self.set_game_attribute('minimum_bid', 1)
+        for _ in range(3):
+            self.register(Card())
+
+    @action(params={'card': Card}, restrictions=[in_hand])
+    def play_card(self, player, card):
+        """
+        Play a card from the player's hand.
+        """
+
+        pass
+
+    @action(params={'card': Card, 'other': Card},
+            restrictions=[in_hand, different])
+    def swap(self, player, card, other):
+        """
+        Swap a card from the player's hand with another card.
+        """
+
+        pass
+
+    @action(restrictions=[high_enough],
+            choices={'amount': lambda game, player: range(3)})
+    def bid(self, player, amount):
+        """
+        Bid at least the minimum bid.
+        """
+
+        pass
+
+    @action()
+    def pass_turn(self, player):
+        """
+        Do nothing.
+        """
+
+        pass
+
+    @action()
+    def say(self, player, message):
+        """
+        Can't be enumerated, since there are no choices for the message.
+        """
+
+        pass
+
+
+@restriction('No turns left')
+def turns_left(game, **kwargs):
+    """
+    Make sure there are turns left.
+    """
+
+    # pylint: disable=unused-argument
+    return game.turns_left > 0
+
+
+class CountdownGame(Game):
+
+    """
+    A game whose restriction looks at state that isn't a game attribute.
+    """
+
+    # pylint: disable=unused-argument
+
+    def __init__(self):
+        super(CountdownGame, self).__init__()
+        self.turns_left = 2
+
+    def set_up(self):
+        """
+        Nothing to set up.
+        """
+
+        pass
+
+    @action(restrictions=[turns_left])
+    def take_turn(self, player):
+        """
+        Use up a turn.
+        """
+
+        self.turns_left -= 1
+
+
+class LegalActionsTestCase(TestCase):
+
+    """
+    Test enumerating the legal actions.
+    """
+
+    def setUp(self):
+        self.game = CardGame()
+        self.player = self.game.add_player()
+        self.game.set_up()
+        self.cards = [obj for _, obj in sorted(self.game.game_objects.items())
+                      if isinstance(obj, Card)]
+
+    def test_legal_actions(self):
+        """
+        Make sure only the combinations that pass the restrictions are
+        listed, and actions that can't be enumerated are left out.
+        """
+
+        self.player.hand.push(self.cards[1])
+        self.assertEqual(self.game.legal_actions(self.player),
+                         [{'action': 'bid', 'amount': 1},
+                          {'action': 'bid', 'amount': 2},
+                          {'action': 'pass_turn'},
+                          {'action': 'play_card', 'card': self.cards[1]},
+                          {'action': 'swap', 'card': self.cards[1],
+                           'other': self.cards[0]},
+                          {'action': 'swap', 'card': self.cards[1],
+                           'other': self.cards[2]}])
+
+    def test_pruned(self):
+        """
+        Make sure a restriction that only looks at one argument is checked
+        once per candidate, instead of once per combination.
+        """
+
+        self.player.hand.push(self.cards[1])
+        self.game.legal_actions(self.player)
+        # Three bids, three cards to play, and three cards to swap of which
+        # only one is in the hand (with three others to swap it with).
+        self.assertEqual(self.game.checks, 3 + 3 + 3 + 3)
+
+    def test_memoized(self):
+        """
+        Make sure the restrictions are only checked again once the game
+        state changes.
+        """
+
+        self.game.legal_actions(self.player)
+        checks = self.game.checks
+        self.assertEqual(checks, 9)
+        self.game.legal_actions(self.player)
+        self.assertEqual(self.game.checks, checks)
+
+        self.game.set_game_attribute('minimum_bid', 3)
+        self.assertEqual(self.game.legal_actions(self.player),
+                         [{'action': 'pass_turn'}])
+        self.assertEqual(self.game.checks, checks * 2)
+
+        self.game.invalidate_legal_actions()
+        self.game.legal_actions(self.player)
+        self.assertEqual(self.game.checks, checks * 3)
+
+    def test_plain_state(self):
+        """
+        Make sure running an action throws away the memoized legal actions,
+        even if it didn't change the game's state.
+        """
+
+        game = CountdownGame()
+        player = game.add_player()
+        self.assertEqual(game.legal_actions(player),
+                         [{'action': 'take_turn'}])
+        game.take_turn(player=player)
+        self.assertEqual(game.legal_actions(player),
+                         [{'action': 'take_turn'}])
+        game.take_turn(player=player)
+        self.assertEqual(game.legal_actions(player), [])
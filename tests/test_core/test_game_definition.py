@@ -2,12 +2,27 @@
 This file provides all tests around basic game definitions.
 """
 
+import cPickle as pickle
+import os
+import shutil
+import sys
+import tempfile
 from unittest import TestCase
 
+from deckr.core.exceptions import GameLoadError
 from deckr.core.game import Game
 from deckr.core.game_definition import GameDefinition
+from deckr.core.game_master import GameMaster
 from tests.settings import BAD_GAME, SIMPLE_GAME
 
+GAME_MODULE = """
+from deckr.core.game import Game
+
+
+class TempGame(Game):
+    pass
+"""
+
 
 class GameDefinitionTestCase(TestCase):
 
@@ -34,6 +49,22 @@ class GameDefinitionTestCase(TestCase):
 
         self.assertRaises(ValueError, self.game_definition.load, BAD_GAME)
 
+        path = self.make_game('missing_temp_game')
+        os.remove(os.path.join(path, 'missing_temp_game.py'))
+        self.assertRaises(ValueError, self.game_definition.load, path)
+
+    def test_fail_import(self):
+        """
+        Make sure a game class that can't be loaded raises a GameLoadError
+        when it's first needed.
+        """
+
+        path = self.make_game('missing_class_temp_game')
+        with open(os.path.join(path, 'config.yml'), 'a') as config_file:
+            config_file.write("game_class: 'MissingGame'\n")
+        self.game_definition.load(path)
+        self.assertRaises(GameLoadError, self.game_definition.create_instance)
+
     def test_create_instance(self):
         """
         Make sure we can create an instance.
@@ -42,3 +73,176 @@ class GameDefinitionTestCase(TestCase):
         self.game_definition.load(SIMPLE_GAME)
         self.assertTrue(isinstance(self.game_definition.create_instance(),
                                    Game))
+
+    def make_game(self, game_file, name='Temp Game'):
+        """
+        Write a game definition to a temporary directory.
+        """
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with open(os.path.join(path, 'config.yml'), 'w') as config_file:
+            config_file.write("name: '%s'\ngame_file: '%s'\n"
+                              "game_class: 'TempGame'\n" % (name, game_file))
+        with open(os.path.join(path, game_file + '.py'), 'w') as module_file:
+            module_file.write(GAME_MODULE)
+        return path
+
+    def test_lazy_import(self):
+        """
+        Make sure the game module isn't imported until it is needed, and that
+        sys.path is put back afterwards.
+        """
+
+        path = self.make_game('lazy_temp_game')
+        sys_path = list(sys.path)
+        self.game_definition.load(path)
+        self.assertNotIn(self.game_definition.module_name, sys.modules)
+
+        game = self.game_definition.create_instance()
+        self.assertEqual(type(game).__name__, 'TempGame')
+        self.assertIn(self.game_definition.module_name, sys.modules)
+        self.assertEqual(sys.path, sys_path)
+
+    def test_helper_module(self):
+        """
+        Make sure a game file can import the other modules in its directory.
+        """
+
+        path = self.make_game('helper_temp_game')
+        with open(os.path.join(path, 'temp_game_rules.py'), 'w') as rules:
+            rules.write("HAND_SIZE = 7\n")
+        with open(os.path.join(path, 'helper_temp_game.py'), 'a') as game:
+            game.write("    from temp_game_rules import HAND_SIZE\n")
+        self.addCleanup(sys.modules.pop, 'temp_game_rules', None)
+        sys_path = list(sys.path)
+        self.game_definition.load(path)
+        self.assertEqual(self.game_definition.create_instance().HAND_SIZE, 7)
+        self.assertEqual(sys.path, sys_path)
+
+    def test_module_names(self):
+        """
+        Make sure game modules don't clobber other modules with the same
+        name.
+        """
+
+        path = self.make_game('json')
+        self.game_definition.load(path)
+        self.assertNotEqual(self.game_definition.module_name, 'json')
+        self.assertEqual(self.game_definition.klass.__name__, 'TempGame')
+        self.assertTrue(hasattr(sys.modules['json'], 'dumps'))
+
+        # Loading the same directory again gives the same module.
+        other = GameDefinition()
+        other.load(path)
+        self.assertIs(other.klass, self.game_definition.klass)
+
+    def test_config_cache(self):
+        """
+        Make sure configuration files are only parsed again when they've
+        changed.
+        """
+
+        path = self.make_game('cached_temp_game')
+        config_path = os.path.join(path, 'config.yml')
+        os.utime(config_path, (1000, 1000))
+        self.game_definition.load(path)
+        self.assertEqual(self.game_definition.name, 'Temp Game')
+
+        with open(config_path, 'w') as config_file:
+            config_file.write("name: 'Changed'\n"
+                              "game_file: 'cached_temp_game'\n"
+                              "game_class: 'TempGame'\n")
+        os.utime(config_path, (1000, 1000))
+        self.game_definition.load(path)
+        self.assertEqual(self.game_definition.name, 'Temp Game')
+
+        os.utime(config_path, (2000, 2000))
+        self.game_definition.load(path)
+        self.assertEqual(self.game_definition.name, 'Changed')
+
+    @staticmethod
+    def rewrite_module(path, game_file, source, mtime):
+        """
+        Replace a game module, with a new modification time.
+        """
+
+        module_path = os.path.join(path, game_file + '.py')
+        with open(module_path, 'w') as module_file:
+            module_file.write(source)
+        os.utime(module_path, (mtime, mtime))
+        # Make sure a stale .pyc isn't picked up.
+        if os.path.exists(module_path + 'c'):
+            os.remove(module_path + 'c')
+
+    def test_reload(self):
+        """
+        Make sure a changed game module is reloaded under a new name, while
+        games of the old version keep working.
+        """
+
+        path = self.make_game('reload_temp_game')
+        self.game_definition.load(path)
+        # The module isn't watched until it has been imported.
+        self.rewrite_module(path, 'reload_temp_game', GAME_MODULE, 1000)
+        self.assertFalse(self.game_definition.changed())
+
+        old_game = self.game_definition.create_instance()
+        self.assertFalse(self.game_definition.changed())
+        self.rewrite_module(path, 'reload_temp_game',
+                            GAME_MODULE + "    rules = 2\n", 2000)
+        self.assertTrue(self.game_definition.changed())
+        self.game_definition.reload()
+        self.assertFalse(self.game_definition.changed())
+
+        new_game = self.game_definition.create_instance()
+        self.assertEqual(new_game.rules, 2)
+        self.assertFalse(hasattr(old_game, 'rules'))
+        self.assertEqual(self.game_definition.module_name,
+                         self.game_definition.base_module_name + '__v1')
+        # Both versions can still be pickled.
+        self.assertIs(type(pickle.loads(pickle.dumps(old_game, 2))),
+                      type(old_game))
+        self.assertIs(type(pickle.loads(pickle.dumps(new_game, 2))),
+                      type(new_game))
+
+    def test_failed_reload(self):
+        """
+        Make sure a broken game module doesn't replace the working one.
+        """
+
+        path = self.make_game('broken_temp_game')
+        game_master = GameMaster()
+        game_type = game_master.register(path)
+        game_master.create(game_type)
+        game_definition = game_master.game_types[game_type]
+
+        self.rewrite_module(path, 'broken_temp_game', "this isn't python",
+                            1000)
+        self.assertEqual(game_master.reload_game_types(), [])
+        self.assertEqual(game_definition.version, 0)
+        self.assertNotIn(game_definition.base_module_name + '__v1',
+                         sys.modules)
+        # It's tried again until it works.
+        self.assertTrue(game_definition.changed())
+        self.assertEqual(game_master.reload_game_types(), [])
+        self.assertTrue(game_definition.changed())
+
+        self.rewrite_module(path, 'broken_temp_game', GAME_MODULE, 2000)
+        self.assertEqual(game_master.reload_game_types(), [game_type])
+        self.assertEqual(game_definition.version, 1)
+        game_master.create(game_type)
+
+    def test_restore_old_version(self):
+        """
+        Make sure games pickled by a version of a game that is gone come back
+        with the current version.
+        """
+
+        path = self.make_game('restored_temp_game')
+        game_master = GameMaster()
+        game_type = game_master.register(path)
+        game_definition = game_master.game_types[game_type]
+        klass = game_master.find_global(
+            game_definition.base_module_name + '__v7', 'TempGame')
+        self.assertIs(klass, game_definition.klass)
@@ -4,9 +4,11 @@ This file provides all tests around basic game objects.
 
 from unittest import TestCase
 
+from deckr.contrib.playing_card import PlayingCard
 from deckr.core.game import Game
-from deckr.core.game_object import GameObject
+from deckr.core.game_object import clean_game_objects, GameObject
 from deckr.core.player import Player
+from deckr.core.zone import Zone
 
 
 class GameObjectTestCase(TestCase):
@@ -55,3 +57,167 @@ class GameObjectTestCase(TestCase):
         # Test error conditions
         self.assertRaises(AttributeError, self.game_object.get_game_attribute,
                           'bar')
+
+    def test_serialize_cache(self):
+        """
+        Make sure that the cached serialization is only rebuilt when something
+        changes, and that player overrides are layered on top of it.
+        """
+
+        self.game_object.set_game_attribute('foo', 'bar')
+        self.game_object.set_game_attribute('foo', 'baz', player=self.player1)
+        version = self.game_object.version
+
+        result = self.game_object.serialize()
+        self.assertEqual(result['foo'], 'bar')
+        self.assertEqual(self.game_object.serialize(self.player1)['foo'],
+                         'baz')
+        self.assertEqual(self.game_object.serialize(self.player2)['foo'],
+                         'bar')
+        # Changing the result shouldn't affect the cache
+        result['foo'] = 'changed'
+        self.assertEqual(self.game_object.serialize()['foo'], 'bar')
+        self.assertEqual(self.game_object.version, version)
+
+        self.game_object.set_game_attribute('foo', 'qux')
+        self.assertGreater(self.game_object.version, version)
+        self.assertEqual(self.game_object.serialize()['foo'], 'qux')
+
+        # References to objects that get registered later are picked up.
+        other = GameObject()
+        self.game_object.set_game_attribute('other', other)
+        self.assertIsNone(self.game_object.serialize()['other'])
+        self.game.register(other)
+        self.assertEqual(self.game_object.serialize()['other'], other.game_id)
+
+    def test_serialize_cache_references(self):
+        """
+        Make sure that registering objects only rebuilds the serializations
+        that refer to them, and that lists in the result aren't shared with
+        the cache.
+        """
+
+        # pylint: disable=missing-docstring
+        class CountingZone(Zone):
+
+            __slots__ = ()
+            builds = []
+
+            def serialize_public(self, found=None):
+                self.builds.append(self)
+                return super(CountingZone, self).serialize_public(found)
+
+        zone = CountingZone()
+        self.game.register(zone)
+        card = PlayingCard(3, 'hearts')
+        zone.push(card)
+        self.assertEqual(zone.serialize()['objects'], [None])
+        self.assertEqual(len(CountingZone.builds), 1)
+
+        # Unrelated objects don't invalidate the cache.
+        self.game.register(GameObject())
+        zone.serialize()
+        self.assertEqual(len(CountingZone.builds), 1)
+
+        self.game.register(card)
+        self.assertEqual(zone.serialize()['objects'], [card.game_id])
+        self.assertEqual(len(CountingZone.builds), 2)
+
+        result = zone.serialize()
+        result['objects'].append('changed')
+        self.assertEqual(zone.serialize()['objects'], [card.game_id])
+
+    def test_attribute_schema(self):
+        """
+        Make sure that attributes in the class schema and extra attributes
+        are stored and looked up properly.
+        """
+
+        # pylint: disable=missing-docstring,protected-access
+        class SchemaObject(GameObject):
+
+            __slots__ = ()
+            game_attribute_schema = ('foo', 'bar')
+
+        game_object = SchemaObject()
+        self.assertFalse(hasattr(game_object, '__dict__'))
+        self.assertIsNone(game_object._player_overrides)
+        self.assertEqual(game_object.game_attributes, {})
+        self.assertFalse(game_object.has_game_attribute('foo'))
+        self.assertRaises(AttributeError, game_object.get_game_attribute,
+                          'foo')
+
+        game_object.set_game_attribute('foo', 1)
+        game_object.set_game_attribute('baz', 2)
+        self.assertTrue(game_object.has_game_attribute('foo'))
+        self.assertTrue(game_object.has_game_attribute('baz'))
+        self.assertFalse(game_object.has_game_attribute('bar'))
+        self.assertEqual(game_object.get_game_attribute('foo'), 1)
+        self.assertEqual(game_object.get_game_attribute('baz'), 2)
+        self.assertEqual(game_object.game_attributes, {'foo': 1, 'baz': 2})
+        self.assertEqual(game_object.serialize(),
+                         {'foo': 1, 'baz': 2, 'game_id': None,
+                          'type': 'GameObject'})
+
+        game_object.set_game_attribute('foo', 3, player=self.player1)
+        self.assertEqual(game_object.get_game_attribute('foo', self.player1),
+                         3)
+        self.assertEqual(game_object.serialize(self.player1)['foo'], 3)
+
+        # The attribute views can't be written to.
+        with self.assertRaises(AttributeError):
+            game_object.game_attributes['qux'] = 4
+        with self.assertRaises(AttributeError):
+            game_object.player_overrides[self.player1]['foo'] = 4
+        with self.assertRaises(AttributeError):
+            game_object.player_overrides.setdefault(self.player2, {})
+        self.assertEqual(game_object.player_overrides,
+                         {self.player1: {'foo': 3}})
+        self.assertFalse(game_object.has_game_attribute('qux'))
+
+    def test_compiled_serializer(self):
+        """
+        Make sure that the compiled serializers give the same result as
+        cleaning the game attributes.
+        """
+
+        # pylint: disable=missing-docstring
+        class SchemaObject(GameObject):
+
+            __slots__ = ()
+            game_attribute_schema = ('plain', 'reference', 'nested')
+            game_attribute_references = ('reference',)
+
+        def expected(obj):
+            result = dict(obj.game_attributes)
+            result['game_id'] = obj.game_id
+            result['type'] = obj.game_object_type
+            return clean_game_objects(result)
+
+        game_object = SchemaObject()
+        self.game.register(game_object)
+        self.assertEqual(game_object.serialize_public(),
+                         expected(game_object))
+
+        game_object.set_game_attribute('plain', 'foo')
+        game_object.set_game_attribute('reference', self.player1)
+        game_object.set_game_attribute('nested', {'a': [self.player2, 1]})
+        game_object.set_game_attribute('extra', [self.player1])
+        game_object.set_game_attribute('type', 'ignored')
+        self.assertEqual(game_object.serialize_public(),
+                         expected(game_object))
+        self.assertEqual(game_object.serialize_public()['nested'],
+                         {'a': [self.player2.game_id, 1]})
+
+        # References that turn out not to be game objects are still cleaned.
+        game_object.set_game_attribute('reference', [self.player1])
+        self.assertEqual(game_object.serialize_public()['reference'],
+                         [self.player1.game_id])
+
+        zone = Zone()
+        self.game.register(zone)
+        zone.set_game_attribute('owner', self.player1)
+        self.assertEqual(zone.serialize_public()['owner'],
+                         self.player1.game_id)
+        for obj in [self.game, self.player1, PlayingCard(3, 'hearts')]:
+            self.assertEqual(obj.serialize_public(), expected(obj))
@@ -0,0 +1,248 @@
+"""
+This file contains the tests around hibernating idle games.
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from deckr.core.game_master import GameMaster
+from deckr.core.hibernation import Hibernator
+from deckr.core.persistence import GameStore
+from tests.settings import SIMPLE_GAME
+
+
+class WriterCalls(object):
+
+    """
+    Stands in for the reactor's callFromThread: collects the calls a store's
+    writer thread hands back, until the test runs them.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, function, *args):
+        self.calls.append((function, args))
+
+    def run(self, store):
+        """
+        Wait for the store to write everything, then run the calls.
+        """
+
+        store.flush()
+        calls, self.calls = self.calls, []
+        for function, args in calls:
+            function(*args)  # pylint: disable=star-args
+
+
+class HibernatorTestCase(TestCase):
+
+    """
+    Test hibernating and rehydrating games.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.busy = set()
+        self.writer_calls = WriterCalls()
+        self.use_store(GameStore(self.directory, sync=False,
+                                 journaling=False,
+                                 call_from_thread=self.writer_calls))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def use_store(self, store, **kwargs):
+        """
+        Set up a game master with the given store and a hibernator.
+        """
+
+        self.store = store
+        self.game_master = GameMaster(store)
+        self.game_type = self.game_master.register(SIMPLE_GAME)
+        self.hibernator = Hibernator(self.game_master,
+                                     is_busy=self.busy.__contains__,
+                                     **kwargs)
+        self.game_master.hibernator = self.hibernator
+
+    def finish_writes(self):
+        """
+        Let every game that is being hibernated finish.
+        """
+
+        self.writer_calls.run(self.store)
+
+    def test_max_games(self):
+        """
+        Make sure the least recently used game is hibernated and comes back
+        when it's asked for.
+        """
+
+        self.hibernator.max_games = 2
+        first = self.game_master.create(self.game_type)
+        self.game_master.get_game(first).add_player()
+        second = self.game_master.create(self.game_type)
+        self.game_master.get_game(first)
+        third = self.game_master.create(self.game_type)
+        self.assertEqual(self.hibernator.hibernating.keys(), [second])
+        self.assertIn(second, self.game_master.games)
+        self.finish_writes()
+
+        self.assertEqual(sorted(self.game_master.games), [first, third])
+        self.assertEqual(self.game_master.snapshots.keys(), [second])
+        self.assertEqual(self.hibernator.stats['hibernated'], 1)
+
+        game = self.game_master.get_game(second)
+        self.assertIsNone(game.journal)
+        self.finish_writes()
+        self.assertEqual(sorted(self.game_master.games), [second, third])
+        self.assertEqual(len(self.game_master.get_game(first).players), 1)
+        self.finish_writes()
+        self.assertEqual(self.hibernator.stats['rehydrated'], 2)
+        self.assertEqual(self.hibernator.stats['hibernated'], 3)
+        self.assertGreater(self.hibernator.stats['rehydrate_time'], 0)
+
+    def test_busy(self):
+        """
+        Make sure busy games aren't hibernated.
+        """
+
+        self.hibernator.max_games = 1
+        first = self.game_master.create(self.game_type)
+        self.busy.add(first)
+        second = self.game_master.create(self.game_type)
+        self.assertEqual(sorted(self.game_master.games), [first, second])
+
+        self.busy.clear()
+        self.game_master.touch(second)
+        self.finish_writes()
+        self.assertEqual(self.game_master.games.keys(), [second])
+
+    def test_max_objects(self):
+        """
+        Make sure games are hibernated once they have too many objects
+        between them.
+        """
+
+        first = self.game_master.create(self.game_type)
+        objects = len(self.game_master.get_game(first).game_objects)
+        self.hibernator.max_objects = objects * 2
+        self.game_master.create(self.game_type)
+        self.assertEqual(self.hibernator.objects, objects * 2)
+        self.assertEqual(self.hibernator.stats['hibernated'], 0)
+
+        self.game_master.create(self.game_type)
+        self.finish_writes()
+        self.assertEqual(self.hibernator.stats['hibernated'], 1)
+        self.assertEqual(self.hibernator.objects, objects * 2)
+
+    def test_idle_timeout(self):
+        """
+        Make sure idle games are hibernated.
+        """
+
+        self.hibernator.idle_timeout = 0
+        first = self.game_master.create(self.game_type)
+        second = self.game_master.create(self.game_type)
+        self.finish_writes()
+        self.assertEqual(self.game_master.games.keys(), [second])
+        self.assertEqual(self.game_master.snapshots.keys(), [first])
+
+    def test_destroy(self):
+        """
+        Make sure hibernated and destroyed games are forgotten.
+        """
+
+        self.hibernator.max_games = 1
+        first = self.game_master.create(self.game_type)
+        second = self.game_master.create(self.game_type)
+        self.finish_writes()
+        self.game_master.destroy(first)
+        self.game_master.destroy(second)
+        self.assertEqual(self.hibernator.last_used, {})
+        self.assertEqual(self.hibernator.objects, 0)
+        self.assertEqual(self.game_master.snapshots, {})
+
+    def test_persisted(self):
+        """
+        Make sure persisted games keep their journal across hibernation.
+        """
+
+        self.store.close()
+        self.use_store(GameStore(self.directory, sync=False,
+                                 call_from_thread=self.writer_calls),
+                       max_games=1)
+        first = self.game_master.create(self.game_type)
+        game = self.game_master.get_game(first)
+        player = game.add_player()
+        game.start()
+        self.game_master.create(self.game_type)
+        self.finish_writes()
+
+        game = self.game_master.get_game(first)
+        self.assertIsNotNone(game.journal)
+        game.test_update_action(player=game.get_object(player.game_id))
+        self.store.close()
+
+        self.use_store(GameStore(self.directory))
+        self.game_master.recover()
+        game = self.game_master.get_game(first)
+        self.assertEqual(game.game_object.get_game_attribute('foo'), 'bar')
+
+    def test_used_while_writing(self):
+        """
+        Make sure a game that is used while its snapshot is being written
+        stays in memory.
+        """
+
+        self.hibernator.max_games = 1
+        first = self.game_master.create(self.game_type)
+        self.game_master.create(self.game_type)
+        game = self.game_master.get_game(first)
+        self.finish_writes()
+        self.assertIs(self.game_master.games.get(first), game)
+        self.assertNotIn(first, self.game_master.snapshots)
+        self.assertEqual(self.hibernator.stats['hibernated'], 1)
+
+    def test_write_failure(self):
+        """
+        Make sure a game whose snapshot couldn't be written stays in memory.
+        """
+
+        self.hibernator.max_games = 1
+        first = self.game_master.create(self.game_type)
+        shutil.rmtree(self.directory)
+        self.game_master.create(self.game_type)
+        self.finish_writes()
+        self.assertIn(first, self.game_master.games)
+        self.assertNotIn(first, self.hibernator.hibernating)
+        self.assertEqual(self.hibernator.stats['hibernated'], 0)
+        os.mkdir(self.directory)
+        self.finish_writes()
+
+    def test_open_failure(self):
+        """
+        Make sure a game whose snapshot was written but can't be opened stays
+        in memory.
+        """
+
+        def broken_open(game_id):
+            """
+            Fail to open any snapshot.
+            """
+
+            raise IOError("Can't open the snapshot of game %s" % game_id)
+
+        self.hibernator.max_games = 1
+        first = self.game_master.create(self.game_type)
+        game = self.game_master.get_game(first)
+        self.store.open = broken_open
+        self.game_master.create(self.game_type)
+        self.finish_writes()
+        self.assertIs(self.game_master.games.get(first), game)
+        self.assertNotIn(first, self.game_master.snapshots)
+        self.assertNotIn(first, self.hibernator.hibernating)
+        self.assertEqual(self.hibernator.stats['hibernated'], 0)
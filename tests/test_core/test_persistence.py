@@ -0,0 +1,301 @@
+"""
+This file contains the tests around persisting games to disk.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase
+
+from deckr.core.game import action, Game
+from deckr.core.game_master import GameMaster
+from deckr.core.game_object import GameObject
+from deckr.core.persistence import GameStore, read_journal, replay
+from tests.settings import SIMPLE_GAME
+
+
+class ShuffleGame(Game):
+
+    """
+    A game that needs its random number generator to be replayed properly.
+    """
+
+    game_zones = [{'name': 'deck'}]
+    player_zones = [{'name': 'hand'}]
+
+    def set_up(self):
+        cards = [GameObject() for _ in range(20)]
+        self.register(cards)
+        for i, card in enumerate(cards):
+            card.set_game_attribute('rank', i)
+        self.deck.extend(cards)
+
+    @action()
+    def draw(self, player):
+        """
+        Shuffle the deck and draw a card from it.
+        """
+
+        self.deck.shuffle()
+        player.hand.push(self.deck.pop())
+        self.draw_nothing(player=player)
+
+    @action()
+    def draw_nothing(self, player):
+        """
+        Do nothing (player may be None for spectators).
+        """
+
+        self.set_game_attribute('drew_nothing', player is None)
+
+    @action()
+    def draw_and_fail(self, player):
+        """
+        Draw a card, then fail.
+        """
+
+        self.draw(player=player)
+        raise RuntimeError("Failed after drawing")
+
+
+class DealingGame(ShuffleGame):
+
+    """
+    A game that runs actions while setting up and adding players.
+    """
+
+    def set_up(self):
+        super(DealingGame, self).set_up()
+        for player in self.players:
+            self.draw(player=player)
+
+    def create_player(self):
+        player = super(DealingGame, self).create_player()
+        self.draw_nothing(player=player)
+        return player
+
+
+def game_state(game):
+    """
+    Get the state of a game in a comparable form.
+    """
+
+    return sorted(game.get_state(), key=lambda obj: obj['game_id'])
+
+
+class PersistenceTestCase(TestCase):
+
+    """
+    Test snapshots, journals and recovery.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = GameStore(self.directory, snapshot_interval=5)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def restart(self):
+        """
+        Close the store and open a new one on the same directory.
+        """
+
+        self.store.close()
+        self.store = GameStore(self.directory, snapshot_interval=5)
+
+    def test_journal(self):
+        """
+        Make sure players, set up and actions (but not nested actions) are
+        journaled with game objects replaced by their ids.
+        """
+
+        game = ShuffleGame()
+        self.store.attach(game, 0)
+        player = game.add_player()
+        game.start()
+        game.draw(player=player)
+        self.store.flush()
+
+        records = read_journal(self.store.journal_path(0, 1))
+        self.assertEqual(records, [['add_player'], ['set_up'],
+                                   ['action', 'draw', [],
+                                    {'player': player.game_id}]])
+
+    def test_recover(self):
+        """
+        Make sure a recovered game is the same as the original, across
+        several snapshots.
+        """
+
+        game = ShuffleGame()
+        game.seed(1234)
+        self.store.attach(game, 3)
+        player = game.add_player()
+        game.start()
+        for _ in range(12):
+            game.draw(player=player)
+        self.restart()
+
+        self.assertEqual(self.store.game_ids(), [3])
+        recovered = self.store.load(3)
+        self.assertEqual(game_state(recovered), game_state(game))
+        self.assertEqual(recovered.sequence, game.sequence)
+        # The random number generators should be in sync as well.
+        game.draw(player=player)
+        recovered.draw(player=recovered.get_object(player.game_id))
+        self.assertEqual(game_state(recovered), game_state(game))
+        # Only the latest journal is kept.
+        self.store.flush()
+        journals = [filename for filename in os.listdir(self.directory)
+                    if filename.endswith('.journal')]
+        self.assertEqual(len(journals), 1)
+        # Zones should still know what's in them.
+        hand = recovered.get_object(player.game_id).hand
+        card = hand[3]
+        self.assertIn(card, hand)
+        hand.remove(card)
+        self.assertNotIn(card, hand)
+        self.assertEqual(len(hand), len(player.hand) - 1)
+
+    def test_truncated_journal(self):
+        """
+        Make sure a partially written record at the end of a journal is
+        ignored.
+        """
+
+        game = ShuffleGame()
+        self.store.attach(game, 0)
+        player = game.add_player()
+        game.start()
+        game.draw(player=player)
+        self.store.flush()
+        expected = game_state(game)
+        with open(self.store.journal_path(0, 1), 'ab') as journal_file:
+            journal_file.write('["action", "dr')
+        self.restart()
+
+        self.assertEqual(game_state(self.store.load(0)), expected)
+
+    def test_replay_parameters(self):
+        """
+        Make sure annotated parameters are converted back into game objects.
+        """
+
+        game_master = GameMaster(self.store)
+        game_id = game_master.create(game_master.register(SIMPLE_GAME))
+        game = game_master.get_game(game_id)
+        player = game.add_player()
+        game.start()
+        game.test_parameter_action(player=player, game_object=game.game_object)
+        self.restart()
+
+        game_master = GameMaster(self.store)
+        game_master.register(SIMPLE_GAME)
+        self.assertEqual(game_master.recover(), [game_id])
+        recovered = game_master.get_game(game_id)
+        self.assertIs(recovered.test_parameter, recovered.game_object)
+        self.assertEqual(game_master.create(0), game_id + 1)
+
+    def test_recover_imports_module(self):
+        """
+        Make sure game modules are imported when a game is restored (as they
+        aren't on sys.path).
+        """
+
+        game_master = GameMaster(self.store)
+        game_id = game_master.create(game_master.register(SIMPLE_GAME))
+        module_name = game_master.game_types[0].module_name
+        self.restart()
+
+        module = sys.modules.pop(module_name)
+        try:
+            game_master = GameMaster(self.store)
+            game_master.register(SIMPLE_GAME)
+            game_master.recover()
+            game = game_master.get_game(game_id)
+            self.assertEqual(type(game).__name__, 'SimpleGame')
+            self.assertIn(module_name, sys.modules)
+        finally:
+            sys.modules[module_name] = module
+
+    def test_destroy(self):
+        """
+        Make sure destroying a game deletes its files.
+        """
+
+        game_master = GameMaster(self.store)
+        game_id = game_master.create(game_master.register(SIMPLE_GAME))
+        game_master.get_game(game_id).add_player()
+        game_master.destroy(game_id)
+        self.store.flush()
+
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_journal_nested_in_set_up(self):
+        """
+        Make sure actions run while setting up the game or adding a player
+        aren't journaled on their own, so they only run once on recovery.
+        """
+
+        game = DealingGame()
+        game.seed(7)
+        self.store.attach(game, 0)
+        player = game.add_player()
+        game.start()
+        self.store.flush()
+        self.assertEqual(read_journal(self.store.journal_path(0, 1)),
+                         [['add_player'], ['set_up']])
+        self.restart()
+
+        recovered = self.store.load(0)
+        self.assertEqual(len(recovered.players[0].hand), 1)
+        self.assertEqual(game_state(recovered), game_state(game))
+        self.assertEqual(len(player.hand), 1)
+
+    def test_replay_spectator(self):
+        """
+        Make sure actions run by spectators (as player None) are replayed.
+        """
+
+        game = ShuffleGame()
+        count = replay(game, [['action', 'draw_nothing', [],
+                               {'player': None}]])
+        self.assertEqual(count, 1)
+        self.assertTrue(game.get_game_attribute('drew_nothing'))
+
+    def test_replay_failure(self):
+        """
+        Make sure records that fail are skipped, and the rest are still
+        replayed.
+        """
+
+        game = ShuffleGame()
+        count = replay(game, [['add_player'], ['action', 'missing', [], {}],
+                              ['unknown'], ['add_player']])
+        self.assertEqual(count, 2)
+        self.assertEqual(len(game.players), 2)
+
+    def test_replay_failed_action(self):
+        """
+        Make sure an action that failed part of the way through is replayed
+        up to the same point, and the records after it are still replayed.
+        """
+
+        game = ShuffleGame()
+        game.seed(4)
+        player = game.add_player()
+        game.set_up()
+        self.assertRaises(RuntimeError, game.draw_and_fail, player=player)
+        game.draw(player=player)
+
+        replayed = ShuffleGame()
+        replayed.seed(4)
+        count = replay(replayed, [
+            ['add_player'], ['set_up'],
+            ['action', 'draw_and_fail', [], {'player': player.game_id}],
+            ['action', 'draw', [player.game_id], {}]])
+        self.assertEqual(count, 3)
+        self.assertEqual(game_state(replayed), game_state(game))
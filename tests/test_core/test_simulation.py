@@ -0,0 +1,143 @@
+"""
+This file contains the tests around playing games headlessly.
+"""
+
+from unittest import TestCase
+
+from deckr.core.game_definition import GameDefinition
+from deckr.core.simulation import RandomPolicy, Simulation, derive_seed
+from tests.settings import NIM_GAME, SIMPLE_GAME
+
+
+def load_definition(path):
+    """
+    Load a game definition.
+    """
+
+    game_definition = GameDefinition()
+    game_definition.load(path)
+    return game_definition
+
+
+class SimulationTestCase(TestCase):
+
+    """
+    Test the simulation runner.
+    """
+
+    def setUp(self):
+        self.simulation = Simulation(load_definition(NIM_GAME),
+                                     [RandomPolicy(), RandomPolicy()])
+
+    def test_play(self):
+        """
+        Make sure a game is played to the end without recording transitions.
+        """
+
+        game, actions = self.simulation.play(seed=1)
+        self.assertTrue(game.is_over())
+        self.assertEqual(game.get_game_attribute('tokens'), 0)
+        self.assertTrue(4 <= actions <= 10)
+        self.assertEqual(game.get_all_transitions(), [(game.players[0], []),
+                                                      (game.players[1], [])])
+        self.assertEqual(len(game.transition_log), 0)
+        self.assertGreater(game.sequence, actions)
+        # Every action went through its wrapper.
+        self.assertEqual(game.actions_run, actions)
+
+    def test_reproducible(self):
+        """
+        Make sure a game can be replayed from its seed.
+        """
+
+        first, first_actions = self.simulation.play(seed=5)
+        second, second_actions = self.simulation.play(seed=5)
+        self.assertEqual(first_actions, second_actions)
+        self.assertEqual(first.get_state(), second.get_state())
+
+    def test_record_transitions(self):
+        """
+        Make sure transitions are recorded when asked for.
+        """
+
+        self.simulation.record_transitions = True
+        game, _ = self.simulation.play(seed=1)
+        self.assertIn({'update_type': 'set', 'game_object': game,
+                       'field': 'tokens', 'value': 0},
+                      game.get_transitions(None))
+
+    def test_run(self):
+        """
+        Make sure a run reports its throughput and can be repeated.
+        """
+
+        result = self.simulation.run(20, seed=3)
+        self.assertEqual(result['games'], 20)
+        self.assertEqual(result['finished'], 20)
+        self.assertEqual(result['seed'], 3)
+        self.assertAlmostEqual(sum(result['win_rates'].values()), 1.0)
+        self.assertEqual(sum(result['lengths'].values()), 20)
+        self.assertEqual(result['action_counts'], {'take': result['actions']})
+        self.assertGreater(result['actions_per_second'], 0)
+        self.assertGreater(result['games_per_second'], 0)
+        self.assertEqual(self.simulation.run(20, seed=3)['actions'],
+                         result['actions'])
+
+    def test_max_actions(self):
+        """
+        Make sure games that never end are stopped.
+        """
+
+        simulation = Simulation(load_definition(SIMPLE_GAME),
+                                [RandomPolicy()], max_actions=7)
+        game, actions = simulation.play()
+        self.assertEqual(actions, 7)
+        self.assertFalse(game.is_over())
+
+
+class ParallelSimulationTestCase(TestCase):
+
+    """
+    Test splitting simulations up and running them in parallel.
+    """
+
+    def setUp(self):
+        self.simulation = Simulation(load_definition(NIM_GAME),
+                                     [RandomPolicy(), RandomPolicy()])
+
+    def test_derive_seed(self):
+        """
+        Make sure every game in a run gets its own repeatable seed.
+        """
+
+        self.assertEqual(derive_seed(1, 2), derive_seed(1, 2))
+        self.assertEqual(len(set(derive_seed(1, index)
+                                 for index in range(100))), 100)
+        self.assertNotEqual(derive_seed(1, 2), derive_seed(2, 1))
+
+    def test_merge(self):
+        """
+        Make sure merging the results of two batches gives the same totals as
+        playing them as one batch.
+        """
+
+        merged = self.simulation.play_batch(9, 10, 15).merge(
+            self.simulation.play_batch(9, 0, 10))
+        whole = self.simulation.play_batch(9, 0, 25)
+        for attribute in ('games', 'finished', 'actions', 'wins', 'lengths',
+                          'action_counts'):
+            self.assertEqual(getattr(merged, attribute),
+                             getattr(whole, attribute))
+
+    def test_run_parallel(self):
+        """
+        Make sure a parallel run gives the same results as running the games
+        in this process.
+        """
+
+        result = self.simulation.run_parallel(40, seed=7, processes=2,
+                                              chunk_size=3)
+        expected = self.simulation.run(40, seed=7)
+        for key in ('games', 'finished', 'actions', 'win_rates', 'lengths',
+                    'action_counts'):
+            self.assertEqual(result[key], expected[key])
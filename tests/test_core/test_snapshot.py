@@ -0,0 +1,143 @@
+"""
+This file contains the tests around the snapshot format.
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from deckr.core.game import Game
+from deckr.core.game_master import GameMaster
+from deckr.core.game_object import GameObject
+from deckr.core.persistence import GameStore
+from deckr.core.snapshot import HEADER, Snapshot, dump_snapshot
+from tests.settings import SIMPLE_GAME
+
+
+class DeckGame(Game):
+
+    """
+    A game with a deck of objects.
+    """
+
+    game_zones = [{'name': 'deck'}]
+    player_zones = [{'name': 'hand'}]
+
+    def set_up(self):
+        for i in range(5):
+            card = GameObject()
+            self.register(card)
+            card.set_game_attribute('rank', i)
+            self.deck.push(card)
+
+
+def sort_state(state):
+    """
+    Put a game state in a comparable order.
+    """
+
+    return sorted(state, key=lambda obj: obj['game_id'])
+
+
+class SnapshotTestCase(TestCase):
+
+    """
+    Test building and reading snapshots.
+    """
+
+    def setUp(self):
+        self.game = DeckGame()
+        self.player = self.game.add_player()
+        self.game.set_up()
+
+    def test_header(self):
+        """
+        Make sure the header is read.
+        """
+
+        self.game.flush_all_transitions()
+        snapshot = Snapshot(dump_snapshot(self.game, 7))
+        self.assertEqual(snapshot.generation, 7)
+        self.assertEqual(snapshot.sequence, self.game.sequence)
+        self.assertRaises(ValueError, Snapshot, 'X' * 200)
+
+    def test_restore(self):
+        """
+        Make sure the game can be restored and the journal isn't included.
+        """
+
+        self.game.journal = 'journal'
+        snapshot = Snapshot(dump_snapshot(self.game, 1))
+        self.assertEqual(self.game.journal, 'journal')
+
+        game = snapshot.restore()
+        self.assertIsNone(game.journal)
+        self.assertEqual(sort_state(game.get_state()),
+                         sort_state(self.game.get_state()))
+
+
+class LazyRestoreTestCase(TestCase):
+
+    """
+    Test that recovered games are only restored when they're asked for.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = GameStore(self.directory)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_lazy_restore(self):
+        """
+        Recover two games and only touch one of them.
+        """
+
+        game_master = GameMaster(self.store)
+        game_type = game_master.register(SIMPLE_GAME)
+        first = game_master.create(game_type)
+        second = game_master.create(game_type)
+        game_master.get_game(first).add_player()
+        self.store.flush()
+
+        game_master = GameMaster(self.store)
+        game_master.register(SIMPLE_GAME)
+        self.assertEqual(game_master.recover(), [first, second])
+        self.assertEqual(game_master.games, {})
+        self.assertEqual(sorted(game_master.snapshots), [first, second])
+
+        game = game_master.get_game(first)
+        self.assertEqual(len(game.players), 1)
+        self.assertEqual(game_master.games.keys(), [first])
+        self.assertEqual(game_master.snapshots.keys(), [second])
+        self.assertRaises(ValueError, game_master.create, game_type,
+                          game_id=second)
+        self.assertRaises(KeyError, game_master.get_game, 12)
+
+        game_master.destroy(second)
+        self.store.flush()
+        self.assertFalse(os.path.exists(self.store.snapshot_path(second)))
+
+    def test_bad_snapshot(self):
+        """
+        Make sure games whose snapshots can't be read are skipped, and that
+        opening a snapshot only reads its header.
+        """
+
+        game_master = GameMaster(self.store)
+        game_type = game_master.register(SIMPLE_GAME)
+        first = game_master.create(game_type)
+        second = game_master.create(game_type)
+        self.store.flush()
+        with open(self.store.snapshot_path(first), 'wb') as snapshot_file:
+            snapshot_file.write('DECK')
+
+        game_master = GameMaster(self.store)
+        game_master.register(SIMPLE_GAME)
+        self.assertEqual(game_master.recover(), [second])
+        snapshot = game_master.snapshots[second]
+        self.assertEqual(len(snapshot.data), HEADER.size)
+        self.assertIsNotNone(game_master.get_game(second))
@@ -2,8 +2,10 @@
 This file contains all the tests around zones.
 """
 
+import random
 from unittest import TestCase
 
+from deckr.contrib.playing_card import PlayingCard
 from deckr.core.game import Game
 from deckr.core.game_object import GameObject
 from deckr.core.zone import HasZones, Zone
@@ -106,6 +108,127 @@ class ZoneTestCase(TestCase):
         self.assertNotIn(self.game_object1, self.zone)
         self.zone.remove(self.game_object1)
 
+    def test_equality(self):
+        """
+        Make sure that objects that compare equal to an object in the zone
+        (but aren't it) are still found, and that the one in the zone is
+        the one that gets removed.
+        """
+
+        game = Game()
+        card = PlayingCard(3, 'hearts')
+        other = PlayingCard(5, 'hearts')
+        game.register([self.zone, card, other])
+        self.zone.extend([other, card])
+        copy = PlayingCard(3, 'hearts')
+        self.assertIn(copy, self.zone)
+        self.assertNotIn(PlayingCard(4, 'hearts'), self.zone)
+        self.assertNotIn(self.game_object1, self.zone)
+        self.assertEqual(self.zone.index(copy), 1)
+
+        game.flush_all_transitions()
+        self.zone.remove(copy)
+        self.assertEqual(list(self.zone), [other])
+        self.assertEqual(game.public_transitions,
+                         [{'update_type': 'remove', 'zone': self.zone.game_id,
+                           'game_object': card.game_id}])
+        self.assertEqual(self.zone.discard_many([PlayingCard(5, 'hearts')]),
+                         [other])
+
+    def test_insert_and_index(self):
+        """
+        Test inserting objects at specific positions and looking up their
+        position.
+        """
+
+        self.zone.push(self.game_object1)
+        self.zone.push(self.game_object2)
+        self.zone.insert(0, self.game_object3)
+        self.assertEqual(list(self.zone),
+                         [self.game_object3, self.game_object1,
+                          self.game_object2])
+        self.assertEqual(self.zone.index(self.game_object1), 1)
+
+        self.zone.remove(self.game_object1)
+        self.assertEqual(self.zone.index(self.game_object2), 1)
+        self.assertRaises(ValueError, self.zone.index, self.game_object1)
+
+        self.zone.insert(-1, self.game_object1)
+        self.assertEqual(list(self.zone),
+                         [self.game_object3, self.game_object1,
+                          self.game_object2])
+        self.zone.insert(100, self.game_object1)
+        self.assertEqual(self.zone[-1], self.game_object1)
+
+    def test_large_zone(self):
+        """
+        Make sure that the zone keeps its order when lots of objects are
+        removed from the middle (and the slots get compacted), and that
+        objects can be in the zone more than once.
+        """
+
+        objs = [GameObject() for _ in range(100)]
+        self.zone.set(objs)
+        for obj in objs[10:90]:
+            self.zone.remove(obj)
+            self.assertNotIn(obj, self.zone)
+        self.assertEqual(list(self.zone), objs[:10] + objs[90:])
+        self.assertEqual(len(self.zone), 20)
+        self.assertEqual(self.zone[10], objs[90])
+        self.assertEqual(self.zone.pop(), objs[-1])
+
+        self.zone.push(objs[0])
+        self.zone.remove(objs[0])
+        self.assertIn(objs[0], self.zone)
+        self.assertEqual(self.zone[-1], objs[0])
+        self.zone.remove(objs[0])
+        self.assertNotIn(objs[0], self.zone)
+        self.assertEqual(len(self.zone), 18)
+
+    def test_lookups_with_tombstones(self):
+        """
+        Make sure index and [] skip tombstones without compacting the zone,
+        checked against a plain list through random operations.
+        """
+
+        # pylint: disable=protected-access
+        rng = random.Random(4)
+        objs = [GameObject() for _ in range(200)]
+        self.zone.extend(objs)
+        expected = list(objs)
+        for _ in range(600):
+            choice = rng.random()
+            if choice < 0.4 and expected:
+                obj = rng.choice(expected)
+                self.zone.remove(obj)
+                expected.remove(obj)
+            elif choice < 0.6:
+                obj = GameObject()
+                self.zone.push(obj)
+                expected.append(obj)
+            elif choice < 0.7:
+                self.assertEqual(self.zone.draw(2, Zone()), expected[:-3:-1])
+                del expected[-2:]
+            elif expected:
+                position = rng.randrange(len(expected))
+                self.assertIs(self.zone[position], expected[position])
+                self.assertIs(self.zone[position - len(expected)],
+                              expected[position])
+                self.assertEqual(self.zone.index(expected[position]),
+                                 expected.index(expected[position]))
+            self.assertEqual(len(self.zone), len(expected))
+        self.assertEqual(list(self.zone), expected)
+        self.assertEqual(self.zone[1:4], expected[1:4])
+
+        # Looking things up doesn't compact the zone.
+        self.zone.set(objs)
+        self.zone.remove(objs[5])
+        slots = list(self.zone._zone)
+        self.assertEqual(self.zone.index(objs[6]), 5)
+        self.assertIs(self.zone[5], objs[6])
+        self.assertEqual(self.zone._zone, slots)
+        self.assertRaises(IndexError, self.zone.__getitem__, 199)
+
     def test_set_clear_transfer(self):
         """
         Test the mass operations (putting a list, clearing, transfering).
@@ -183,6 +306,31 @@ class ZoneTestCase(TestCase):
         self.assertEqual(self.zone.serialize(),
                          {'game_id': 1, 'type': 'Zone', 'objects': [2, 3, 4]})
 
+    def test_version(self):
+        """
+        Make sure that zone mutations bump the version so the serialization is
+        rebuilt.
+        """
+
+        game = Game()
+        game.register(
+            [self.zone, self.game_object1, self.game_object2])
+        self.assertEqual(self.zone.serialize()['objects'], [])
+
+        version = self.zone.version
+        self.zone.push(self.game_object1)
+        self.zone.push(self.game_object2)
+        self.assertGreater(self.zone.version, version)
+        self.assertEqual(self.zone.serialize()['objects'],
+                         [self.game_object1.game_id,
+                          self.game_object2.game_id])
+
+        self.zone.remove(self.game_object1)
+        self.assertEqual(self.zone.serialize()['objects'],
+                         [self.game_object2.game_id])
+        self.zone.pop()
+        self.assertEqual(self.zone.serialize()['objects'], [])
+
     def test_transitions(self):
         """
         Make sure that we can properly register transitions.
@@ -230,3 +378,131 @@ class ZoneTestCase(TestCase):
                          [{'update_type': 'remove',
                            'game_object': self.game_object2.game_id,
                            'zone': self.zone.game_id}])
+
+    def test_bulk_operations(self):
+        """
+        Make sure that the bulk operations move everything at once and only
+        produce a single transition.
+        """
+
+        game = Game()
+        game.register(
+            [self.game_object1, self.game_object2, self.game_object3])
+        game.register(self.zone)
+        zone2 = Zone()
+        game.register(zone2)
+        player = game.add_player()
+        ids = [self.game_object1.game_id, self.game_object2.game_id,
+               self.game_object3.game_id]
+
+        self.zone.extend(
+            [self.game_object1, self.game_object2, self.game_object3])
+        self.assertEqual(list(self.zone),
+                         [self.game_object1, self.game_object2,
+                          self.game_object3])
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'move_many',
+                           'zone': self.zone.game_id,
+                           'game_objects': ids,
+                           'replace': False}])
+        game.flush_all_transitions()
+
+        self.zone.move_many([self.game_object3, self.game_object1], zone2)
+        self.assertEqual(list(self.zone), [self.game_object2])
+        self.assertEqual(list(zone2), [self.game_object3, self.game_object1])
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'move_many',
+                           'zone': zone2.game_id,
+                           'game_objects': [ids[2], ids[0]],
+                           'replace': False}])
+        game.flush_all_transitions()
+
+        zone2.move_all_to(self.zone)
+        self.assertEqual(len(zone2), 0)
+        self.assertEqual(list(self.zone),
+                         [self.game_object2, self.game_object3,
+                          self.game_object1])
+        self.assertEqual(len(game.get_transitions(player)), 1)
+        game.flush_all_transitions()
+
+        self.zone.replace([self.game_object1])
+        self.assertEqual(list(self.zone), [self.game_object1])
+        self.assertNotIn(self.game_object2, self.zone)
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'move_many',
+                           'zone': self.zone.game_id,
+                           'game_objects': [ids[0]],
+                           'replace': True}])
+        game.flush_all_transitions()
+
+        # Moving nothing doesn't produce a transition
+        self.zone.move_many([self.game_object2], zone2)
+        zone2.move_all_to(self.zone)
+        self.assertEqual(game.get_transitions(player), [])
+
+    def test_shuffle_draw_deal(self):
+        """
+        Make sure that shuffling, cutting, drawing and dealing work and only
+        produce a single transition each.
+        """
+
+        game = Game()
+        player = game.add_player()
+        objs = [GameObject() for _ in range(10)]
+        game.register(objs)
+        hands = [Zone(), Zone()]
+        game.register([self.zone] + hands)
+        self.zone.extend(objs)
+        game.flush_all_transitions()
+
+        game.seed(5)
+        self.zone.shuffle()
+        order = list(self.zone)
+        self.assertEqual(sorted(order, key=lambda x: x.game_id), objs)
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'move_many',
+                           'zone': self.zone.game_id,
+                           'game_objects': [obj.game_id for obj in order],
+                           'replace': True}])
+        game.flush_all_transitions()
+
+        # The same seed gives the same shuffle
+        zone2 = Zone()
+        zone2.extend(objs)
+        zone2.shuffle(random.Random(game.random_seed))
+        self.assertEqual(list(zone2), order)
+
+        self.zone.cut(3)
+        self.assertEqual(list(self.zone), order[3:] + order[:3])
+        self.assertEqual(len(game.get_transitions(player)), 1)
+        game.flush_all_transitions()
+        order = list(self.zone)
+
+        drawn = self.zone.draw(2, hands[0])
+        self.assertEqual(drawn, [order[-1], order[-2]])
+        self.assertEqual(list(hands[0]), drawn)
+        self.assertEqual(len(self.zone), 8)
+        self.assertNotIn(order[-1], self.zone)
+        self.assertEqual(len(game.get_transitions(player)), 1)
+        game.flush_all_transitions()
+
+        dealt = self.zone.deal(2, hands)
+        self.assertEqual(dealt, [[order[-3], order[-5]],
+                                 [order[-4], order[-6]]])
+        self.assertEqual(list(hands[1]), dealt[1])
+        self.assertEqual(len(self.zone), 4)
+        self.assertEqual(game.get_transitions(player),
+                         [{'update_type': 'deal',
+                           'zone': self.zone.game_id,
+                           'deals': [{'zone': hands[0].game_id,
+                                      'game_objects': [obj.game_id for obj
+                                                       in dealt[0]]},
+                                     {'zone': hands[1].game_id,
+                                      'game_objects': [obj.game_id for obj
+                                                       in dealt[1]]}]}])
+
+        # Running out of objects just stops early.
+        self.assertEqual(self.zone.deal(3, hands),
+                         [order[:4][::-1][::2], order[:4][::-1][1::2]])
+        self.assertEqual(len(self.zone), 0)
+        self.assertEqual(self.zone.draw(3, hands[0]), [])
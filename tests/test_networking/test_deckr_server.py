@@ -3,12 +3,32 @@ Tests around the DeckrServer.
 """
 
 import json
+import shutil
+import tempfile
 from unittest import TestCase
 
 from twisted.test import proto_helpers
 
+from deckr.core.game_object import GameObject
 from deckr.networking.deckr_server import DeckrFactory
-from tests.settings import SIMPLE_GAME
+from deckr.networking.symbols import SymbolTable
+from deckr.networking.wire import (COMPRESSED, JsonEncoding,
+                                   LengthPrefixedFraming, MsgpackEncoding,
+                                   ZlibCompression)
+from tests.settings import BAD_GAME, SIMPLE_GAME
+from tests.test_core.test_hibernation import WriterCalls
+
+
+def read_messages(transport):
+    """
+    Get every line framed JSON message out of a string transport, and clear
+    it.
+    """
+
+    messages = [json.loads(line) for line in
+                transport.value().split('\r\n') if line]
+    transport.clear()
+    return messages
 
 
 class DeckrServerTestCase(TestCase):
@@ -19,7 +39,7 @@ class DeckrServerTestCase(TestCase):
     """
 
     def setUp(self):
-        self.factory = DeckrFactory({'games': [SIMPLE_GAME]})
+        self.factory = DeckrFactory(self.config())
         # Set up the game master
         self.game_master = self.factory.game_master
         self.simple_game_id = self.game_master.game_type_id - 1  # TODO: Fix.
@@ -28,6 +48,13 @@ class DeckrServerTestCase(TestCase):
         self.transport = proto_helpers.StringTransport()
         self.protocol.makeConnection(self.transport)
 
+    def config(self):  # pylint: disable=no-self-use
+        """
+        The configuration for the factory.
+        """
+
+        return {'games': [SIMPLE_GAME]}
+
     def run_command(self, message_type, protocol=None, **kwargs):
         """
         A utility function to run commands with specified parameters.
@@ -58,6 +85,38 @@ class DeckrServerTestCase(TestCase):
         transport.clear()
         return data
 
+    def get_frames(self, encoding=MsgpackEncoding, transport=None,
+                   compression=None):
+        """
+        Get all of the length prefixed frames out of the string transport,
+        decoded with the given encoding. Compressed frames are decompressed
+        with compression.
+        """
+
+        if transport is None:
+            transport = self.transport
+        data = transport.value()
+        transport.clear()
+        messages = []
+        offset = 0
+        while offset < len(data):
+            flags, message, offset = LengthPrefixedFraming.read_frame(
+                data, offset, len(data))
+            if flags & COMPRESSED:
+                message = compression.decompress(message, 2 ** 20)
+            messages.append(encoding.decode(message))
+        return messages
+
+    def send_frame(self, encoding=MsgpackEncoding, protocol=None, **kwargs):
+        """
+        Send a single length prefixed frame.
+        """
+
+        if protocol is None:
+            protocol = self.protocol
+        protocol.dataReceived(
+            LengthPrefixedFraming.frame(encoding.encode(kwargs)))
+
     def assert_produces_error(self, expected_error_message=None):
         """
         Assert that some code produces an error message.
@@ -92,6 +151,19 @@ class DeckrServerManagmentTestCase(DeckrServerTestCase):
         game_types = self.get_response('list_response')['game_types']
         self.assertEqual(len(game_types), 2)
 
+        self.run_command('register_game', game_definition_path=BAD_GAME)
+        self.assertTrue(self.get_response('error')['message'].startswith(
+            "Could not register %s" % BAD_GAME))
+
+    def test_reload_games(self):
+        """
+        Make sure we can ask the server to reload its game definitions.
+        """
+
+        self.run_command('reload_games')
+        response = self.get_response('reload_games_response')
+        self.assertEqual(response['game_type_ids'], [])
+
 
 class DeckrServerGameTestCase(DeckrServerTestCase):
 
@@ -204,6 +276,10 @@ class DeckrServerGameTestCase(DeckrServerTestCase):
         self.run_command('action', action='invalid_action')
         self.assert_produces_error("Invalid action invalid_action")
 
+        # Only actions can be run
+        self.run_command('action', action='set_up')
+        self.assert_produces_error("Invalid action set_up")
+
     def test_action_with_arguments(self):
         """
         Make sure that we get the proper paramter translation.
@@ -215,6 +291,37 @@ class DeckrServerGameTestCase(DeckrServerTestCase):
         self.run_command('action', action='test_parameter_action', game_object=0)
         self.assertEqual(self.game.test_parameter, self.game.get_object(0))
 
+        self.run_command('action', action='test_parameter_action')
+        self.assert_produces_error(
+            "Missing argument for test_parameter_action: game_object")
+        self.run_command('action', action='test_parameter_action',
+                         game_object=1000)
+        self.assert_produces_error("Expected a GameObject but got 1000")
+        self.run_command('action', action='test_parameter_action',
+                         game_object=0, extra=1)
+        self.assert_produces_error(
+            "Invalid arguments for test_parameter_action: extra")
+
+    def test_legal_actions(self):
+        """
+        Make sure the legal_actions command lists actions that can be sent
+        straight back.
+        """
+
+        self.run_command('join', game_id=self.game_id, player_id=None)
+        self.get_response()
+
+        self.run_command('legal_actions')
+        response = self.get_response('legal_actions_response')
+        self.assertEqual(response['sequence'], self.game.sequence)
+        self.assertIn({'action': 'test_action'}, response['actions'])
+        self.assertIn({'action': 'test_parameter_action', 'game_object': 0},
+                      response['actions'])
+
+        self.run_command('action', action='test_parameter_action',
+                         game_object=0)
+        self.assertEqual(self.game.test_parameter, self.game.get_object(0))
+
     def test_action_with_update(self):
         """
         Make sure that when we make an action we get the proper updates.
@@ -237,6 +344,593 @@ class DeckrServerGameTestCase(DeckrServerTestCase):
             self.assertIn(key, response)
             self.assertEqual(response[key], value)
 
+    def test_batched_updates(self):
+        """
+        Make sure that clients that ask for batched updates get all of the
+        transitions from an action in a single message.
+        """
+
+        self.run_command('join', game_id=self.game_id, player_id=None,
+                         batch_updates=True)
+        self.assertTrue(self.get_response('join_response')['batch_updates'])
+        self.run_command('start')
+        self.get_response('start')
+
+        self.run_command('action', action='test_multiple_update_action')
+        response = self.get_response('updates')
+        game_object_id = self.game.game_object.game_id
+        self.assertEqual(response['updates'],
+                         [{'update_type': 'set',
+                           'game_object': game_object_id,
+                           'field': 'foo',
+                           'value': 'bar'},
+                          {'update_type': 'set',
+                           'game_object': game_object_id,
+                           'field': 'baz',
+                           'value': 'qux'}])
+        sequence = response['sequence']
+
+        self.run_command('action', action='test_update_action')
+        response = self.get_response('updates')
+        self.assertEqual(len(response['updates']), 1)
+        self.assertGreater(response['sequence'], sequence)
+
+        # Actions without any transitions shouldn't send anything.
+        self.run_command('action', action='test_action')
+        self.assertEqual(self.transport.value(), '')
+
+    def test_resume(self):
+        """
+        Make sure that a client can resume from the last sequence it saw.
+        """
+
+        self.run_command('join', game_id=self.game_id, player_id=None,
+                         batch_updates=True)
+        sequence = self.get_response('join_response')['sequence']
+        self.run_command('start')
+        self.get_response('start')
+
+        self.run_command('action', action='test_update_action')
+        self.run_command('action', action='test_multiple_update_action')
+        self.transport.clear()
+
+        self.run_command('resume')
+        self.assert_produces_error("Missing required argument: sequence")
+
+        self.run_command('resume', sequence=sequence)
+        response = self.get_response('resume_response')
+        self.assertEqual([update['field'] for update in response['updates']],
+                         ['foo', 'foo', 'baz'])
+        self.assertEqual(response['sequence'], self.game.sequence)
+
+        # Nothing is missing
+        self.run_command('resume', sequence=self.game.sequence)
+        self.assertEqual(self.get_response('resume_response')['updates'], [])
+
+        # Fall back to the full state once the log has rolled over.
+        self.game.transition_log.clear()
+        self.run_command('resume', sequence=sequence)
+        response = self.get_response('resume_response')
+        self.assertNotIn('updates', response)
+        self.assertIn('game_state', response)
+
+    def test_shared_updates(self):
+        """
+        Make sure that public updates reach everyone in the room (including
+        spectators) and that private updates only reach their player.
+        """
+
+        spectator = self.factory.buildProtocol(('127.0.0.1', 0))
+        spectator_transport = proto_helpers.StringTransport()
+        spectator.makeConnection(spectator_transport)
+        other = self.factory.buildProtocol(('127.0.0.1', 0))
+        other_transport = proto_helpers.StringTransport()
+        other.makeConnection(other_transport)
+
+        self.run_command('join', game_id=self.game_id, player_id=None,
+                         batch_updates=True)
+        self.run_command('join', protocol=other, game_id=self.game_id,
+                         player_id=None, batch_updates=True)
+        self.run_command('join', protocol=spectator, game_id=self.game_id,
+                         batch_updates=True)
+        self.run_command('start')
+        for transport in (self.transport, other_transport,
+                          spectator_transport):
+            transport.clear()
+
+        self.run_command('action', action='test_update_action')
+        self.assertEqual(self.transport.value(), other_transport.value())
+        self.assertEqual(self.transport.value(), spectator_transport.value())
+        self.get_response('updates', transport=spectator_transport)
+        self.get_response('updates', transport=other_transport)
+        self.get_response('updates')
+
+        self.run_command('action', action='test_private_update_action')
+        updates = self.get_response('updates')['updates']
+        self.assertEqual([update['field'] for update in updates],
+                         ['foo', 'secret'])
+        for transport in (other_transport, spectator_transport):
+            updates = self.get_response('updates', transport=transport)
+            self.assertEqual([update['field'] for update in
+                              updates['updates']], ['foo'])
+
+    def test_old_clients(self):
+        """
+        Make sure that clients that didn't negotiate batch_updates don't get
+        the updates from setting up the game, and don't get any updates as
+        spectators.
+        """
+
+        def set_up():
+            """
+            Set up the game with an update.
+            """
+
+            self.game.game_object = GameObject()
+            self.game.register(self.game.game_object)
+            self.game.game_object.set_game_attribute('foo', 'start')
+
+        self.game.set_up = set_up
+        spectator = self.factory.buildProtocol(('127.0.0.1', 0))
+        spectator_transport = proto_helpers.StringTransport()
+        spectator.makeConnection(spectator_transport)
+        other = self.factory.buildProtocol(('127.0.0.1', 0))
+        other_transport = proto_helpers.StringTransport()
+        other.makeConnection(other_transport)
+
+        self.run_command('join', game_id=self.game_id, player_id=None)
+        self.run_command('join', protocol=other, game_id=self.game_id,
+                         player_id=None, batch_updates=True)
+        self.run_command('join', protocol=spectator, game_id=self.game_id)
+        for transport in (self.transport, other_transport,
+                          spectator_transport):
+            transport.clear()
+
+        self.run_command('start')
+        self.get_response('start')
+        self.get_response('start', transport=spectator_transport)
+        messages = read_messages(other_transport)
+        self.assertEqual([message['message_type'] for message in messages],
+                         ['start', 'updates'])
+        self.assertEqual(messages[1]['updates'][0]['value'], 'start')
+
+        self.run_command('action', action='test_update_action')
+        self.assertEqual(self.get_response('update')['value'], 'bar')
+        self.get_response('updates', transport=other_transport)
+        self.assertEqual(spectator_transport.value(), '')
+
+
+
+class DeckrServerEncodingTestCase(DeckrServerTestCase):
+
+    """
+    Test switching between wire formats.
+    """
+
+    def test_set_encoding(self):
+        """
+        Make sure that we can switch to the binary wire format and back.
+        """
+
+        self.run_command('set_encoding', encoding='msgpack')
+        response = self.get_response('set_encoding_response')
+        self.assertEqual(response['framing'], 'length_prefixed')
+
+        self.send_frame(message_type='list')
+        response = self.get_frames()
+        self.assertEqual(response,
+                         [{'message_type': 'list_response',
+                           'game_types': [[self.simple_game_id,
+                                           'Simple Game']]}])
+
+        # Several frames (and a partial one) in one go, including a payload
+        # with a line break in it.
+        data = ''.join(LengthPrefixedFraming.frame(MsgpackEncoding.encode(
+            {'message_type': 'create', 'game_type_id': self.simple_game_id,
+             'padding': '\r\n'})) for _ in range(3))
+        self.protocol.dataReceived(data[:-3])
+        self.assertEqual(len(self.get_frames()), 2)
+        self.protocol.dataReceived(data[-3:])
+        self.assertEqual(self.get_frames()[0]['message_type'],
+                         'create_response')
+
+        # Garbage in a frame
+        self.protocol.dataReceived(LengthPrefixedFraming.frame('\xc1'))
+        self.assertEqual(self.get_frames()[0]['message'],
+                         "Malformed message: Could not decode MessagePack")
+
+        # Switch back to JSON lines, with a line right behind it.
+        self.protocol.dataReceived(
+            LengthPrefixedFraming.frame(MsgpackEncoding.encode(
+                {'message_type': 'set_encoding', 'encoding': 'json'})) +
+            '{"message_type": "list"}\r\n')
+        data = self.transport.value()
+        _, message, offset = LengthPrefixedFraming.read_frame(data, 0,
+                                                              len(data))
+        self.assertEqual(MsgpackEncoding.decode(message)['framing'], 'line')
+        self.transport.clear()
+        self.transport.write(data[offset:])
+        self.get_response('list_response')
+
+    def test_bad_encoding(self):
+        """
+        Make sure that we reject encodings we don't know about, and binary
+        encodings with line framing.
+        """
+
+        self.run_command('set_encoding', encoding='foobar')
+        self.assert_produces_error("Invalid encoding: foobar")
+        self.run_command('set_encoding', encoding='json', framing='foobar')
+        self.assert_produces_error("Invalid framing: foobar")
+        self.run_command('set_encoding', encoding='msgpack', framing='line')
+        self.assert_produces_error("Only json can be used with line framing")
+        self.run_command('set_encoding', encoding=[])
+        self.assert_produces_error("Invalid encoding: []")
+        self.run_command('set_encoding', encoding='json', framing=None)
+        self.assert_produces_error("Invalid framing: None")
+        self.run_command('set_encoding', encoding='json', framing={})
+        self.assert_produces_error("Invalid framing: {}")
+
+        self.run_command('set_encoding', encoding='json',
+                         framing='length_prefixed')
+        self.get_response('set_encoding_response')
+        self.protocol.dataReceived('\xff\xff\xff\xff\x00')
+        self.assertEqual(self.get_frames(JsonEncoding)[0]['message'],
+                         "Malformed message: Frame too long")
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_compression(self):
+        """
+        Make sure that large messages are compressed in both directions once
+        compression has been negotiated, and small ones aren't.
+        """
+
+        self.run_command('set_encoding', encoding='json', compression='zlib')
+        response = self.get_response('set_encoding_response')
+        self.assertEqual((response['framing'], response['compression']),
+                         ('length_prefixed', 'zlib'))
+
+        received = ZlibCompression()
+        self.send_frame(JsonEncoding, message_type='list')
+        flags, _, _ = LengthPrefixedFraming.read_frame(
+            self.transport.value(), 0, 2 ** 20)
+        self.assertEqual(flags, 0)
+        self.get_frames(JsonEncoding)
+
+        sent = ZlibCompression(threshold=0)
+        flags, data = sent.compress(JsonEncoding.encode(
+            {'message_type': 'create', 'game_type_id': self.simple_game_id,
+             'padding': 'x' * 1000}))
+        self.protocol.dataReceived(LengthPrefixedFraming.frame(data, flags))
+        game_id = self.get_frames(JsonEncoding)[0]['game_id']
+
+        self.send_frame(JsonEncoding, message_type='join', game_id=game_id,
+                        player_id=None)
+        self.get_frames(JsonEncoding)
+        self.protocol.compression.threshold = 0
+        for _ in range(2):
+            self.send_frame(JsonEncoding, message_type='game_state')
+            data = self.transport.value()
+            flags, _, _ = LengthPrefixedFraming.read_frame(data, 0, len(data))
+            self.assertEqual(flags, COMPRESSED)
+            response = self.get_frames(JsonEncoding, compression=received)
+            self.assertEqual(response[0]['message_type'],
+                             'game_state_response')
+
+    def test_bad_compression(self):
+        """
+        Make sure that we reject unknown compressions, compression with line
+        framing and compressed frames we can't decompress.
+        """
+
+        self.run_command('set_encoding', encoding='json', compression='lzma')
+        self.assert_produces_error("Invalid compression: lzma")
+        self.run_command('set_encoding', encoding='json', framing='line',
+                         compression='zlib')
+        self.assert_produces_error(
+            "Compression requires length_prefixed framing")
+
+        self.run_command('set_encoding', encoding='json',
+                         framing='length_prefixed')
+        self.get_response('set_encoding_response')
+        self.protocol.dataReceived(LengthPrefixedFraming.frame('{}',
+                                                               COMPRESSED))
+        self.assertEqual(self.get_frames(JsonEncoding)[0]['message'],
+                         "Malformed message: Could not decompress")
+        self.assertTrue(self.transport.disconnecting)
+
+    def test_mixed_room(self):
+        """
+        Make sure that clients in the same room can use different wire
+        formats.
+        """
+
+        other = self.factory.buildProtocol(('127.0.0.1', 0))
+        other_transport = proto_helpers.StringTransport()
+        other.makeConnection(other_transport)
+
+        self.run_command('create', game_type_id=self.simple_game_id)
+        game_id = self.get_response('create_response')['game_id']
+        self.run_command('set_encoding', protocol=other, encoding='msgpack')
+        other_transport.clear()
+
+        self.run_command('join', game_id=game_id, player_id=None,
+                         batch_updates=True)
+        self.send_frame(protocol=other, message_type='join',
+                        game_id=game_id, player_id=None)
+        self.get_response('join_response')
+        self.get_frames(transport=other_transport)
+
+        self.run_command('start')
+        self.get_response('start')
+        self.assertEqual(self.get_frames(transport=other_transport),
+                         [{'message_type': 'start'}])
+
+        self.run_command('action', action='test_multiple_update_action')
+        self.assertEqual(len(self.get_response('updates')['updates']), 2)
+        updates = self.get_frames(transport=other_transport)
+        self.assertEqual([update['message_type'] for update in updates],
+                         ['update', 'update'])
+        self.assertEqual(updates[0]['value'], 'bar')
+
+
+class DeckrServerSymbolsTestCase(DeckrServerTestCase):
+
+    """
+    Test joining with a symbol table.
+    """
+
+    def setUp(self):
+        super(DeckrServerSymbolsTestCase, self).setUp()
+        self.run_command('create', game_type_id=self.simple_game_id)
+        self.game_id = self.get_response('create_response')['game_id']
+        self.run_command('join', game_id=self.game_id, player_id=None,
+                         symbols=True)
+        self.symbols = self.get_response('join_response')['symbols']
+
+    def expand(self, value):
+        """
+        Expand a compacted value with the symbols we have been sent.
+        """
+
+        table = SymbolTable()
+        table.symbols = self.symbols
+        return table.expand(value)
+
+    def get_messages(self, transport=None):
+        """
+        Get every message out of the transport, keeping track of any symbols
+        that get sent.
+        """
+
+        if transport is None:
+            transport = self.transport
+        messages = read_messages(transport)
+        for message in messages:
+            if message['message_type'] == 'symbols':
+                self.assertIn(message['offset'], (0, len(self.symbols)))
+                self.symbols = (self.symbols[:message['offset']] +
+                                message['symbols'])
+        return [message for message in messages
+                if message['message_type'] != 'symbols']
+
+    def test_join(self):
+        """
+        Make sure that we get a table at join, and only when we ask for it.
+        """
+
+        self.assertIn('update_type', self.symbols)
+        other = self.factory.buildProtocol(('127.0.0.1', 0))
+        other.makeConnection(proto_helpers.StringTransport())
+        self.run_command('join', game_id=self.game_id, player_id=None,
+                         protocol=other)
+        self.assertEqual(self.factory.symbol_tables.keys(), [self.game_id])
+
+    def test_updates(self):
+        """
+        Make sure that updates are compacted, that new symbols are sent
+        before they're used, and that clients without a table still get
+        plain updates.
+        """
+
+        other = self.factory.buildProtocol(('127.0.0.1', 0))
+        other_transport = proto_helpers.StringTransport()
+        other.makeConnection(other_transport)
+        self.run_command('join', protocol=other, game_id=self.game_id,
+                         player_id=None)
+        self.assertIsNone(self.get_response(
+            'join_response', transport=other_transport)['symbols'])
+
+        self.run_command('start')
+        self.get_messages()
+        other_transport.clear()
+
+        self.run_command('action', action='test_update_action')
+        update, = self.get_messages()
+        self.assertEqual(update['message_type'], 'update')
+        update.pop('message_type')
+        self.assertNotIn('update_type', update)
+        self.assertEqual(self.expand(update)['field'], 'foo')
+        self.assertEqual(self.get_response(
+            'update', transport=other_transport)['field'], 'foo')
+
+        # Symbols we already have aren't sent again.
+        self.run_command('action', action='test_update_action')
+        messages = self.get_messages()
+        self.assertEqual(len(messages), 1)
+
+    def test_reset(self):
+        """
+        Make sure that a full table is reset between messages, and that the
+        client is sent the whole new table.
+        """
+
+        self.run_command('start')
+        self.get_messages()
+        table = self.factory.symbol_tables[self.game_id]
+        table.max_symbols = len(table) - 1
+        self.run_command('action', action='test_update_action')
+        update, = self.get_messages()
+        update.pop('message_type')
+        self.assertEqual(table.generation, 1)
+        self.assertEqual(self.symbols, table.symbols)
+        self.assertEqual(self.expand(update)['field'], 'foo')
+
+    def test_game_state(self):
+        """
+        Make sure that the game state is compacted.
+        """
+
+        self.run_command('start')
+        self.get_messages()
+        self.run_command('action', action='test_update_action')
+        self.get_messages()
+        self.run_command('game_state')
+        response, = self.get_messages()
+        state = self.expand(response['game_state'])
+        self.assertIn('bar', [obj.get('foo') for obj in state])
+        self.assertIn('Player', [obj['type'] for obj in state])
+
+    def test_quit(self):
+        """
+        Make sure that the table goes away with the room.
+        """
+
+        self.run_command('quit')
+        self.assertEqual(self.factory.symbol_tables, {})
+
+
+class DeckrServerFlowControlTestCase(DeckrServerTestCase):
+
+    """
+    Test how the server deals with clients that don't keep up.
+    """
+
+    def setUp(self):
+        super(DeckrServerFlowControlTestCase, self).setUp()
+        self.factory.high_water_mark = 10
+        self.run_command('create', game_type_id=self.simple_game_id)
+        game_id = self.get_response('create_response')['game_id']
+        self.run_command('join', game_id=game_id, player_id=None)
+        self.get_response('join_response')
+        self.run_command('start')
+        self.transport.clear()
+
+    def test_producer(self):
+        """
+        Make sure that we're registered as a producer, and stop reading when
+        the transport is full.
+        """
+
+        self.assertIs(self.transport.producer, self.protocol)
+        self.assertTrue(self.transport.streaming)
+        self.protocol.pauseProducing()
+        self.assertEqual(self.transport.producerState, 'paused')
+        self.protocol.resumeProducing()
+        self.assertEqual(self.transport.producerState, 'producing')
+        self.assertEqual(self.transport.value(), '')
+
+    def test_conflate(self):
+        """
+        Make sure that updates stop once the high water mark is passed, and
+        that we get the whole game state once we catch up.
+        """
+
+        self.protocol.pauseProducing()
+        self.run_command('action', action='test_update_action')
+        self.get_response('update')
+        self.run_command('action', action='test_multiple_update_action')
+        self.run_command('action', action='test_update_action')
+        self.assertEqual(self.transport.value(), '')
+        self.assertTrue(self.protocol.stale)
+
+        self.protocol.resumeProducing()
+        response = self.get_response('game_state_response')
+        self.assertEqual(response['sequence'], 4)
+        self.assertFalse(self.protocol.stale)
+        self.run_command('action', action='test_update_action')
+        self.get_response('update')
+
+    def test_disconnect(self):
+        """
+        Make sure that slow clients can be disconnected instead.
+        """
+
+        self.factory.overflow_policy = 'disconnect'
+        self.protocol.pauseProducing()
+        self.run_command('action', action='test_update_action')
+        self.get_response('update')
+        self.assertFalse(self.transport.disconnecting)
+        self.run_command('action', action='test_update_action')
+        self.assertTrue(self.transport.disconnecting)
+
+
+class DeckrServerHibernationTestCase(DeckrServerTestCase):
+
+    """
+    Test that idle games are hibernated, and come back when they're joined.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        super(DeckrServerHibernationTestCase, self).setUp()
+        self.writer_calls = WriterCalls()
+        self.game_master.store.call_from_thread = self.writer_calls
+
+    def tearDown(self):
+        self.game_master.store.close()
+        shutil.rmtree(self.directory)
+
+    def config(self):
+        """
+        Only keep a single game in memory.
+        """
+
+        return {'games': [SIMPLE_GAME],
+                'hibernation': {'directory': self.directory,
+                                'max_games': 1}}
+
+    def test_hibernation(self):
+        """
+        Create two games, play in the hibernated one and make sure the other
+        is hibernated (but not the one we're in).
+        """
+
+        self.run_command('create', game_type_id=self.simple_game_id)
+        first = self.get_response('create_response')['game_id']
+        self.run_command('create', game_type_id=self.simple_game_id)
+        second = self.get_response('create_response')['game_id']
+        self.writer_calls.run(self.game_master.store)
+        self.assertEqual(self.game_master.snapshots.keys(), [first])
+
+        self.run_command('join', game_id=first, player_id=None)
+        self.get_response('join_response')
+        self.writer_calls.run(self.game_master.store)
+        self.assertEqual(self.game_master.games.keys(), [first])
+        self.run_command('start')
+        self.run_command('action', action='test_update_action')
+        self.transport.clear()
+
+        self.run_command('create', game_type_id=self.simple_game_id)
+        self.get_response('create_response')
+        self.writer_calls.run(self.game_master.store)
+        self.assertIn(first, self.game_master.games)
+        self.assertIn(second, self.game_master.snapshots)
+        self.assertEqual(
+            self.game_master.hibernator.stats['rehydrated'], 1)
+
+    def test_check_hibernation(self):
+        """
+        Make sure idle games are hibernated by the periodic check, not just
+        when another game is used.
+        """
+
+        self.run_command('create', game_type_id=self.simple_game_id)
+        game_id = self.get_response('create_response')['game_id']
+        self.game_master.hibernator.idle_timeout = 0
+        self.factory.check_hibernation()
+        self.writer_calls.run(self.game_master.store)
+        self.assertEqual(self.game_master.snapshots.keys(), [game_id])
 
 
 class DeckrServerGameManagmentTestCase(DeckrServerTestCase):
@@ -273,6 +967,13 @@ class DeckrServerGameManagmentTestCase(DeckrServerTestCase):
         self.run_command('create')
         self.assert_produces_error("Missing required argument: game_type_id")
 
+        # Game classes are only loaded when the first game is created.
+        broken = self.game_master.register(SIMPLE_GAME)
+        self.game_master.game_types[broken].config['game_class'] = 'Missing'
+        self.run_command('create', game_type_id=broken)
+        self.assertTrue(self.get_response('error')['message'].startswith(
+            "Could not load Simple Game"))
+
     def test_destroy(self):
         """
         Test the destroy command. This can be run at any time and requires
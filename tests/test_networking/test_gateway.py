@@ -0,0 +1,298 @@
+"""
+Tests around the deckr gateway.
+"""
+
+import json
+import os
+from unittest import TestCase
+
+from twisted.test import proto_helpers
+
+from deckr.networking.gateway import (AUTH, GAME_ID_BITS, BackendFactory,
+                                      BackendLink, GatewayFactory, HashRing,
+                                      link_digest)
+from deckr.networking.sharding import LINK_HEADER, MESSAGE, REGISTER
+from deckr.networking.wire import LengthPrefixedFraming
+from tests.settings import BAD_GAME, ROOT_DIRECTORY, SIMPLE_GAME
+from tests.test_networking.test_sharding import (FrontTestMixin,
+                                                 LoopbackTransport)
+
+BACKEND_CONFIG = {'games': [SIMPLE_GAME], 'secret_key': 'link secret',
+                  'games_root': os.path.join(ROOT_DIRECTORY, 'games')}
+
+
+class FixedRandom(object):
+
+    """
+    Hands out the given random bits, in order.
+    """
+
+    def __init__(self, bits):
+        self.bits = list(bits)
+
+    def getrandbits(self, _):
+        """
+        Get the next bits.
+        """
+
+        return self.bits.pop(0)
+
+
+class HashRingTestCase(TestCase):
+
+    """
+    Test the consistent hash ring.
+    """
+
+    def test_get_node(self):
+        """
+        Make sure that keys are spread over every node, the same way every
+        time.
+        """
+
+        ring = HashRing(['a', 'b', 'c'])
+        owners = [ring.get_node(key) for key in range(3000)]
+        for node in 'abc':
+            self.assertGreater(owners.count(node), 600)
+        self.assertEqual(owners, [HashRing(['c', 'b', 'a']).get_node(key)
+                                  for key in range(3000)])
+
+    def test_add_node(self):
+        """
+        Make sure that adding a node only moves keys to that node.
+        """
+
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+        moved = [key for key in range(3000)
+                 if before.get_node(key) != after.get_node(key)]
+        self.assertLess(len(moved), 1200)
+        for key in moved:
+            self.assertEqual(after.get_node(key), 'd')
+
+
+class GatewayTestCase(FrontTestMixin, TestCase):
+
+    """
+    Builds a gateway with two backends, each with a pool of two links, all
+    connected in memory.
+    """
+
+    def setUp(self):
+        self.factory = GatewayFactory({'games': [SIMPLE_GAME],
+                                       'secret_key': 'link secret',
+                                       'backends': [['a:1', 'b:1']]})
+        self.backends = {}
+        for address in ['a:1', 'b:1']:
+            self.add_backend(address)
+        self.protocol, self.transport = self.connect()
+
+    def add_backend(self, address):
+        """
+        Start a backend and open its links.
+        """
+
+        backend = BackendFactory(BACKEND_CONFIG)
+        self.backends[address] = backend
+        pool = self.factory.pools[address]
+        for _ in range(2):
+            link = BackendLink(self.factory, pool)
+            worker = backend.buildProtocol(None)
+            link.makeConnection(LoopbackTransport(worker))
+            worker.makeConnection(LoopbackTransport(link))
+
+    def owner(self, game_id):
+        """
+        Get the backend that has a game.
+        """
+
+        owners = [backend for backend in self.backends.values()
+                  if game_id in backend.deckr_factory.game_master.games]
+        self.assertEqual(len(owners), 1)
+        return owners[0]
+
+    def test_create(self):
+        """
+        Make sure that games are created on the backend the ring picks, and
+        spread over every backend.
+        """
+
+        owners = set()
+        for _ in range(20):
+            game_id = self.create_game()
+            self.assertEqual(game_id >> GAME_ID_BITS, 0)
+            address = self.factory.rings[0].get_node(game_id)
+            self.assertIs(self.owner(game_id), self.backends[address])
+            owners.add(address)
+        self.assertEqual(owners, set(['a:1', 'b:1']))
+
+    def test_play(self):
+        """
+        Make sure that clients on different pooled links end up in the same
+        room.
+        """
+
+        game_id = self.create_game()
+        other, other_transport = self.connect()
+        self.assertIsNot(
+            self.factory.shard(game_id, self.protocol.connection_id),
+            self.factory.shard(game_id, other.connection_id))
+        self.run_command('join', game_id=game_id, player_id=None)
+        self.get_response('join_response')
+        self.run_command('join', protocol=other, game_id=game_id,
+                         player_id=None)
+        self.get_response('join_response', other_transport)
+
+        self.start_and_act(other_transport)
+        self.assertEqual(self.get_response('update',
+                                           other_transport)['value'], 'bar')
+
+    def test_add_backends(self):
+        """
+        Make sure that new games use new backends, and old games stay where
+        they are.
+        """
+
+        old_game_ids = [self.create_game() for _ in range(10)]
+        owners = [self.owner(game_id) for game_id in old_game_ids]
+        self.factory.add_backends(['c:1'])
+        self.add_backend('c:1')
+
+        for game_id, owner in zip(old_game_ids, owners):
+            self.run_command('join', game_id=game_id)
+            self.get_response('join_response')
+            self.run_command('quit')
+            self.get_response('quit_response')
+            self.assertIs(self.owner(game_id), owner)
+
+        new_owners = set()
+        for _ in range(30):
+            game_id = self.create_game()
+            self.assertEqual(game_id >> GAME_ID_BITS, 1)
+            new_owners.add(self.owner(game_id))
+        self.assertIn(self.backends['c:1'], new_owners)
+
+        self.run_command('join', game_id=2 << GAME_ID_BITS)
+        self.assertEqual(self.get_response('error')['message'],
+                         "No game with id %d" % (2 << GAME_ID_BITS))
+
+    def test_backend_lost(self):
+        """
+        Make sure that clients hear about backends going away, and that
+        unavailable backends are reported.
+        """
+
+        game_id = self.create_game()
+        self.run_command('join', game_id=game_id)
+        self.get_response('join_response')
+        address = self.factory.rings[0].get_node(game_id)
+        for link in list(self.factory.pools[address].links):
+            link.connectionLost()
+        self.assertEqual(self.get_response('error')['message'],
+                         "Lost connection to the game server")
+        self.assertIsNone(self.protocol.shard)
+
+        self.run_command('join', game_id=game_id)
+        self.assertEqual(self.get_response('error')['message'],
+                         "Game server %s is unavailable" % address)
+
+    def test_register_game(self):
+        """
+        Make sure that every backend registers new games exactly once.
+        """
+
+        self.factory.secret_key = 'secret'
+        self.run_command('authenticate', secret_key='secret')
+        self.get_response('authenticated')
+        self.run_command('register_game', game_definition_path=SIMPLE_GAME)
+        self.get_response('register_game_response')
+        for backend in self.backends.values():
+            self.assertEqual(
+                len(backend.deckr_factory.game_master.game_types), 2)
+
+    def test_game_id_collision(self):
+        """
+        Make sure that the gateway picks another id if a backend already has
+        a game with the one it picked.
+        """
+
+        self.factory.random = FixedRandom([5, 5, 6])
+        self.assertEqual(self.create_game(), 5)
+        self.assertEqual(self.create_game(), 6)
+        self.owner(5)
+        self.owner(6)
+
+
+class BackendTestCase(TestCase):
+
+    """
+    Test the backend end of gateway links.
+    """
+
+    def setUp(self):
+        self.factory = BackendFactory(BACKEND_CONFIG)
+        self.worker = self.factory.buildProtocol(None)
+        self.transport = proto_helpers.StringTransport()
+        self.worker.makeConnection(self.transport)
+        self.game_master = self.factory.deckr_factory.game_master
+
+    def send_frame(self, kind, data):
+        """
+        Send the backend a frame.
+        """
+
+        self.worker.dataReceived(LengthPrefixedFraming.frame(
+            LINK_HEADER.pack(kind, 0, 0) + data))
+
+    def answer(self, secret_key):
+        """
+        Answer the backend's challenge with the given secret key.
+        """
+
+        self.transport.clear()
+        self.send_frame(AUTH, link_digest(secret_key, self.worker.challenge))
+
+    def test_config(self):
+        """
+        Make sure that backends and gateways need a secret key.
+        """
+
+        self.assertRaises(ValueError, BackendFactory, {'games': []})
+        self.assertRaises(ValueError, GatewayFactory,
+                          {'games': [], 'backends': []})
+
+    def test_handshake(self):
+        """
+        Make sure that nothing is processed before the gateway has answered
+        the challenge, and that links with the wrong key are dropped.
+        """
+
+        self.send_frame(MESSAGE, json.dumps({'message_type': 'list'}))
+        self.assertTrue(self.transport.disconnecting)
+        self.assertNotIn('list_response', self.transport.value())
+
+        self.setUp()
+        self.answer('wrong secret')
+        self.assertTrue(self.transport.disconnecting)
+        self.assertFalse(self.worker.authenticated)
+
+        self.setUp()
+        self.answer('link secret')
+        self.assertFalse(self.transport.disconnecting)
+        self.send_frame(MESSAGE, json.dumps({'message_type': 'list'}))
+        self.assertIn('list_response', self.transport.value())
+
+    def test_games_root(self):
+        """
+        Make sure that gateways can only register games under the games
+        root.
+        """
+
+        self.answer('link secret')
+        self.send_frame(REGISTER, BAD_GAME.replace('bad_game', '../../..'))
+        self.assertEqual(len(self.game_master.game_types), 1)
+        self.send_frame(REGISTER, SIMPLE_GAME)
+        self.assertEqual(len(self.game_master.game_types), 2)
+        self.worker.games_root = None
+        self.send_frame(REGISTER, SIMPLE_GAME)
+        self.assertEqual(len(self.game_master.game_types), 2)
@@ -0,0 +1,328 @@
+"""
+Tests around the sharded deckr server.
+"""
+
+import json
+from unittest import TestCase
+
+from twisted.internet.error import ProcessTerminated
+from twisted.python.failure import Failure
+from twisted.test import proto_helpers
+
+from deckr.networking.deckr_server import DeckrFactory
+from deckr.networking.sharding import (MESSAGE, REGISTER, FrontLink,
+                                       ShardedDeckrFactory, ShardWorker,
+                                       WorkerProcessProtocol)
+from deckr.networking.wire import (JsonEncoding, LengthPrefixedFraming,
+                                   MsgpackEncoding)
+from tests.settings import SIMPLE_GAME
+from tests.test_networking.test_deckr_server import read_messages
+
+
+class LoopbackTransport(object):
+
+    """
+    Delivers everything written to it straight to another protocol.
+    """
+
+    def __init__(self, peer):
+        self.peer = peer
+
+    def write(self, data):
+        """
+        Deliver data to the peer.
+        """
+
+        self.peer.dataReceived(data)
+
+
+class FrontTestMixin(object):
+
+    """
+    Helpers for talking to a front process (or gateway) as a client. Needs
+    factory, protocol and transport attributes.
+    """
+
+    def connect(self):
+        """
+        Connect a new client to the front process (or gateway).
+        """
+
+        protocol = self.factory.buildProtocol(('127.0.0.1', 0))
+        transport = proto_helpers.StringTransport()
+        protocol.makeConnection(transport)
+        return protocol, transport
+
+    def run_command(self, message_type, protocol=None, **kwargs):
+        """
+        Send a command to the front process (or gateway).
+        """
+
+        kwargs['message_type'] = message_type
+        if protocol is None:
+            protocol = self.protocol
+        protocol.lineReceived(json.dumps(kwargs))
+
+    def get_responses(self, transport=None):
+        """
+        Get every message that has been sent to a client.
+        """
+
+        if transport is None:
+            transport = self.transport
+        return read_messages(transport)
+
+    def get_response(self, expected_message_type, transport=None):
+        """
+        Get the only message that has been sent to a client.
+        """
+
+        response, = self.get_responses(transport)
+        self.assertEqual(response['message_type'], expected_message_type)
+        return response
+
+    def create_game(self):
+        """
+        Create a game and return its id.
+        """
+
+        self.run_command('create', game_type_id=0)
+        return self.get_response('create_response')['game_id']
+
+    def start_and_act(self, other_transport):
+        """
+        Start the game the client is in, which another client is also in,
+        then run an action and make sure the client got its update.
+        """
+
+        self.run_command('start')
+        self.get_response('start')
+        self.get_response('start', other_transport)
+        self.run_command('action', action='test_update_action')
+        self.assertEqual(self.get_response('update')['value'], 'bar')
+
+
+class ShardingTestCase(FrontTestMixin, TestCase):
+
+    """
+    Builds a front process with two workers, all linked up in memory.
+    """
+
+    def setUp(self):
+        self.factory = ShardedDeckrFactory({'games': [SIMPLE_GAME]})
+        self.workers = []
+        for _ in range(2):
+            link = FrontLink(self.factory)
+            worker = ShardWorker(DeckrFactory({'games': [SIMPLE_GAME]}))
+            link.makeConnection(LoopbackTransport(worker))
+            worker.makeConnection(LoopbackTransport(link))
+            self.factory.add_link(link)
+            self.workers.append(worker)
+        self.protocol, self.transport = self.connect()
+
+    def test_list(self):
+        """
+        Make sure that the front process can list games.
+        """
+
+        self.run_command('list')
+        self.assertEqual(self.get_response('list_response')['game_types'],
+                         [[0, 'Simple Game']])
+
+    def test_create(self):
+        """
+        Make sure that games are spread over the workers.
+        """
+
+        self.assertEqual([self.create_game() for _ in range(3)], [0, 1, 2])
+        self.assertEqual(sorted(self.workers[0].factory.game_master.games),
+                         [0, 2])
+        self.assertEqual(self.workers[1].factory.game_master.games.keys(),
+                         [1])
+
+        self.run_command('create', game_type_id=5)
+        self.assertEqual(self.get_response('error')['message'],
+                         "No game type with id 5")
+        self.run_command('destroy', game_id=1)
+        self.get_response('destroy_response')
+        self.assertEqual(self.workers[1].factory.game_master.games, {})
+
+    def test_play(self):
+        """
+        Make sure that game commands are forwarded to the worker that owns
+        the game, and updates make it to everyone in the room.
+        """
+
+        self.create_game()
+        game_id = self.create_game()
+        other, other_transport = self.connect()
+        self.run_command('join', game_id=game_id, player_id=None)
+        self.run_command('join', protocol=other, game_id=game_id,
+                         player_id=None, batch_updates=True)
+        self.assertEqual(self.get_response('join_response')['player_id'], 1)
+        self.get_response('join_response', other_transport)
+
+        self.start_and_act(other_transport)
+        updates = self.get_response('updates', other_transport)
+        self.assertEqual(len(updates['updates']), 1)
+        self.run_command('game_state')
+        self.get_response('game_state_response')
+        self.run_command('legal_actions')
+        self.assertIn({'action': 'test_action'},
+                      self.get_response('legal_actions_response')['actions'])
+
+        self.run_command('join', game_id=0)
+        self.assertEqual(self.get_response('error')['message'],
+                         "You are already connected to game")
+        self.run_command('quit')
+        self.get_response('quit_response')
+        self.assertIsNone(self.protocol.shard)
+
+    def test_not_joined(self):
+        """
+        Make sure that game commands need a game, and that a failed join
+        doesn't stick.
+        """
+
+        self.run_command('game_state')
+        self.assertEqual(self.get_response('error')['message'],
+                         "You aren't connected to a game")
+        self.run_command('join', game_id='foo')
+        self.assertEqual(self.get_response('error')['message'],
+                         "No game with id foo")
+        self.run_command('join', game_id=7)
+        self.assertEqual(self.get_response('error')['message'],
+                         "No game with id 7")
+        self.assertIsNone(self.protocol.shard)
+
+        game_id = self.create_game()
+        self.run_command('join', game_id=game_id)
+        self.get_response('join_response')
+
+    def test_encoding(self):
+        """
+        Make sure that responses from workers use the client's wire format,
+        even if it changed after the worker sent them.
+        """
+
+        self.run_command('set_encoding', encoding='msgpack')
+        self.get_response('set_encoding_response')
+        self.protocol.dataReceived(LengthPrefixedFraming.frame(
+            MsgpackEncoding.encode({'message_type': 'create',
+                                    'game_type_id': 0})))
+        _, message, _ = LengthPrefixedFraming.read_frame(
+            self.transport.value(), 0, 1000)
+        self.assertEqual(MsgpackEncoding.decode(message)['game_id'], 0)
+        self.transport.clear()
+
+        link = self.factory.links[0]
+        link.frameReceived(MESSAGE, self.protocol.connection_id,
+                           JsonEncoding, '{"message_type": "start"}')
+        _, message, _ = LengthPrefixedFraming.read_frame(
+            self.transport.value(), 0, 1000)
+        self.assertEqual(MsgpackEncoding.decode(message),
+                         {'message_type': 'start'})
+
+    def test_connection_lost(self):
+        """
+        Make sure that workers forget about clients that go away.
+        """
+
+        game_id = self.create_game()
+        self.run_command('join', game_id=game_id, player_id=None)
+        self.get_response('join_response')
+        worker = self.workers[game_id % 2]
+        self.assertEqual(len(worker.factory.game_rooms[game_id]), 1)
+        self.protocol.connectionLost()
+        self.assertEqual(worker.factory.game_rooms, {})
+        self.assertEqual(worker.connections, {})
+        self.assertEqual(self.factory.connections, {})
+
+    def test_register_game(self):
+        """
+        Make sure that every worker registers new games.
+        """
+
+        self.factory.secret_key = 'secret'
+        self.run_command('register_game', game_definition_path=SIMPLE_GAME)
+        self.assertEqual(self.get_response('error')['message'],
+                         "You aren't authenticated")
+        self.run_command('authenticate', secret_key='secret')
+        self.get_response('authenticated')
+        self.run_command('register_game', game_definition_path=SIMPLE_GAME)
+        self.get_response('register_game_response')
+        for worker in self.workers:
+            self.assertEqual(len(worker.factory.game_master.game_types), 2)
+
+    def test_register_bad_game(self):
+        """
+        Make sure that game definitions that can't be registered aren't
+        sent to the workers, and that workers survive one that fails anyway.
+        """
+
+        self.factory.secret_key = 'secret'
+        self.run_command('authenticate', secret_key='secret')
+        self.get_response('authenticated')
+        self.run_command('register_game', game_definition_path='/no/game')
+        self.assertIn("Could not register", self.get_response('error')[
+            'message'])
+        for worker in self.workers:
+            self.assertEqual(len(worker.factory.game_master.game_types), 1)
+
+        closed = []
+        self.workers[0].on_close = lambda: closed.append(True)
+        self.workers[0].frameReceived(REGISTER, 0, JsonEncoding, '/no/game')
+        self.assertEqual(closed, [])
+        game_id = self.create_game()
+        self.run_command('join', game_id=game_id)
+        self.get_response('join_response')
+
+    def test_worker_crashed(self):
+        """
+        Make sure that clients in a game on a worker that crashed are told
+        the game is gone.
+        """
+
+        game_id = self.create_game()
+        self.run_command('join', game_id=game_id)
+        self.get_response('join_response')
+        process = WorkerProcessProtocol(self.factory.links[game_id % 2])
+        process.processEnded(Failure(ProcessTerminated(1)))
+        self.assertEqual(self.get_response('error')['message'],
+                         "Lost connection to the game server")
+        self.assertIsNone(self.protocol.shard)
+
+    def test_reload_games(self):
+        """
+        Make sure that every worker reloads its games.
+        """
+
+        reloads = []
+        for worker in self.workers:
+            worker.factory.reload_game_types = (
+                lambda worker=worker: reloads.append(worker))
+        self.factory.secret_key = 'secret'
+        self.run_command('authenticate', secret_key='secret')
+        self.get_response('authenticated')
+        self.run_command('reload_games')
+        self.get_response('reload_games_response')
+        self.assertEqual(reloads, self.workers)
+
+    def test_slow_client(self):
+        """
+        Make sure that slow clients get disconnected.
+        """
+
+        self.factory.high_water_mark = 10
+        game_id = self.create_game()
+        self.run_command('join', game_id=game_id, player_id=None)
+        self.get_response('join_response')
+        self.run_command('start')
+        self.get_response('start')
+        self.protocol.pauseProducing()
+        # The first update goes over the high water mark, the second one
+        # finds the client still behind.
+        for _ in range(2):
+            self.assertFalse(self.transport.disconnecting)
+            self.run_command('action', action='test_update_action')
+        self.assertTrue(self.transport.disconnecting)
@@ -0,0 +1,85 @@
+"""
+Tests around the symbol tables.
+"""
+
+from unittest import TestCase
+
+from deckr.networking.symbols import BASE_SYMBOLS, SymbolTable
+
+
+class SymbolTableTestCase(TestCase):
+
+    """
+    Test the symbol table.
+    """
+
+    def setUp(self):
+        self.table = SymbolTable()
+
+    def test_code(self):
+        """
+        Make sure that codes are handed out in order and never change.
+        """
+
+        self.assertEqual(self.table.code('update_type'), 0)
+        self.assertEqual(self.table.code('foo'), len(BASE_SYMBOLS))
+        self.assertEqual(self.table.code('bar'), len(BASE_SYMBOLS) + 1)
+        self.assertEqual(self.table.code('foo'), len(BASE_SYMBOLS))
+        self.assertEqual(len(self.table), len(BASE_SYMBOLS) + 2)
+
+    def test_compact(self):
+        """
+        Make sure that keys and symbol values are replaced, but other values
+        aren't.
+        """
+
+        update = {'update_type': 'set', 'game_object': 3, 'field': 'zone',
+                  'value': 'zone'}
+        compact = self.table.compact(update)
+        self.assertEqual(compact, {0: 11, 2: 3, 4: 1, 5: 'zone'})
+        deal = {'update_type': 'deal', 'deals': [{'zone': 1,
+                                                  'game_objects': [2]}]}
+        self.assertEqual(self.table.compact(deal),
+                         {0: 13, 8: [{1: 1, 3: [2]}]})
+
+    def test_round_trip(self):
+        """
+        Make sure that expand undoes compact, even when the keys have been
+        turned into strings.
+        """
+
+        state = [{'type': 'Card', 'game_id': 1, 'face_up': False},
+                 {'type': 'Zone', 'game_id': 2, 'name': 'deck',
+                  'objects': [1]}]
+        compact = self.table.compact(state)
+        self.assertEqual(self.table.expand(compact), state)
+        stringified = [{str(key): value for key, value in obj.items()}
+                       for obj in compact]
+        self.assertEqual(self.table.expand(stringified), state)
+
+    def test_literal_values(self):
+        """
+        Make sure that integers and lists under symbol keys survive a round
+        trip, rather than being taken for codes.
+        """
+
+        updates = [{'update_type': 'set', 'field': 4, 'value': 1},
+                   {'update_type': 'set', 'field': True, 'value': 1},
+                   {'type': [3, 'zone'], 'game_id': 1}]
+        compact = self.table.compact(updates)
+        self.assertEqual(compact[0][4], [4])
+        self.assertEqual(self.table.expand(compact), updates)
+
+    def test_reset(self):
+        """
+        Make sure that the table only starts over once it's full.
+        """
+
+        self.table.max_symbols = len(BASE_SYMBOLS) + 1
+        self.table.code('foo')
+        self.assertFalse(self.table.reset_if_full())
+        self.table.code('bar')
+        self.assertTrue(self.table.reset_if_full())
+        self.assertEqual(self.table.symbols, list(BASE_SYMBOLS))
+        self.assertEqual(self.table.generation, 1)
+        self.assertEqual(self.table.code('bar'), len(BASE_SYMBOLS))
@@ -0,0 +1,187 @@
+"""
+Tests around the deckr wire formats.
+"""
+
+from unittest import TestCase
+
+from deckr.networking import wire
+from deckr.networking.wire import (COMPRESSED, JsonEncoding,
+                                   LengthPrefixedFraming, LineFraming,
+                                   MsgpackEncoding, WireFormat,
+                                   ZlibCompression)
+
+
+class MsgpackEncodingTestCase(TestCase):
+
+    """
+    Test the MessagePack encoding. These tests use the pure python
+    implementation, even if the msgpack package is installed.
+    """
+
+    def setUp(self):
+        self.msgpack = wire.msgpack
+        wire.msgpack = None
+
+    def tearDown(self):
+        wire.msgpack = self.msgpack
+
+    def test_compatible(self):
+        """
+        Make sure the pure python implementation matches the msgpack package
+        (if it's installed).
+        """
+
+        if self.msgpack is None:
+            return
+        value = {u'a': [1, -1, 1000, -1000, None, True, 1.5, u'x' * 40],
+                 u'b': {u'c': u'\u2603'}, u'd': range(20)}
+        encoded = MsgpackEncoding.encode(value)
+        self.assertEqual(self.msgpack.unpackb(encoded, raw=False), value)
+        self.assertEqual(MsgpackEncoding.decode(self.msgpack.packb(value)),
+                         value)
+
+    def test_round_trip(self):
+        """
+        Make sure that everything deckr sends survives a round trip.
+        """
+
+        values = [None, True, False, 0, 1, 127, 128, 255, 256, 65536,
+                  2 ** 32, 2 ** 63, -1, -32, -33, -128, -129, -2 ** 31,
+                  -2 ** 63, 1.5, u'', u'foo', u'x' * 31, u'x' * 32,
+                  u'x' * 256, u'x' * 65536, u'\u2603', [], range(15),
+                  range(16), range(65536), {}, {u'a': 1},
+                  {unicode(i): i for i in range(16)},
+                  {u'message_type': u'updates',
+                   u'updates': [{u'update_type': u'set', u'value': None}]}]
+        for value in values:
+            self.assertEqual(
+                MsgpackEncoding.decode(MsgpackEncoding.encode(value)), value)
+        # Plain strings come back as unicode (like JSON)
+        self.assertEqual(MsgpackEncoding.decode(MsgpackEncoding.encode('a')),
+                         u'a')
+
+    def test_known_bytes(self):
+        """
+        Make sure that we produce standard MessagePack.
+        """
+
+        self.assertEqual(MsgpackEncoding.encode({'a': [1, -1, None]}),
+                         '\x81\xa1a\x93\x01\xff\xc0')
+        self.assertEqual(MsgpackEncoding.encode(1000), '\xcd\x03\xe8')
+
+    def test_malformed(self):
+        """
+        Make sure that malformed data raises a ValueError.
+        """
+
+        for data in ['', '\xc1', '\x92\x01', '\xdd\xff\xff\xff\xff',
+                     '\xa3ab', '\x01\x02', '\x81\x90\x01']:
+            self.assertRaises(ValueError, MsgpackEncoding.decode, data)
+
+    def test_encode_updates(self):
+        """
+        Make sure that building an updates message out of encoded updates
+        matches encoding it all at once.
+        """
+
+        updates = [{'update_type': 'set', 'value': i} for i in range(20)]
+        for encoding in (JsonEncoding, MsgpackEncoding):
+            encoded = encoding.encode_updates(
+                3, [encoding.encode(update) for update in updates])
+            self.assertEqual(encoding.decode(encoded),
+                             {'message_type': 'updates', 'sequence': 3,
+                              'updates': updates})
+
+
+class FramingTestCase(TestCase):
+
+    """
+    Test the framings.
+    """
+
+    def test_length_prefixed(self):
+        """
+        Make sure that we can read frames back out of a stream.
+        """
+
+        data = (LengthPrefixedFraming.frame('foo') +
+                LengthPrefixedFraming.frame('\r\n') +
+                LengthPrefixedFraming.frame('partial')[:-2])
+        flags, message, offset = LengthPrefixedFraming.read_frame(data, 0,
+                                                                  100)
+        self.assertEqual((flags, message), (0, 'foo'))
+        _, message, offset = LengthPrefixedFraming.read_frame(data, offset,
+                                                              100)
+        self.assertEqual(message, '\r\n')
+        self.assertEqual(LengthPrefixedFraming.read_frame(data, offset, 100),
+                         (None, None, offset))
+        self.assertRaises(ValueError, LengthPrefixedFraming.read_frame,
+                          data, 0, 2)
+
+    def test_wire_format(self):
+        """
+        Make sure that binary encodings can't be used with line framing.
+        """
+
+        self.assertRaises(ValueError, WireFormat, MsgpackEncoding,
+                          LineFraming)
+        wire_format = WireFormat(JsonEncoding, LengthPrefixedFraming)
+        self.assertEqual(wire_format.encode_message({}),
+                         '\x00\x00\x00\x02\x00{}')
+
+
+class ZlibCompressionTestCase(TestCase):
+
+    """
+    Test the zlib compression.
+    """
+
+    def test_threshold(self):
+        """
+        Make sure that short messages aren't compressed.
+        """
+
+        compression = ZlibCompression(threshold=10)
+        self.assertEqual(compression.compress('short'), (0, 'short'))
+        flags, _ = compression.compress('x' * 10)
+        self.assertEqual(flags, COMPRESSED)
+
+    def test_shared_context(self):
+        """
+        Make sure that messages share a compression stream, so repeating a
+        message is much cheaper the second time around.
+        """
+
+        sender = ZlibCompression(threshold=0)
+        receiver = ZlibCompression(threshold=0)
+        message = JsonEncoding.encode(
+            {'game_state': [{'type': 'Card', 'game_id': i, 'face_up': False}
+                            for i in range(10)]})
+        _, first = sender.compress(message)
+        _, second = sender.compress(message)
+        self.assertLess(len(second), len(first) / 2)
+        self.assertEqual(receiver.decompress(first, 1000), message)
+        self.assertEqual(receiver.decompress(second, 1000), message)
+
+    def test_malformed(self):
+        """
+        Make sure that garbage and messages that are too long raise a
+        ValueError.
+        """
+
+        self.assertRaises(ValueError, ZlibCompression().decompress,
+                          'garbage', 1000)
+        _, data = ZlibCompression(threshold=0).compress('x' * 1000)
+        self.assertRaises(ValueError, ZlibCompression().decompress, data, 100)
+
+    def test_wire_format(self):
+        """
+        Make sure that the flags byte is set on compressed frames.
+        """
+
+        wire_format = WireFormat(JsonEncoding, LengthPrefixedFraming)
+        compression = ZlibCompression(threshold=0)
+        frame = wire_format.encode_message({}, compression)
+        flags, data, _ = LengthPrefixedFraming.read_frame(frame, 0, 100)
+        self.assertEqual(flags, COMPRESSED)
+        self.assertEqual(ZlibCompression().decompress(data, 100), '{}')